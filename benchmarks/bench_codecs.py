@@ -0,0 +1,59 @@
+"""
+Measure the dump and load time and the file size of a track store with
+each available codec, plain and gzip compressed.
+
+Usage: python benchmarks/bench_codecs.py [count]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from pytuber.codecs import codecs
+from pytuber.storage import GzipBackend, JsonBackend
+
+
+def measure(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(count):
+    data = dict(
+        version="20.1",
+        track={
+            "{:07x}".format(i): dict(
+                artist="artist {}".format(i),
+                name="name {}".format(i),
+                id="{:07x}".format(i),
+                youtube_id=None if i % 2 else "{:011x}".format(i),
+            )
+            for i in range(count)
+        },
+    )
+
+    print("{:<16} {:>8} {:>8} {:>10}".format("codec", "dump", "load", "size"))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "storage.db")
+        for backend_class in (JsonBackend, GzipBackend):
+            for codec in codecs.values():
+                if not codec.available:
+                    continue
+
+                backend = backend_class(path)
+                backend.codec = codec
+                dump = measure(lambda: backend.persist(data, dict()))
+                load = measure(backend.load)
+                print(
+                    "{:<16} {:>7.2f}s {:>7.2f}s {:>8.1f}MB".format(
+                        "{}+{}".format(backend.name, codec.name),
+                        dump,
+                        load,
+                        os.path.getsize(path) / 1024 / 1024,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
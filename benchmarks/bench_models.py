@@ -0,0 +1,53 @@
+"""
+Measure the per object memory and the throughput of the track model.
+
+Usage: python benchmarks/bench_models.py [count]
+"""
+import sys
+import time
+import tracemalloc
+
+import attr
+
+from pytuber.core.models import Track, TrackManager
+from pytuber.storage import Registry
+
+
+def measure(title, func, count):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<24} {:>8.2f}s {:>12,.0f}/s".format(title, elapsed, count / elapsed)
+    )
+    return result
+
+
+def main(count):
+    rows = [
+        dict(
+            artist="artist {}".format(i),
+            name="name {}".format(i),
+            id="{:07x}".format(i),
+            youtube_id=None,
+        )
+        for i in range(count)
+    ]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracks = measure("structure", lambda: [Track(**r) for r in rows], count)
+    size = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+
+    measure("asdict", lambda: [t.asdict() for t in tracks], count)
+    measure("attr.asdict", lambda: [attr.asdict(t) for t in tracks], count)
+
+    Registry()[TrackManager.namespace] = {r["id"]: r for r in rows}
+    measure("TrackManager.find", TrackManager.find, count)
+
+    print("{:<24} {:>8.0f} bytes".format("memory per track", size))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
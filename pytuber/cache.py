@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import suppress
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+NOTHING = object()
+
+
+class Cache:
+    """
+    Two tier store for cached api payloads, kept apart from the user data.
+
+    The memory tier holds the entries used by the current process, the disk
+    tier stores one json file per key in the cache directory which are read
+    lazily on first access. Each disk file's modification time is the entry
+    expiry and its access time the last time it was used, so eviction only
+    needs to stat the directory, once the process has written new entries.
+    """
+
+    directory: Optional[str] = None
+    memory: Dict[str, Tuple] = {}
+    max_entries = 1000
+    max_bytes = 10 * 1024 * 1024
+    written = 0
+
+    @classmethod
+    def configure(
+        cls,
+        directory: Optional[str],
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        Set the disk tier directory and budgets and reset the memory tier.
+
+        :param str directory: The cache directory, None for memory only
+        :param int max_entries: The disk entries budget
+        :param int max_bytes: The disk size budget
+        """
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if max_entries is not None:
+            cls.max_entries = max_entries
+        if max_bytes is not None:
+            cls.max_bytes = max_bytes
+        cls.directory = directory
+        cls.memory = {}
+        cls.written = 0
+
+    @classmethod
+    def fetch(
+        cls, key: str, func: Callable, ttl: timedelta, refresh: bool = False
+    ):
+        """
+        Return the cached value of the key or store the result of the given
+        function for the ttl duration.
+        """
+        value = NOTHING if refresh else cls.get(key, NOTHING)
+        if value is NOTHING:
+            value = func()
+            cls.set(key, value, time.time() + ttl.total_seconds())
+        return value
+
+    @classmethod
+    def get(cls, key: str, default=None):
+        now = time.time()
+        entry = cls.memory.get(key) or cls.read(key)
+        if entry is None or entry[1] < now:
+            cls.memory.pop(key, None)
+            return default
+
+        cls.memory[key] = entry
+        return entry[0]
+
+    @classmethod
+    def set(cls, key: str, value, expiry: float):
+        """
+        Store the value of the key in both tiers until the given expiry
+        timestamp.
+        """
+        cls.memory[key] = (value, expiry)
+        if cls.directory is None:
+            return
+
+        path = cls.filename(key)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump([key, value], fp)
+        os.utime(tmp, (time.time(), expiry))
+        os.replace(tmp, path)
+        cls.written += 1
+
+    @classmethod
+    def persist(cls) -> int:
+        """
+        Evict the disk entries if the process has written any since the last
+        eviction.
+
+        :return: The number of removed entries
+        """
+        if not cls.written:
+            return 0
+        return cls.evict()
+
+    @classmethod
+    def remove(cls, key: str):
+        cls.memory.pop(key, None)
+        if cls.directory is not None:
+            with suppress(FileNotFoundError):
+                os.remove(cls.filename(key))
+
+    @classmethod
+    def clear(cls):
+        """Drop every cached entry from both tiers."""
+        cls.memory = {}
+        for path, _ in cls.files():
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+    @classmethod
+    def read(cls, key: str) -> Optional[Tuple]:
+        if cls.directory is None:
+            return None
+
+        path = cls.filename(key)
+        try:
+            with open(path, "r") as fp:
+                stored, value = json.load(fp)
+            expiry = os.stat(path).st_mtime
+            os.utime(path, (time.time(), expiry))
+        except (OSError, ValueError):
+            return None
+
+        return (value, expiry) if stored == key else None
+
+    @classmethod
+    def evict(cls) -> int:
+        """
+        Remove the expired disk entries and the least recently used ones
+        that exceed the entries or size budget.
+
+        :return: The number of removed entries
+        """
+        now = time.time()
+        removed = 0
+        entries = []
+        cls.written = 0
+        for path, stat in cls.files():
+            if stat.st_mtime < now:
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+                removed += 1
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        count = len(entries)
+        size = sum(entry[1] for entry in entries)
+        for _, length, path in sorted(entries):
+            if count <= cls.max_entries and size <= cls.max_bytes:
+                break
+
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            removed += 1
+            count -= 1
+            size -= length
+
+        return removed
+
+    @classmethod
+    def files(cls) -> List[Tuple[str, os.stat_result]]:
+        if cls.directory is None or not os.path.isdir(cls.directory):
+            return []
+
+        return [
+            (entry.path, entry.stat())
+            for entry in os.scandir(cls.directory)
+            if entry.name.endswith(".json")
+        ]
+
+    @classmethod
+    def filename(cls, key: str) -> str:
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(cls.directory, digest + ".json")
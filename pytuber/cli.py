@@ -3,10 +3,12 @@ import os
 import click
 import click_completion
 
+from pytuber.cache import Cache
 from pytuber.core import commands as core
+from pytuber.core.models import TrackManager
 from pytuber.lastfm import commands as lastfm
-from pytuber.storage import Registry
-from pytuber.utils import init_registry
+from pytuber.storage import Checkpointer, Registry
+from pytuber.utils import cache_path, init_registry, storage_path
 from pytuber.version import version
 
 click_completion.init(complete_options=True)
@@ -14,17 +16,74 @@ click_completion.init(complete_options=True)
 
 @click.group()
 @click.version_option(version=version)
+@click.option(
+    "--auto-gc",
+    is_flag=True,
+    envvar="PYTUBER_AUTO_GC",
+    help="Remove orphan tracks after the command",
+)
+@click.option(
+    "--checkpoint",
+    type=click.FloatRange(min=0),
+    default=60,
+    show_default=True,
+    envvar="PYTUBER_CHECKPOINT",
+    help="Seconds between storage checkpoints, 0 to disable",
+)
+@click.option(
+    "--cache-entries",
+    type=click.IntRange(min=0),
+    default=Cache.max_entries,
+    show_default=True,
+    envvar="PYTUBER_CACHE_ENTRIES",
+    help="Maximum number of cached api responses",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    default=Cache.max_bytes // 1024 // 1024,
+    show_default=True,
+    envvar="PYTUBER_CACHE_SIZE",
+    help="Maximum megabytes of cached api responses",
+)
 @click.pass_context
-def cli(ctx: click.Context):
+def cli(
+    ctx: click.Context,
+    auto_gc: bool = False,
+    checkpoint: float = 60,
+    cache_entries: int = 1000,
+    cache_size: int = 10,
+):
     """Create and upload music playlists to youtube."""
     appdir = click.get_app_dir("pytuber", False)
     if not os.path.exists(appdir):
         print("Application Directory not found! Creating one at", appdir)
         os.makedirs(appdir)
-    cfg = os.path.join(appdir, "storage.db")
+    cfg = storage_path()
+    Cache.configure(
+        cache_path(),
+        max_entries=cache_entries,
+        max_bytes=cache_size * 1024 * 1024,
+    )
     init_registry(cfg, version)
-
-    ctx.call_on_close(lambda: Registry.persist(cfg))
+    checkpointer = Checkpointer(cfg, interval=checkpoint)
+    if checkpoint:
+        checkpointer.start()
+
+    def close():
+        checkpointer.stop()
+        if checkpointer.error:
+            click.secho(
+                "Storage checkpoint failed: {}".format(checkpointer.error),
+                fg="red",
+                err=True,
+            )
+        if auto_gc:
+            TrackManager.remove_orphans()
+        Registry.persist(cfg)
+        Cache.persist()
+
+    ctx.call_on_close(close)
 
 
 cli.add_command(core.list)
@@ -32,6 +91,7 @@ cli.add_command(core.show)
 cli.add_command(core.remove)
 cli.add_command(core.clean)
 cli.add_command(core.quota)
+cli.add_command(core.storage)
 
 
 @cli.group()
@@ -0,0 +1,120 @@
+import io
+import json
+from typing import IO, Dict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+magic = b"#codec:"
+
+
+class Codec:
+    """
+    Serialize the registry to and from a binary stream.
+
+    Storage files written with any codec other than json start with a
+    ``#codec:<name>`` header line, so they are read with the same codec.
+    """
+
+    name: str
+    available = True
+    fallback: str = ""
+
+    def dump(self, data: Dict, fp: IO[bytes]):
+        raise NotImplementedError
+
+    def load(self, fp: IO[bytes]) -> Dict:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def dump(self, data: Dict, fp: IO[bytes]):
+        writer = io.TextIOWrapper(fp, encoding="utf-8")
+        json.dump(data, writer)
+        writer.flush()
+        writer.detach()
+
+    def load(self, fp: IO[bytes]) -> Dict:
+        return json.load(fp)
+
+
+class OrjsonCodec(Codec):
+    """
+    The json codec of the ``orjson`` package, its output is plain json so
+    the stdlib codec reads it if orjson is not installed.
+    """
+
+    name = "orjson"
+    available = orjson is not None
+    fallback = "json"
+
+    def dump(self, data: Dict, fp: IO[bytes]):
+        fp.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+
+    def load(self, fp: IO[bytes]) -> Dict:
+        return orjson.loads(fp.read())
+
+
+class MsgpackCodec(Codec):
+    """The binary codec of the ``msgpack`` package, streamed both ways."""
+
+    name = "msgpack"
+    available = msgpack is not None
+
+    def dump(self, data: Dict, fp: IO[bytes]):
+        msgpack.pack(data, fp, use_bin_type=True)
+
+    def load(self, fp: IO[bytes]) -> Dict:
+        unpacker = msgpack.Unpacker(fp, raw=False, max_buffer_size=0)
+        for data in unpacker:
+            return data
+        raise ValueError("Empty msgpack document")
+
+
+codecs: Dict[str, Codec] = {
+    codec.name: codec for codec in (JsonCodec(), OrjsonCodec(), MsgpackCodec())
+}
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Return the codec of the given name, or its fallback if the codec's
+    package is not installed.
+
+    :raise LookupError: If the codec is unknown or not available
+    """
+    codec = codecs.get(name)
+    if codec is None:
+        raise LookupError("Unknown codec: {}".format(name))
+    if not codec.available:
+        if not codec.fallback:
+            raise LookupError(
+                "Install the {} package to read the storage".format(name)
+            )
+        codec = codecs[codec.fallback]
+    return codec
+
+
+def read_header(fp: IO[bytes]) -> Codec:
+    """
+    Consume the codec header of the stream, if any, and return its codec.
+
+    :raise LookupError: If the codec is unknown or not available
+    """
+    if fp.peek(len(magic)).startswith(magic):
+        return get_codec(fp.readline()[len(magic) :].strip().decode())
+    return codecs["json"]
+
+
+def write_header(fp: IO[bytes], codec: Codec):
+    if codec.name != "json":
+        fp.write(magic + codec.name.encode() + b"\n")
@@ -8,6 +8,7 @@ from pytuber.core.commands.cmd_quota import quota
 from pytuber.core.commands.cmd_remove import remove
 from pytuber.core.commands.cmd_setup import setup
 from pytuber.core.commands.cmd_show import show
+from pytuber.core.commands.cmd_storage import storage
 
 __all__ = [
     "setup",
@@ -19,6 +20,7 @@ __all__ = [
     "autocomplete",
     "clean",
     "quota",
+    "storage",
     "add_from_editor",
     "add_from_file",
 ]
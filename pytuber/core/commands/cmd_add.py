@@ -196,10 +196,9 @@ def create_playlist(title, tracks, type, arguments):
             title=title.strip(),
             arguments=arguments,
             provider=Provider.user,
-            tracks=[
-                TrackManager.set(dict(artist=artist, name=name)).id
-                for artist, name in tracks
-            ],
+            tracks=TrackManager.set_many(
+                dict(artist=artist, name=name) for artist, name in tracks
+            ),
         )
     )
     click.secho("Added playlist: {}!".format(playlist.id))
@@ -9,29 +9,23 @@ from pytuber.utils import magenta
 def clean():
     """Cleanup orphan tracks and empty playlists."""
 
-    tracks = []
-    removed_playlists = 0
-    for playlist in PlaylistManager.find():
-
-        if len(playlist.tracks) == 0:
-            PlaylistManager.remove(playlist.id)
-            removed_playlists += 1
-        else:
-            tracks += playlist.tracks
+    empty = [
+        id
+        for id, in PlaylistManager.iter_find(
+            fields=("id",), tracks=lambda tracks: not tracks
+        )
+    ]
+    for id in empty:
+        PlaylistManager.remove(id)
 
-    tracks = list(set(tracks))
-    removed_tracks = 0
-    for track in TrackManager.find():
-        if track.id not in tracks:
-            TrackManager.remove(track.id)
-            removed_tracks += 1
+    removed_tracks = TrackManager.remove_orphans()
 
     click.secho("Cleanup removed:", bold=True)
     click.secho(
         tabulate(  # type: ignore
             [
                 (magenta("Tracks:"), removed_tracks),
-                (magenta("Playlists:"), removed_playlists),
+                (magenta("Playlists:"), len(empty)),
             ],
             tablefmt="plain",
             colalign=("right", "left"),
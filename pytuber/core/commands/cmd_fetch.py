@@ -1,6 +1,6 @@
 import click
 
-from pytuber.core.models import PlaylistManager, TrackManager
+from pytuber.core.models import PlaylistManager, Session, TrackManager
 from pytuber.core.services import YouService
 from pytuber.utils import magenta, spinner
 
@@ -34,17 +34,14 @@ def fetch_playlists():
         for playlist in playlists:
             if not PlaylistManager.exists(playlist):
                 items = YouService.get_playlist_items(playlist)
-                track_ids = [
-                    TrackManager.set(
-                        dict(
-                            artist=item.artist,
-                            name=item.name,
-                            youtube_id=item.video_id,
-                        )
-                    ).id
+                playlist.tracks = TrackManager.set_many(
+                    dict(
+                        artist=item.artist,
+                        name=item.name,
+                        youtube_id=item.video_id,
+                    )
                     for item in items
-                ]
-                playlist.tracks = track_ids
+                )
             PlaylistManager.set(playlist.asdict())
 
         total = len(playlists)
@@ -55,7 +52,7 @@ def fetch_playlists():
 def fetch_tracks():
     tracks = TrackManager.find(youtube_id=None)
     message = "Matching tracks to videos"
-    with spinner(message) as sp:
+    with spinner(message) as sp, Session.begin(limit=10):
         for track in tracks:
             sp.text = "{}: {} - {}".format(message, track.artist, track.name)
             youtube_id = YouService.search_track(track)
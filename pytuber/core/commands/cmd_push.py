@@ -43,7 +43,7 @@ def push_playlists():
 
 
 def push_tracks():
-    online_playlists = PlaylistManager.find(youtube_id=lambda x: x is not None)
+    online_playlists = PlaylistManager.find(youtube_id__isnull=False)
     click.secho("Syncing playlists", bold=True)
     for playlist in online_playlists:
         add = items = remove = []
@@ -51,13 +51,12 @@ def push_tracks():
             items = YouService.get_playlist_items(playlist)
             online = set([item.video_id for item in items])
             offline = set(
-                [
-                    track.youtube_id
-                    for track in TrackManager.find(
-                        youtube_id=lambda x: x is not None,
-                        id=lambda x: x in playlist.tracks,
-                    )
-                ]
+                youtube_id
+                for youtube_id, in TrackManager.iter_find(
+                    fields=("youtube_id",),
+                    youtube_id__isnull=False,
+                    id__in=playlist.tracks,
+                )
             )
 
             add = offline - online
@@ -0,0 +1,160 @@
+import os
+from typing import Optional
+
+import click
+from tabulate import tabulate
+
+from pytuber.codecs import codecs
+from pytuber.core.integrity import check as check_storage
+from pytuber.core.replication import apply_delta, export_delta
+from pytuber.core.vacuum import vacuum as vacuum_storage
+from pytuber.storage import Registry, backends, storage_files
+from pytuber.utils import magenta, storage_path
+
+
+@click.group()
+def storage():
+    """Manage the local storage."""
+
+
+@storage.command()
+@click.argument(
+    "backend", type=click.Choice([b.name for b in backends if b.available])
+)
+@click.option(
+    "--codec",
+    type=click.Choice([c.name for c in codecs.values() if c.available]),
+    help="The storage serializer, defaults to the current one",
+)
+def convert(backend: str, codec: Optional[str] = None):
+    """
+    Convert the storage to another backend.
+
+    The sqlite backend reads and writes only the records each command
+    touches, use it for large libraries. The gzip and zstd backends
+    compress the storage file. The orjson and msgpack codecs load and
+    dump faster than json, the sqlite backend always stores json.
+    """
+
+    Registry.convert(storage_path(), backend, codec)
+    click.secho("Storage converted to {}!".format(backend))
+
+
+@storage.command("export-delta")
+@click.option(
+    "--since",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="The last sequence number the other node applied",
+)
+@click.argument("output", type=click.File("w"), default="-")
+def export(since: int, output):
+    """
+    Export the playlists and tracks that changed since a sequence number.
+
+    The delta can be applied on another node with apply-delta.
+    """
+
+    sequence = export_delta(storage_path(), since, output)
+    click.secho("Exported changes up to: {}".format(sequence), err=True)
+
+
+@storage.command("apply-delta")
+@click.argument("input", type=click.File("r"), default="-")
+def apply(input):
+    """
+    Apply a delta exported from another node.
+
+    Empty youtube ids, tracks, synced and uploaded dates in the delta don't
+    overwrite the local values.
+    """
+
+    written, removed, sequence = apply_delta(input)
+    click.secho(
+        "Applied changes up to: {}, updated: {}, removed: {}".format(
+            sequence, written, removed
+        )
+    )
+
+
+@storage.command()
+@click.option("--repair", is_flag=True, help="Fix the problems found")
+def check(repair: bool = False):
+    """
+    Check the storage for invalid records and broken references.
+
+    The repair removes the invalid records and the references to missing
+    tracks, moves the tracks to the id derived from their artist and name
+    and rebuilds the membership index.
+    """
+
+    problems = check_storage(repair)
+    if not problems:
+        return click.secho("No problems found!")
+
+    click.secho(
+        tabulate(  # type: ignore
+            [(p.namespace, p.key, p.message) for p in problems],
+            headers=("Namespace", "Key", "Problem"),
+        )
+    )
+    if repair:
+        click.secho("Repaired {} problem(s)!".format(len(problems)))
+    else:
+        click.secho(
+            "Found {} problem(s), use --repair to fix them!".format(
+                len(problems)
+            )
+        )
+
+
+@storage.command()
+def vacuum():
+    """
+    Drop stale data and rewrite the storage.
+
+    Removes the expired cache entries, the empty playlists, the orphan
+    tracks, the quota usage of past days, the unused history entries, the
+    processed changes of the change log and the storage snapshots but the
+    newest one.
+    """
+
+    path = storage_path()
+    before = storage_size(path)
+    rows = [
+        (
+            magenta(old.namespace),
+            old.count,
+            new.count,
+            file_size(old.size),
+            file_size(new.size),
+        )
+        for old, new in vacuum_storage(path)
+    ]
+    click.secho(
+        tabulate(  # type: ignore
+            rows,
+            headers=("Namespace", "Records", "After", "Size", "After"),
+            colalign=("left", "right", "right", "right", "right"),
+        )
+    )
+    click.secho(
+        "Storage size: {} -> {}".format(
+            file_size(before), file_size(storage_size(path))
+        )
+    )
+
+
+def storage_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in storage_files(path))
+
+
+def file_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "GB"
+    return "{:.{}f}{}".format(size, 0 if unit == "B" else 1, unit)
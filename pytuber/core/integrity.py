@@ -0,0 +1,209 @@
+import json
+import os
+from contextlib import suppress
+from typing import Dict, List, Set
+
+import attr
+
+from pytuber.cache import Cache
+from pytuber.core.models import (
+    Membership,
+    PlaylistManager,
+    Track,
+    TrackManager,
+)
+from pytuber.core.services import YouService
+from pytuber.storage import Registry
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Problem:
+    namespace: str
+    key: str
+    message: str
+
+
+def check(repair: bool = False) -> List[Problem]:
+    """
+    Validate the registry and the cache directory and optionally repair the
+    problems, in a single transaction.
+
+    Every namespace is read once, the track ids are collected in a set that
+    the playlist references are checked against and the membership indexes
+    are compared with the ones the playlists imply.
+
+    :param bool repair: Fix the problems found
+    :return: The problems found
+    """
+    with Registry.transaction():
+        moved: Dict[str, str] = dict()
+        problems = check_tracks(moved, repair)
+        problems += check_playlists(moved, repair)
+        if not repair or not problems:
+            problems += check_membership()
+        if repair and problems:
+            Membership.rebuild()
+
+        problems += check_quota(repair)
+        problems += check_cache(repair)
+    return problems
+
+
+def check_tracks(moved: Dict[str, str], repair: bool) -> List[Problem]:
+    """
+    Find the invalid tracks and the ones whose id isn't derived from their
+    artist and name. The latter are moved to their derived id on repair,
+    merged with the track already stored there, if any.
+
+    :param dict moved: The old to derived ids map to populate
+    :param bool repair: Fix the problems found
+    """
+    problems = []
+    invalid = []
+    tracks = Registry.get(TrackManager.namespace, default={})
+    for key, row in tracks.items():
+        try:
+            expected = Track(artist=row["artist"], name=row["name"]).id
+        except (TypeError, KeyError):
+            problems.append(Problem("track", key, "Invalid track record"))
+            invalid.append(key)
+            continue
+
+        if row.get("id") != key or expected != key:
+            problems.append(
+                Problem("track", key, "Id doesn't match: {}".format(expected))
+            )
+            moved[key] = expected
+
+    if repair:
+        for key in invalid:
+            Registry.remove(TrackManager.namespace, key)
+        for key, expected in moved.items():
+            row = dict(Registry.get(TrackManager.namespace, key), id=expected)
+            stored = Registry.get(TrackManager.namespace, expected, default={})
+            if stored.get("youtube_id"):
+                row["youtube_id"] = stored["youtube_id"]
+
+            Registry.remove(TrackManager.namespace, key)
+            Registry.set(TrackManager.namespace, expected, row)
+
+    return problems
+
+
+def check_playlists(moved: Dict[str, str], repair: bool) -> List[Problem]:
+    """
+    Find the playlists that reference missing tracks, they are removed from
+    the playlists on repair and the moved tracks are replaced by their new
+    ids.
+
+    :param dict moved: The old to derived track ids map
+    :param bool repair: Fix the problems found
+    """
+    problems = []
+    ids: Set[str] = set(Registry.get(TrackManager.namespace, default={}))
+    if not repair:
+        ids.update(moved.values())
+
+    playlists = Registry.get(PlaylistManager.namespace, default={})
+    updates = dict()
+    invalid = []
+    for key, row in playlists.items():
+        if not isinstance(row, dict):
+            problems.append(
+                Problem("playlist", key, "Invalid playlist record")
+            )
+            invalid.append(key)
+            continue
+
+        tracks = row.get("tracks") or []
+        fixed = [moved.get(track, track) for track in tracks]
+        missing = [track for track in fixed if track not in ids]
+        if missing:
+            problems.append(
+                Problem(
+                    "playlist",
+                    key,
+                    "Missing tracks: {}".format(", ".join(missing)),
+                )
+            )
+        if fixed != tracks or missing:
+            fixed = [track for track in fixed if track in ids]
+            updates[key] = list(dict.fromkeys(fixed))
+
+    if repair:
+        for key in invalid:
+            Registry.remove(PlaylistManager.namespace, key)
+        for key, tracks in updates.items():
+            Registry.set(PlaylistManager.namespace, key, "tracks", tracks)
+
+    return problems
+
+
+def check_membership() -> List[Problem]:
+    """Compare the membership indexes with the playlist track lists."""
+    if not Registry.exists(Membership.namespace):
+        return []
+
+    index: Dict[str, Set[str]] = dict()
+    playlists = Registry.get(PlaylistManager.namespace, default={})
+    for key, row in playlists.items():
+        tracks = row.get("tracks") if isinstance(row, dict) else None
+        for track in tracks or []:
+            index.setdefault(track, set()).add(key)
+
+    stored = Registry.get(Membership.namespace)
+    tracks = Registry.get(TrackManager.namespace, default={})
+    orphans = Registry.get(Membership.orphan_namespace, default={})
+    stale = len(stored) != len(index) or any(
+        set(stored.get(track, [])) != keys for track, keys in index.items()
+    )
+    stale = stale or any((key in orphans) == (key in index) for key in tracks)
+    stale = stale or any(key not in tracks for key in orphans)
+    if stale:
+        return [Problem("membership", "-", "Index is out of date")]
+    return []
+
+
+def check_quota(repair: bool) -> List[Problem]:
+    """Find the youtube quota entries that aren't a number of units."""
+    key = YouService.quota_key
+    quota = Registry.get(key, default={})
+    if not isinstance(quota, dict):
+        if repair:
+            Registry.set(key, {})
+        return [Problem(key, "-", "Invalid quota record")]
+
+    invalid = [
+        date
+        for date, value in quota.items()
+        if not isinstance(value, int) or isinstance(value, bool)
+    ]
+    if repair:
+        for date in invalid:
+            Registry.remove(key, date)
+
+    return [Problem(key, date, "Invalid quota usage") for date in invalid]
+
+
+def check_cache(repair: bool) -> List[Problem]:
+    """
+    Find the cache files that can't be read or aren't stored under their
+    key's file name, they are removed on repair.
+    """
+    problems = []
+    for path, _ in Cache.files():
+        try:
+            with open(path, "r") as fp:
+                key, _ = json.load(fp)
+            valid = Cache.filename(key) == path
+        except (OSError, ValueError, TypeError):
+            valid = False
+
+        if not valid:
+            name = os.path.basename(path)
+            problems.append(Problem("cache", name, "Invalid cache entry"))
+            if repair:
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+
+    return problems
@@ -4,10 +4,21 @@ import enum
 import hashlib
 import json
 import re
-from typing import Dict, List, Type
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 
 import attr
 
+from pytuber.core import query
 from pytuber.exceptions import NotFound
 from pytuber.storage import Registry
 from pytuber.utils import timestamp
@@ -30,17 +41,54 @@ class PlaylistType(StrEnum):
 
 
 class Document:
-    def asdict(self):
-        return attr.asdict(self)
+    __slots__ = ()
 
+    def asdict(self) -> Dict:
+        cls = type(self)
+        try:
+            unstructure = unstructurers[cls]
+        except KeyError:
+            unstructure = unstructurers[cls] = unstructurer(cls)
+        return unstructure(self)
+
+
+unstructurers: Dict[Type, Callable[[Document], Dict]] = dict()
+
+
+def unstructurer(cls: Type) -> Callable[[Document], Dict]:
+    """
+    Compile the function that converts instances of the given attrs class
+    to dicts, a flat alternative to :func:`attr.asdict` that copies the
+    list and dict fields with a factory default.
+
+    :param type cls: The attrs model class
+    """
+    items = []
+    for field in attr.fields(cls):
+        value = "obj.{}".format(field.name)
+        if getattr(field.default, "factory", None) in (list, dict):
+            value = "copy({})".format(value)
+        items.append("{!r}: {}".format(field.name, value))
+
+    scope: Dict = dict(copy=copy)
+    source = "def unstructure(obj):\n    return {{{}}}\n".format(
+        ", ".join(items)
+    )
+    exec(source, scope)
+    return scope["unstructure"]
 
-@attr.s(auto_attribs=True)
+
+def copy(value):
+    return value.copy() if isinstance(value, (list, dict)) else value
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
 class Config(Document):
     provider: str = attr.ib(converter=str)
     data: dict = attr.ib(factory=dict)
 
 
-@attr.s
+@attr.s(slots=True)
 class Track(Document):
     artist: str = attr.ib()
     name: str = attr.ib()
@@ -58,7 +106,7 @@ class Track(Document):
             ).hexdigest()[:7]
 
 
-@attr.s
+@attr.s(slots=True)
 class Playlist(Document):
     title: str = attr.ib(converter=str)
     type: str = attr.ib(converter=str)
@@ -110,7 +158,7 @@ class Playlist(Document):
         )
 
 
-@attr.s(auto_attribs=True)
+@attr.s(auto_attribs=True, slots=True, frozen=True)
 class PlaylistItem(Document):
     id: str
     name: str
@@ -118,10 +166,102 @@ class PlaylistItem(Document):
     video_id: str
 
 
+class Index:
+    """
+    In memory hash index of a namespace's fields values to keys, in
+    insertion order.
+
+    The index is maintained by the manager writes and rebuilt when the
+    namespace generation shows it was modified by other means.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = tuple(fields)
+        self.generation = -1
+        self.rows: Dict[str, tuple] = dict()
+        self.values: Dict[str, Dict] = {field: dict() for field in self.fields}
+        self.notnull: Dict[str, Dict] = {
+            field: dict() for field in self.fields
+        }
+
+    def add(self, key: str, data: Dict):
+        values = tuple(data.get(field) for field in self.fields)
+        if self.rows.get(key) == values:
+            return
+
+        self.discard(key)
+        self.rows[key] = values
+        for field, value in zip(self.fields, values):
+            self.values[field].setdefault(value, dict())[key] = None
+            if value is not None:
+                self.notnull[field][key] = None
+
+    def discard(self, key: str):
+        values = self.rows.pop(key, None)
+        if values is None:
+            return
+
+        for field, value in zip(self.fields, values):
+            bucket = self.values[field][value]
+            bucket.pop(key)
+            if not bucket:
+                del self.values[field][value]
+            self.notnull[field].pop(key, None)
+
+    def lookup(self, field: str, value) -> Dict:
+        return self.values[field].get(query.normalize(value), dict())
+
+    def lookup_null(self, field: str, null: bool) -> Dict:
+        return self.lookup(field, None) if null else self.notnull[field]
+
+
 class Manager:
     namespace: str
     model: Type
     key: str
+    indexes: Tuple[str, ...] = ()
+
+    @classmethod
+    def index(cls) -> Index:
+        """Return the namespace index, rebuilt if it's out of date."""
+        with Registry.lock(cls.namespace):
+            index = cls.current_index()
+            if index is None:
+                index = Index(cls.indexes)
+                namespace = Registry.get(cls.namespace, default={})
+                for key, data in namespace.items():
+                    index.add(key, data)
+                index.generation = Registry.generation(cls.namespace)
+                Registry().indexes[cls.namespace] = index
+            return index
+
+    @classmethod
+    def current_index(cls) -> Optional[Index]:
+        index = Registry().indexes.get(cls.namespace)
+        if index and index.generation == Registry.generation(cls.namespace):
+            return index
+        return None
+
+    @classmethod
+    def write(cls, key: str, data: Dict):
+        cls.write_many({key: data})
+
+    @classmethod
+    def write_many(cls, rows: Dict[str, Dict]):
+        """
+        Store the given raw records by key and maintain the namespace index
+        once for the whole batch.
+
+        :param dict rows: The raw records by key
+        """
+        with Registry.lock(cls.namespace):
+            index = cls.current_index()
+            for key, data in rows.items():
+                Registry.set(cls.namespace, key, data)
+            if index:
+                for key, data in rows.items():
+                    index.add(key, data)
+                index.generation = Registry.generation(cls.namespace)
 
     @classmethod
     def keys(cls):
@@ -134,66 +274,353 @@ class Manager:
 
     @classmethod
     def get(cls, key, **kwargs):
+        session = Session.active()
+        if session and (cls.namespace, str(key)) in session.identity:
+            return session.identity[(cls.namespace, str(key))]
+
         with contextlib.suppress(KeyError):
             data = Registry.get(cls.namespace, str(key), **kwargs)
             with contextlib.suppress(TypeError):
-                return cls.model(**data)
+                return cls.build(data)
             return data
 
         raise NotFound(
             "No {} matched your argument: {}!".format(cls.namespace, key)
         )
 
+    @classmethod
+    def build(cls, data: Dict):
+        """
+        Return the model object of the raw record, the live one if the
+        record is already loaded in the current session.
+        """
+        session = Session.active()
+        if session is None:
+            return cls.model(**data)
+
+        ident = (cls.namespace, data.get(cls.key))
+        obj = session.identity.get(ident)
+        if obj is None:
+            obj = session.identity[ident] = cls.model(**data)
+        return obj
+
     @classmethod
     def set(cls, data: Dict):
+        Session.flush(cls)
         obj = cls.model(**data)
         key = getattr(obj, cls.key)
 
-        with contextlib.suppress(KeyError):
-            data = Registry.get(cls.namespace, key)
-            for field in attr.fields(cls.model):
-                if field.metadata.get("keep") and not getattr(obj, field.name):
-                    setattr(obj, field.name, data.get(field.name))
+        with Registry.lock(cls.namespace):
+            with contextlib.suppress(KeyError):
+                data = Registry.get(cls.namespace, key)
+                keep = {
+                    field.name: data.get(field.name)
+                    for field in attr.fields(cls.model)
+                    if field.metadata.get("keep")
+                    and not getattr(obj, field.name)
+                }
+                if keep:
+                    obj = attr.evolve(obj, **keep)
 
-        Registry.set(cls.namespace, key, obj.asdict())
+            cls.write(key, obj.asdict())
+        Session.forget(cls, [key])
         return obj
 
+    @classmethod
+    def set_many(cls, items: Iterable[Dict]) -> List[str]:
+        """
+        Bulk version of :meth:`set`, the records are normalized and merged
+        with the stored ones in a single pass and written as one batch.
+
+        :param items: The records data
+        :return: The keys of the records in the given order
+        """
+        Session.flush(cls)
+        keep = [
+            field.name
+            for field in attr.fields(cls.model)
+            if field.metadata.get("keep")
+        ]
+        with Registry.lock(cls.namespace):
+            namespace = Registry.get(cls.namespace, default={})
+            rows: Dict[str, Dict] = dict()
+            keys = []
+            for data in items:
+                row = cls.model(**data).asdict()
+                key = row[cls.key]
+                stored = rows.get(key) or namespace.get(key)
+                if stored:
+                    for name in keep:
+                        if not row[name]:
+                            row[name] = stored.get(name)
+
+                rows[key] = row
+                keys.append(key)
+
+            cls.write_many(rows)
+        Session.forget(cls, rows)
+        return keys
+
     @classmethod
     def update(cls, obj, data: Dict):
-        new = attr.evolve(obj, **data)
-        key = getattr(new, cls.key)
-        Registry.set(cls.namespace, key, new.asdict())
-        return new
+        return cls.update_many([(obj, data)])[0]
+
+    @classmethod
+    def update_many(cls, updates: Iterable[Tuple]) -> List:
+        """
+        Bulk version of :meth:`update`, inside a session the objects are
+        modified in place and written on commit.
+
+        :param updates: The ``(obj, data)`` pairs to apply
+        :return: The updated objects in the given order
+        """
+        session = Session.active()
+        if session is not None:
+            return [session.update(cls, obj, data) for obj, data in updates]
+
+        objs = [attr.evolve(obj, **data) for obj, data in updates]
+        cls.write_many({getattr(obj, cls.key): obj.asdict() for obj in objs})
+        return objs
 
     @classmethod
     def remove(cls, key):
+        Session.flush(cls)
+        Session.forget(cls, [key])
+        with Registry.lock(cls.namespace):
+            index = cls.current_index()
+            try:
+                Registry.remove(cls.namespace, key)
+            except KeyError:
+                raise NotFound(
+                    "No {} matched your argument: {}!".format(
+                        cls.namespace, key
+                    )
+                )
+
+            if index:
+                index.discard(key)
+                index.generation = Registry.generation(cls.namespace)
+
+    @classmethod
+    def find(cls, **kwargs) -> List:
+        """
+        Find the records that match all the given conditions, see
+        :class:`~pytuber.core.query.Condition` for the supported lookups.
+
+        Conditions on the key and on indexed fields are resolved with direct
+        lookups, the rest are compiled into a single predicate evaluated on
+        the remaining candidates.
+
+        :raise TypeError: On invalid conditions
+        """
+        return list(cls.iter_find(**kwargs))
+
+    @classmethod
+    def iter_find(
+        cls, fields: Optional[Tuple[str, ...]] = None, **kwargs
+    ) -> Iterator:
+        """
+        Lazy version of :meth:`find`, the namespace must not be modified
+        until the iteration is over.
+
+        :param tuple fields: Yield tuples of the raw values of these fields
+            instead of model objects
+        :raise TypeError: On invalid conditions or fields
+        """
+        rows = cls.iter_raw(kwargs)
+        if fields is None:
+            return (cls.build(raw) for raw in rows)
+
+        names = attr.fields_dict(cls.model)
+        for field in fields:
+            if field not in names:
+                raise TypeError(
+                    "Unknown {} field: {}".format(cls.model.__name__, field)
+                )
+        return (tuple(raw.get(field) for field in fields) for raw in rows)
+
+    @classmethod
+    def iter_raw(cls, kwargs: Dict) -> Iterator[Dict]:
+        keys, conditions = cls.lookup(query.parse(cls.model, kwargs))
+        rows = cls.candidates(keys)
+        if not conditions:
+            return iter(rows)
+
+        match = query.matcher(conditions)
+        return (raw for raw in rows if match(raw))
+
+    @classmethod
+    def candidates(cls, keys: Optional[List]) -> Iterable[Dict]:
+        namespace = Registry.get(cls.namespace, default={})
+        if keys is None:
+            return namespace.values()
+        return (namespace[key] for key in keys)
+
+    @classmethod
+    def count(cls, **kwargs) -> int:
+        """
+        Return the number of records that match all the given conditions.
+
+        :raise TypeError: On invalid conditions
+        """
+        keys, conditions = cls.lookup(query.parse(cls.model, kwargs))
+        if conditions:
+            match = query.matcher(conditions)
+            return sum(1 for raw in cls.candidates(keys) if match(raw))
+        if keys is None:
+            return len(Registry.get(cls.namespace, default={}))
+        return len(keys)
+
+    @classmethod
+    def first(cls, fields: Optional[Tuple[str, ...]] = None, **kwargs):
+        """
+        Return the first record that matches all the given conditions or
+        None.
+
+        :param tuple fields: Return a tuple of the raw values of these fields
+            instead of a model object
+        :raise TypeError: On invalid conditions or fields
+        """
+        return next(cls.iter_find(fields=fields, **kwargs), None)
+
+    @classmethod
+    def lookup(
+        cls, conditions: List[query.Condition]
+    ) -> Tuple[Optional[List], List[query.Condition]]:
+        """
+        Resolve the key and indexed conditions and return the matching keys,
+        or None if no condition could be resolved, and the remaining
+        conditions.
+
+        :param list conditions: The parsed find conditions
+        """
+        Session.flush(cls)
+        namespace = Registry.get(cls.namespace, default={})
+        matches: List = []
+        remaining: List[query.Condition] = []
+        for c in conditions:
+            if c.field == cls.key and c.op in ("eq", "in"):
+                values = c.value if c.op == "in" else [c.value]
+                matches.append(
+                    dict.fromkeys(v for v in values if v in namespace)
+                )
+            elif c.field in cls.indexes and c.op in ("eq", "isnull"):
+                index = cls.index()
+                if c.op == "eq":
+                    matches.append(index.lookup(c.field, c.value))
+                else:
+                    matches.append(index.lookup_null(c.field, c.value))
+            else:
+                remaining.append(c)
+
+        if not matches:
+            return None, remaining
+
+        first, *others = sorted(matches, key=len)
+        keys = [k for k in first if all(k in other for other in others)]
+        return keys, remaining
+
+
+class Session:
+    """
+    Write-back unit of work of the managers.
+
+    Sessions are bound to the thread that started them and keep one live
+    object per record, the objects updated through the managers are
+    modified in place and written to the registry in one batch per manager
+    when the session ends, also if it ends with an error so the work done so
+    far is kept. Pending changes of a manager are flushed before its queries
+    and direct writes and all of them every ``limit`` modified objects, if
+    set.
+
+    Usage: ``with Session.begin(): ...``
+    """
+
+    local = threading.local()
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.identity: Dict[Tuple[str, str], Document] = dict()
+        self.modified: Dict[Tuple[str, str], Tuple[Type, Document]] = dict()
+
+    @classmethod
+    def active(cls) -> Optional["Session"]:
+        """Return the session of the current thread, if any."""
+        return getattr(cls.local, "session", None)
+
+    @classmethod
+    @contextlib.contextmanager
+    def begin(cls, limit: Optional[int] = None):
+        """
+        Start a session or join the current one.
+
+        :param int limit: Commit every time this many objects are modified
+        """
+        current = cls.active()
+        if current is not None:
+            yield current
+            return
+
+        session = cls.local.session = cls(limit)
         try:
-            Registry.remove(cls.namespace, key)
-        except KeyError:
-            raise NotFound(
-                "No {} matched your argument: {}!".format(cls.namespace, key)
-            )
-
-    @classmethod
-    def find(cls, **kwargs):
-        def match(data, conditions):
-            with contextlib.suppress(Exception):
-                for k, v in conditions.items():
-                    value = data.get(k)
-                    if callable(v):
-                        assert v(value)
-                    elif v is None:
-                        assert value is None
-                    else:
-                        assert type(value)(v) == value
-                return True
-            return False
+            yield session
+        finally:
+            session.commit()
+            cls.local.session = None
 
-        return [
-            cls.model(**raw)
-            for raw in Registry.get(cls.namespace, default={}).values()
-            if match(raw, kwargs)
-        ]
+    @classmethod
+    def flush(cls, manager: Type[Manager]):
+        session = cls.active()
+        if session is not None:
+            session.commit(manager.namespace)
+
+    @classmethod
+    def forget(cls, manager: Type[Manager], keys: Iterable[str]):
+        """Drop the live objects of records written by other means."""
+        session = cls.active()
+        if session is not None:
+            for key in keys:
+                session.identity.pop((manager.namespace, key), None)
+
+    def update(self, manager: Type[Manager], obj: Document, data: Dict):
+        fields = attr.fields_dict(type(obj))
+        changes = dict()
+        for name, value in data.items():
+            if name not in fields:
+                raise TypeError(
+                    "Unknown {} field: {}".format(type(obj).__name__, name)
+                )
+            converter = fields[name].converter
+            changes[name] = converter(value) if converter else value
+
+        try:
+            for name, value in changes.items():
+                setattr(obj, name, value)
+        except attr.exceptions.FrozenInstanceError:
+            obj = attr.evolve(obj, **changes)
+
+        ident = (manager.namespace, getattr(obj, manager.key))
+        self.identity[ident] = obj
+        self.modified[ident] = (manager, obj)
+        if self.limit and len(self.modified) >= self.limit:
+            self.commit()
+        return obj
+
+    def commit(self, namespace: Optional[str] = None):
+        """
+        Write the modified objects of all or the given namespace to the
+        registry.
+
+        :param str namespace: Only commit the objects of this namespace
+        """
+        batches: Dict[Type[Manager], Dict[str, Dict]] = dict()
+        for ident, (manager, obj) in list(self.modified.items()):
+            if namespace is None or ident[0] == namespace:
+                del self.modified[ident]
+                batches.setdefault(manager, dict())[ident[1]] = obj.asdict()
+
+        for manager, rows in batches.items():
+            manager.write_many(rows)
 
 
 class ConfigManager(Manager):
@@ -206,27 +633,226 @@ class PlaylistManager(Manager):
     namespace = "playlist"
     key = "id"
     model = Playlist
+    indexes = ("youtube_id", "provider", "type")
 
     @classmethod
-    def update(cls, obj, data: Dict):
-        if len(data.get("tracks", [])) > 0:
-            data["synced"] = timestamp()
+    def update_many(cls, updates: Iterable[Tuple]) -> List:
+        updates = list(updates)
+        for _, data in updates:
+            if len(data.get("tracks", [])) > 0:
+                data["synced"] = timestamp()
+
+        return super().update_many(updates)
+
+    @classmethod
+    def write_many(cls, rows: Dict[str, Dict]):
+        with Registry.lock(cls.namespace):
+            tracks = {
+                key: Registry.get(cls.namespace, key, "tracks", default=[])
+                for key in rows
+            }
+            super().write_many(rows)
+            for key, data in rows.items():
+                Membership.update(key, tracks[key], data.get("tracks", []))
 
-        return super().update(obj, data)
+    @classmethod
+    def remove(cls, key):
+        with Registry.lock(cls.namespace):
+            tracks = Registry.get(cls.namespace, key, "tracks", default=[])
+            super().remove(key)
+            Membership.update(key, tracks, [])
 
 
 class TrackManager(Manager):
     namespace = "track"
     key = "id"
     model = Track
+    indexes = ("youtube_id",)
 
     @classmethod
     def find_youtube_id(cls, id: str):
         return Registry.get(cls.namespace, id, "youtube_id", default=None)
 
+    @classmethod
+    def write_many(cls, rows: Dict[str, Dict]):
+        with Registry.lock(cls.namespace):
+            new = [
+                key for key in rows if not Registry.exists(cls.namespace, key)
+            ]
+            super().write_many(rows)
+            for key in new:
+                Membership.added(key)
+
+    @classmethod
+    def remove(cls, key):
+        with Registry.lock(cls.namespace):
+            super().remove(key)
+            Membership.removed(key)
+
+    @classmethod
+    def remove_orphans(cls) -> int:
+        """
+        Remove the tracks that don't belong to any playlist and return the
+        number of removed tracks.
+
+        The orphans are checked against the membership index before they
+        are removed, the index is rebuilt whenever the registry is merged
+        with the changes of another process.
+
+        :rtype: int
+        """
+        orphans = Membership.orphans()
+        if not orphans:
+            return 0
+
+        removed = 0
+        for id in orphans:
+            if Membership.playlists(id) or not Registry.exists(
+                cls.namespace, id
+            ):
+                Membership.removed(id)
+            else:
+                cls.remove(id)
+                removed += 1
+        return removed
+
+
+class Membership:
+    """
+    Persistent reverse index of the playlists each track belongs to,
+    maintained by the playlist manager writes.
+
+    The number of playlists is the track's reference count, the tracks
+    whose count is zero are kept in the orphan namespace until they are
+    linked to a playlist or removed.
+
+    The indexes are built from the playlists and tracks the first time
+    they are used on a storage that doesn't have them yet and rebuilt when
+    the registry is merged with the changes of another process. Both
+    namespaces are guarded by the membership namespace lock.
+    """
+
+    namespace = "membership"
+    orphan_namespace = "orphan"
+
+    @classmethod
+    def playlists(cls, track_id) -> List[str]:
+        cls.ensure()
+        return Registry.get(cls.namespace, track_id, default=[])
+
+    @classmethod
+    def count(cls, track_id) -> int:
+        return len(cls.playlists(track_id))
+
+    @classmethod
+    def orphans(cls) -> List[str]:
+        cls.ensure()
+        return list(Registry.get(cls.orphan_namespace, default={}).keys())
+
+    @classmethod
+    def added(cls, track_id):
+        """Mark a new track as orphan unless a playlist already has it."""
+        with Registry.lock(cls.namespace):
+            if cls.ensure() and not cls.count(track_id):
+                Registry.set(cls.orphan_namespace, track_id, timestamp())
+
+    @classmethod
+    def removed(cls, track_id):
+        with Registry.lock(cls.namespace):
+            if Registry.exists(cls.orphan_namespace, track_id):
+                Registry.remove(cls.orphan_namespace, track_id)
+
+    @classmethod
+    def update(cls, playlist_id, old: List, new: List):
+        """
+        Move the playlist from the tracks it no longer contains to the new
+        ones.
+
+        :param str playlist_id: The playlist id
+        :param list old: The previous playlist track ids
+        :param list new: The current playlist track ids
+        """
+        with Registry.lock(cls.namespace):
+            if not cls.ensure():
+                return
+
+            old_ids, new_ids = set(old), set(new)
+            for track_id in old_ids - new_ids:
+                cls.unlink(playlist_id, track_id)
+            for track_id in new_ids - old_ids:
+                cls.link(playlist_id, track_id)
+
+    @classmethod
+    def link(cls, playlist_id, track_id):
+        playlists = Registry.get(cls.namespace, track_id, default=[])
+        if playlist_id not in playlists:
+            Registry.set(cls.namespace, track_id, playlists + [playlist_id])
+            cls.removed(track_id)
+
+    @classmethod
+    def unlink(cls, playlist_id, track_id):
+        playlists = Registry.get(cls.namespace, track_id, default=[])
+        remaining = [p for p in playlists if p != playlist_id]
+        if not remaining:
+            with contextlib.suppress(KeyError):
+                Registry.remove(cls.namespace, track_id)
+            if Registry.exists(TrackManager.namespace, track_id):
+                Registry.set(cls.orphan_namespace, track_id, timestamp())
+        elif len(remaining) != len(playlists):
+            Registry.set(cls.namespace, track_id, remaining)
+
+    @classmethod
+    def ensure(cls) -> bool:
+        """Build the indexes if missing and return whether they existed."""
+        with Registry.lock(cls.namespace):
+            if Registry.exists(cls.namespace) and Registry.exists(
+                cls.orphan_namespace
+            ):
+                return True
+
+            cls.rebuild()
+            return False
+
+    @classmethod
+    def refresh(cls):
+        """Rebuild the indexes, if the storage has them."""
+        with Registry.lock(cls.namespace):
+            if Registry.exists(cls.namespace):
+                cls.rebuild()
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Build the indexes from the playlists and tracks, the tracks that
+        were already orphans keep their timestamps.
+        """
+        index: Dict[str, List[str]] = dict()
+        playlists = Registry.get(PlaylistManager.namespace, default={})
+        for playlist_id, playlist in playlists.items():
+            for track_id in playlist.get("tracks", []):
+                ids = index.setdefault(track_id, [])
+                if playlist_id not in ids:
+                    ids.append(playlist_id)
+
+        now = timestamp()
+        previous = Registry.get(cls.orphan_namespace, default={})
+        tracks = Registry.get(TrackManager.namespace, default={})
+        orphans = {
+            id: previous.get(id, now)
+            for id in tracks.keys()
+            if id not in index
+        }
+
+        Registry.set(cls.namespace, index)
+        Registry.set(cls.orphan_namespace, orphans)
+
+
+Registry.on_merge(Membership.refresh)
+
 
 class History:
     namespace = "history"
+    keys = ("limit", "user")
 
     @classmethod
     def set(cls, *args, **kwargs):
@@ -1,16 +1,18 @@
-import os
+import contextlib
 
 import click
 from click_completion import completion_configuration
 
 from pytuber.core.models import PlaylistManager, Provider
+from pytuber.exceptions import CorruptedStorage
 from pytuber.storage import Registry
+from pytuber.utils import storage_path
 
 
 class RegistryParamType(click.ParamType):
     def init_registry(self):
-        cfg = os.path.join(click.get_app_dir("pytuber", False), "storage.db")
-        Registry.from_file(cfg)
+        with contextlib.suppress(CorruptedStorage):
+            Registry.from_file(storage_path())
 
 
 class PlaylistParamType(RegistryParamType):
@@ -0,0 +1,139 @@
+import enum
+import numbers
+import operator
+from typing import Any, Callable, Dict, List
+
+import attr
+
+ranges = dict(gt=operator.gt, gte=operator.ge, lt=operator.lt, lte=operator.le)
+
+
+def normalize(value):
+    """Return the stored representation of a condition value."""
+    return value.value if isinstance(value, enum.Enum) else value
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Condition:
+    """
+    A single find condition, ``field__op=value``.
+
+    Supported operators are ``eq`` (default), ``ne``, ``in``, ``isnull``,
+    ``gt``, ``gte``, ``lt`` and ``lte``. A callable value is used as the
+    predicate of the field value.
+    """
+
+    field: str
+    op: str
+    value: Any
+
+    @classmethod
+    def parse(cls, model, key: str, value) -> "Condition":
+        """
+        Parse and validate a keyword condition against the model fields.
+
+        :param model: The attrs model class
+        :param str key: The condition keyword, eg ``synced__gt``
+        :param value: The condition value
+        :raise TypeError: On unknown fields, operators or value types
+        """
+        name, _, op = key.partition("__")
+        fields = attr.fields_dict(model)
+        if name not in fields:
+            raise TypeError(
+                "Unknown {} field: {}".format(model.__name__, name)
+            )
+
+        op = op or "eq"
+        if callable(value):
+            if op != "eq":
+                raise TypeError("Callable condition with operator: " + key)
+            return cls(field=name, op="call", value=value)
+
+        if op in ("eq", "ne"):
+            value = normalize(value)
+            check(key, value, fields[name].type)
+        elif op == "in":
+            if isinstance(value, (str, bytes)) or not hasattr(
+                value, "__iter__"
+            ):
+                raise TypeError("Expected a collection for: " + key)
+            value = dict.fromkeys(normalize(v) for v in value)
+        elif op == "isnull":
+            if not isinstance(value, bool):
+                raise TypeError("Expected a boolean for: " + key)
+        elif op in ranges:
+            if not isinstance(value, numbers.Real):
+                raise TypeError("Expected a number for: " + key)
+        else:
+            raise TypeError("Unknown operator: " + key)
+
+        return cls(field=name, op=op, value=value)
+
+    def test(self) -> Callable[[Any], bool]:
+        """Return the predicate of the field value."""
+        value = self.value
+        if self.op == "call":
+            return value
+        if self.op == "isnull":
+            return (
+                (lambda x: x is None) if value else (lambda x: x is not None)
+            )
+        if self.op == "in":
+            return lambda x: x.__hash__ is not None and x in value
+        if self.op in ranges:
+            compare = ranges[self.op]
+            return lambda x: isinstance(x, numbers.Real) and compare(x, value)
+        if value is None:
+            if self.op == "eq":
+                return lambda x: x is None
+            return lambda x: x is not None
+        if self.op == "eq":
+            return lambda x: x == value
+        return lambda x: x != value
+
+
+def check(key: str, value, expected):
+    """Fail fast if the value doesn't match the field's annotated type."""
+    if value is None or not isinstance(expected, type):
+        return
+
+    numeric = issubclass(expected, numbers.Real)
+    if numeric and isinstance(value, numbers.Real):
+        return
+    if not numeric and isinstance(value, expected):
+        return
+
+    raise TypeError(
+        "Expected {} for: {}, got {}".format(
+            expected.__name__, key, value.__class__.__name__
+        )
+    )
+
+
+def parse(model, conditions: Dict) -> List[Condition]:
+    return [Condition.parse(model, k, v) for k, v in conditions.items()]
+
+
+def matcher(conditions: List[Condition]) -> Callable[[Dict], bool]:
+    """
+    Compile the conditions into a single predicate of raw records.
+
+    :param list conditions: The parsed conditions
+    :rtype: callable
+    """
+    tests = [(c.field, c.test()) for c in conditions]
+    if not tests:
+        return lambda data: True
+
+    if len(tests) == 1:
+        [(field, test)] = tests
+        return lambda data: bool(test(data.get(field)))
+
+    def predicate(data):
+        for field, test in tests:
+            if not test(data.get(field)):
+                return False
+        return True
+
+    return predicate
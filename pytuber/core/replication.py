@@ -0,0 +1,165 @@
+import itertools
+import json
+from typing import IO, Dict, Iterator, List, Tuple, Type
+
+import attr
+
+from pytuber.core.models import Manager, PlaylistManager, TrackManager
+from pytuber.exceptions import InvalidDelta
+from pytuber.storage import ChangeLog, Registry
+
+managers: Dict[str, Type[Manager]] = {
+    manager.namespace: manager for manager in (TrackManager, PlaylistManager)
+}
+header = "pytuber-delta"
+batch_size = 1000
+
+
+def export_delta(path: str, since: int, fp: IO) -> int:
+    """
+    Write the playlists and tracks that changed after the given sequence
+    number as a delta, one json line per record, ``null`` for the removed
+    ones.
+
+    Tracks come before the playlists that reference them, the rows are
+    read once however many times they changed. If the changes after the
+    given sequence number are no longer logged all the rows are exported,
+    without the removed ones.
+
+    The sequence number is kept as the exporter's cursor, so the change log
+    keeps the changes the other node has not applied yet.
+
+    :param str path: The storage file path
+    :param int since: The last sequence number the other node applied
+    :param fp: The output stream
+    :return: The sequence number the delta is current to
+    """
+    log = ChangeLog(path)
+    sequence = since
+    changed: Dict[str, Dict] = {namespace: dict() for namespace in managers}
+    if since < log.start():
+        sequence = log.last()
+        for namespace, keys in changed.items():
+            keys.update(dict.fromkeys(Registry.get(namespace, default={})))
+
+    for change in log.read(max(since, log.start())):
+        sequence = change.sequence
+        keys = changed.get(change.namespace)
+        if keys is None:
+            continue
+        if change.key is None:
+            keys.update(
+                dict.fromkeys(Registry.get(change.namespace, default={}))
+            )
+        else:
+            keys[change.key] = None
+
+    Registry.acknowledge("export-delta", since)
+
+    fp.write(json.dumps(dict(format=header, since=since, sequence=sequence)))
+    fp.write("\n")
+    for namespace, keys in changed.items():
+        for key in keys:
+            row = Registry.get(namespace, key, default=None)
+            fp.write(json.dumps([namespace, key, row]))
+            fp.write("\n")
+
+    return sequence
+
+
+def read_delta(fp: IO) -> Tuple[Dict, Iterator[Tuple]]:
+    """
+    Parse the delta header and return it with the generator of the
+    records, that checks every record is a known row or ``null``, see
+    :func:`is_row`.
+
+    :raise InvalidDelta: If the stream is not a pytuber delta
+    """
+    try:
+        meta = json.loads(fp.readline())
+        valid = meta.get("format") == header
+    except (ValueError, AttributeError):
+        valid = False
+
+    if not valid:
+        raise InvalidDelta("Invalid delta file!")
+
+    def records():
+        for number, line in enumerate(fp, start=2):
+            try:
+                namespace, key, row = json.loads(line)
+            except ValueError:
+                raise InvalidDelta(
+                    "Invalid delta record at line {}".format(number)
+                )
+
+            if namespace not in managers:
+                raise InvalidDelta(
+                    "Unknown delta namespace: {}".format(namespace)
+                )
+
+            if not isinstance(key, str) or (
+                row is not None and not is_row(namespace, key, row)
+            ):
+                raise InvalidDelta(
+                    "Invalid delta record at line {}".format(number)
+                )
+            yield namespace, key, row
+
+    return meta, records()
+
+
+def is_row(namespace: str, key: str, row) -> bool:
+    """
+    Check the given row has only known fields, every field without a
+    default and the key as its id.
+    """
+    manager = managers[namespace]
+    if not isinstance(row, dict) or row.get(manager.key) != key:
+        return False
+
+    fields = attr.fields(manager.model)
+    required = {f.name for f in fields if f.default is attr.NOTHING}
+    return required <= row.keys() <= {f.name for f in fields}
+
+
+def apply_delta(fp: IO) -> Tuple[int, int, int]:
+    """
+    Apply a delta written by :func:`export_delta` in a single transaction.
+
+    Records are written with :meth:`Manager.set_many`, the incoming
+    values win but the ``keep`` fields the other node has not set yet, eg a
+    playlist's ``youtube_id``, preserve the local values. Playlists are
+    removed before tracks so the membership index stays consistent.
+
+    :param fp: The delta stream
+    :return: The number of written and removed records and the delta
+        sequence number
+    """
+    meta, records = read_delta(fp)
+    written = 0
+    removed: Dict[str, List[str]] = {namespace: [] for namespace in managers}
+    with Registry.transaction():
+        for namespace, group in itertools.groupby(records, lambda r: r[0]):
+            rows = []
+            for _, key, row in group:
+                if row is None:
+                    removed[namespace].append(key)
+                    continue
+
+                rows.append(row)
+                if len(rows) == batch_size:
+                    written += len(managers[namespace].set_many(rows))
+                    rows = []
+            written += len(managers[namespace].set_many(rows))
+
+        count = 0
+        for namespace in reversed(list(managers)):
+            for key in removed[namespace]:
+                if Registry.exists(namespace, key):
+                    managers[namespace].remove(key)
+                    count += 1
+
+        Registry.set("replication", "applied", meta.get("sequence", 0))
+
+    return written, count, meta.get("sequence", 0)
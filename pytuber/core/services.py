@@ -163,8 +163,10 @@ class YouService:
         :param int cost:
         """
         date = cls.quota_date()
-        quota = Registry.get(cls.quota_key, date, default=0) + cost
-        Registry.set(cls.quota_key, {date: quota})
+        with Registry.lock(cls.quota_key):
+            if not Registry.exists(cls.quota_key, date):
+                Registry.set(cls.quota_key, {date: 0})
+            Registry.incr(cls.quota_key, date, cost)
 
     @classmethod
     def quota_date(cls, obj: bool = False):
@@ -0,0 +1,87 @@
+import json
+import os
+from contextlib import suppress
+from typing import Dict, List, Tuple
+
+import attr
+
+from pytuber.cache import Cache
+from pytuber.core.models import History, PlaylistManager, TrackManager
+from pytuber.core.services import YouService
+from pytuber.storage import JsonBackend, Registry
+
+
+@attr.s(auto_attribs=True)
+class Usage:
+    """The number of records and serialized bytes of a namespace."""
+
+    namespace: str
+    count: int = 0
+    size: int = 0
+
+
+def usage() -> Dict[str, Usage]:
+    """Measure every registry namespace and the cache directory."""
+    result = dict()
+    for key in list(Registry()):
+        value = Registry.get(key)
+        count = len(value) if isinstance(value, dict) else 1
+        size = len(json.dumps(value).encode())
+        result[key] = Usage(key, count, size)
+
+    files = Cache.files()
+    result["cache"] = Usage(
+        "cache", len(files), sum(stat.st_size for _, stat in files)
+    )
+    return result
+
+
+def vacuum(path: str) -> List[Tuple[Usage, Usage]]:
+    """
+    Drop the expired and over budget cache entries, the empty playlists,
+    the orphan tracks, the quota usage of past days and the unused history
+    entries, then rewrite the storage file with its current backend, drop
+    the processed changes of the change log and remove the snapshots but
+    the newest one, the storage as it was before the vacuum.
+
+    :param str path: The storage file path
+    :return: The before and after usage of each namespace
+    """
+    before = usage()
+    with Registry.transaction():
+        empty = [
+            id
+            for id, in PlaylistManager.iter_find(
+                fields=("id",), tracks=lambda tracks: not tracks
+            )
+        ]
+        for id in empty:
+            PlaylistManager.remove(id)
+
+        TrackManager.remove_orphans()
+
+        today = YouService.quota_date()
+        quota = Registry.get(YouService.quota_key, default={})
+        if isinstance(quota, dict):
+            for date in [date for date in quota if date != today]:
+                Registry.remove(YouService.quota_key, date)
+
+        history = Registry.get(History.namespace, default={})
+        for key in list(history):
+            if key not in History.keys or history[key] is None:
+                Registry.remove(History.namespace, key)
+
+    Cache.evict()
+    Registry.persist(path)
+    backend = Registry().backend
+    Registry.convert(path, backend.name if backend else "json")
+    Registry.compact(path)
+    for snapshot in JsonBackend(path).snapshots()[1:]:
+        with suppress(FileNotFoundError):
+            os.remove(snapshot)
+
+    after = usage()
+    return [
+        (before.get(key, Usage(key)), after.get(key, Usage(key)))
+        for key in sorted(before.keys() | after.keys())
+    ]
@@ -11,3 +11,11 @@ class RecordExists(click.UsageError):
 
 class NotFound(click.UsageError):
     pass
+
+
+class CorruptedStorage(click.ClickException):
+    pass
+
+
+class InvalidDelta(click.ClickException):
+    pass
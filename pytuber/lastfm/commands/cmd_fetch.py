@@ -1,10 +1,9 @@
-from typing import List
-
 import click
 from tabulate import tabulate
 
 from pytuber.core.models import PlaylistManager, Provider, TrackManager
 from pytuber.lastfm.services import LastService
+from pytuber.storage import Registry
 from pytuber.utils import spinner
 
 
@@ -28,7 +27,7 @@ def fetch(ctx: click.Context, tracks: bool = False, tags: bool = False):
 def fetch_tracks(*args):
     kwargs = dict(provider=Provider.lastfm)
     if args:
-        kwargs["id"] = lambda x: x in args
+        kwargs["id__in"] = args
 
     # So wrong, but yaspin doesn't support nested spinners
     LastService.get_tags()
@@ -38,19 +37,17 @@ def fetch_tracks(*args):
                 type=playlist.type, **playlist.arguments
             )
 
-            track_ids: List[str] = []
-            for entry in tracklist:
-                id = TrackManager.set(
+            with Registry.transaction():
+                ids = TrackManager.set_many(
                     dict(artist=entry.artist.name, name=entry.name)
-                ).id
-
-                if id not in track_ids:
-                    track_ids.append(id)
+                    for entry in tracklist
+                )
+                track_ids = list(dict.fromkeys(ids))
+                PlaylistManager.update(playlist, dict(tracks=track_ids))
 
             sp.write(
                 "Playlist: {} - {} tracks".format(playlist.id, len(track_ids))
             )
-            PlaylistManager.update(playlist, dict(tracks=track_ids))
 
 
 def fetch_tags():
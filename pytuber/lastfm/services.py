@@ -3,9 +3,9 @@ from typing import List
 
 from pydrag import Artist, Tag, Track, User, configure, constants
 
+from pytuber.cache import Cache
 from pytuber.core.models import ConfigManager, Provider
 from pytuber.lastfm.models import PlaylistType
-from pytuber.storage import Registry
 from pytuber.utils import spinner
 
 
@@ -80,7 +80,7 @@ class LastService:
 
         return [
             Tag(**data)
-            for data in Registry.cache(
+            for data in Cache.fetch(
                 key="last.fm_tag_list",
                 ttl=timedelta(days=30),
                 func=retrieve_tags,
@@ -110,7 +110,7 @@ class LastService:
         """
         cls.assert_config()
 
-        cache = Registry.cache(
+        cache = Cache.fetch(
             key="last.fm_artist_{}".format(artist.lower()),
             ttl=timedelta(days=30),
             func=lambda: Artist.find(artist).to_dict(),
@@ -128,7 +128,7 @@ class LastService:
         """
         cls.assert_config()
 
-        cache = Registry.cache(
+        cache = Cache.fetch(
             key="last.fm_user_{}".format(username.lower()),
             ttl=timedelta(hours=24),
             func=lambda: User.find(username).to_dict(),
@@ -0,0 +1,135 @@
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import attr
+
+from pytuber.cache import Cache
+from pytuber.storage import Registry
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Migration:
+    """
+    A registered storage migration step, that applies to the storages
+    written by the given version or older.
+    """
+
+    name: str
+    version: str
+    func: Callable
+
+
+steps: List[Migration] = []
+batch_size = 1000
+
+
+def migration(version: str):
+    """
+    Register the decorated function as the next migration step.
+
+    Steps must be idempotent and modify the registry row by row, they are
+    recorded in the ``migrations`` entry once they are applied. Steps that
+    rewrite many rows should be generators that yield the key of every row
+    they modify, they are called with the last key yielded before an
+    interrupted run was persisted, if any.
+
+    :param str version: The last version that needs the migration
+    """
+
+    def decorator(func: Callable):
+        steps.append(Migration(name=func.__name__, version=version, func=func))
+        return func
+
+    return decorator
+
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    return tuple(int(x) if x.isdigit() else 0 for x in version.split("."))
+
+
+def pending(version: str) -> List[Migration]:
+    """
+    Return the steps that haven't been applied on a storage of the given
+    version, in registration order.
+
+    :param str version: The version that last wrote the storage
+    """
+    applied = Registry.get("migrations", default={})
+    current = parse_version(version)
+    return [
+        step
+        for step in steps
+        if step.name not in applied and current <= parse_version(step.version)
+    ]
+
+
+def migrate(path: str, version: str) -> List[str]:
+    """
+    Apply the pending steps and persist the storage after each one.
+
+    On the incremental backends the storage is also persisted every
+    ``batch_size`` rows a step yields, with the last yielded key recorded in
+    the ``migrating`` entry, so an interrupted step resumes after the last
+    persisted batch. The other backends rewrite the whole document on every
+    persist, their snapshots are pinned after the first one so the
+    pre-migration version is kept as the newest snapshot.
+
+    :param str path: The storage file path
+    :param str version: The version that last wrote the storage
+    :return: The names of the applied steps
+    """
+    applied = []
+    backend = Registry().backend
+    incremental = backend is not None and backend.incremental
+    try:
+        for step in pending(version):
+            resume = Registry.get("migrating", step.name, default=None)
+            for count, key in enumerate(step.func(resume) or (), start=1):
+                if incremental and count % batch_size == 0:
+                    Registry.set("migrating", step.name, key)
+                    Registry.persist(path)
+
+            if Registry.exists("migrating", step.name):
+                Registry.remove("migrating", step.name)
+                if not Registry.get("migrating"):
+                    Registry.remove("migrating")
+            Registry.set("migrations", step.name, int(time.time()))
+            Registry.persist(path)
+            if backend is not None:
+                backend.pinned = True
+            applied.append(step.name)
+    finally:
+        if backend is not None:
+            backend.pinned = False
+    return applied
+
+
+@migration("0")
+def youtube_quota_limit(resume: Optional[str] = None):
+    if Registry.exists("configuration", "youtube", "data"):
+        Registry.set(
+            "configuration", "youtube", "data", "quota_limit", 1000000
+        )
+
+
+@migration("20.1")
+def move_cache_entries(resume: Optional[str] = None) -> Iterator[str]:
+    """
+    Move the cached api responses out of the registry, the moved rows are
+    removed so a resumed run skips them.
+    """
+    for key in [key for key in Registry() if key.startswith("last.fm_")]:
+        value = Registry.get(key)
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            Cache.set(key, *value)
+        Registry.remove(key)
+        yield key
+
+    if Registry.exists("cache"):
+        for key in list(Registry.get("cache")):
+            value = Registry.get("cache", key)
+            if isinstance(value, list) and len(value) == 4:
+                Cache.set(key, value[0], value[1])
+            Registry.remove("cache", key)
+            yield key
+        Registry.remove("cache")
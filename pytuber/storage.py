@@ -1,10 +1,39 @@
+import gzip
+import io
+import itertools
 import json
+import os
+import signal
+import sqlite3
+import threading
 import time
-from contextlib import suppress
-from datetime import timedelta
+import zlib
+from contextlib import contextmanager, suppress
 from functools import reduce
 from json import JSONDecodeError
-from typing import Callable, Dict
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from pytuber.codecs import Codec, codecs, read_header, write_header
+from pytuber.exceptions import CorruptedStorage
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
 
 
 class Singleton(type):
@@ -17,9 +46,1002 @@ class Singleton(type):
 
 
 NOTHING = object()
+MISSING = object()
+
+
+class Namespace(dict):
+    """
+    A registry namespace that is loaded row by row from a storage backend.
+
+    Single key lookups only fetch the requested row, iterating the namespace
+    loads all the rows once.
+    """
+
+    def __init__(self, backend, name: str):
+        super().__init__()
+        self.backend = backend
+        self.name = name
+        self.loaded = False
+        self.removed: Set[str] = set()
+
+    def fetch(self, key) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        if self.loaded or key in self.removed:
+            return False
+
+        value = self.backend.fetch(self.name, key)
+        if value is NOTHING:
+            return False
+
+        dict.__setitem__(self, key, value)
+        return True
+
+    def load(self):
+        if not self.loaded:
+            for key, value in self.backend.fetch_all(self.name):
+                if key not in self.removed and not dict.__contains__(
+                    self, key
+                ):
+                    dict.__setitem__(self, key, value)
+            self.loaded = True
+
+    def __missing__(self, key):
+        if self.fetch(key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.fetch(key)
+
+    def __setitem__(self, key, value):
+        self.removed.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if not self.fetch(key):
+            raise KeyError(key)
+        dict.__delitem__(self, key)
+        self.removed.add(key)
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        self.load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, key, default=None):
+        return self[key] if self.fetch(key) else default
+
+    def setdefault(self, key, default=None):
+        if not self.fetch(key):
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+
+class Backend:
+    name: str
+    keep = 0
+    available = True
+    incremental = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rewrite = False
+        self.codec: Codec = codecs["json"]
+
+    def load(self, source: Optional[str] = None) -> Dict:
+        raise NotImplementedError
+
+    def persist(self, data: Dict, dirty: Dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def merge(
+        self, data: Dict, dirty: Dict, bases: Dict, increments: Dict
+    ) -> Dict:
+        """
+        Merge the dirty entries of the given data into a fresh load of the
+        storage file, that another process has written since it was loaded.
+
+        :param dict data: The registry data
+        :param dict dirty: The dirty entries
+        :param dict bases: The row values when last persisted
+        :param dict increments: The counter increments since then
+        :rtype: dict
+        """
+        fresh = self.load()
+        for record in resolve(data, dirty, bases, increments, fresh):
+            replay(fresh, record)
+        return fresh
+
+    def snapshots(self) -> List[str]:
+        """Return the existing snapshot paths, newest first."""
+        paths = ["{}.{}".format(self.path, i) for i in range(1, self.keep + 1)]
+        return [path for path in paths if os.path.exists(path)]
+
+    @classmethod
+    def install(cls, source: str, path: str):
+        """
+        Move the storage files written at the source path over the given
+        path and remove the leftovers of any other backend.
+
+        :param str source: The path the backend wrote to
+        :param str path: The storage file path
+        """
+        os.replace(source, path)
+        with suppress(FileNotFoundError):
+            os.remove(JournalBackend.journal_path(path))
+
+    @classmethod
+    def detect(cls, path: str, header: bytes) -> bool:
+        raise NotImplementedError
+
+
+class JsonBackend(Backend):
+    """
+    Store the whole registry as a single document, serialized with the
+    json codec unless the storage was converted to another one.
+
+    The document is written to a temporary file that replaces the storage
+    file once it is synced to disk and the previous versions are kept as
+    rotating snapshots, ``storage.db.1`` being the newest one. Pinned
+    backends keep their snapshots, eg while migrating so the pre-migration
+    version isn't rotated away.
+    """
+
+    name = "json"
+    keep = 3
+    errors: Tuple = (ValueError,)
+    pinned = False
+
+    def load(self, source: Optional[str] = None) -> Dict:
+        path = source or self.path
+        self.rewrite = source is not None
+        try:
+            with self.open(path, "r") as cfg:
+                if not hasattr(cfg, "peek"):
+                    cfg = io.BufferedReader(cfg)
+                self.codec = read_header(cfg)
+                return self.codec.load(cfg)
+        except FileNotFoundError:
+            if source is None and self.snapshots():
+                raise CorruptedStorage("Storage file is missing: " + path)
+            return dict()
+        except LookupError as e:
+            raise CorruptedStorage("{}: {}".format(e, path))
+        except self.errors:
+            raise CorruptedStorage("Storage file is corrupted: " + path)
+
+    def open(self, path: str, mode: str):
+        return open(path, mode + "b")
+
+    def persist(self, data: Dict, dirty: Dict):
+        with suppress(FileNotFoundError):
+            tmp = "{}.tmp".format(self.path)
+            with self.open(tmp, "w") as fp:
+                write_header(fp, self.codec)
+                self.codec.dump(data, fp)
+            fsync_file(tmp)
+
+            if not self.rewrite and not self.pinned:
+                self.rotate()
+            os.replace(tmp, self.path)
+            fsync_dir(self.path)
+            self.rewrite = False
+
+    def rotate(self):
+        paths = [self.path] + [
+            "{}.{}".format(self.path, i) for i in range(1, self.keep + 1)
+        ]
+        for source, target in reversed(list(zip(paths, paths[1:]))):
+            with suppress(FileNotFoundError):
+                os.replace(source, target)
+
+    @classmethod
+    def detect(cls, path: str, header: bytes) -> bool:
+        return True
+
+
+class GzipBackend(JsonBackend):
+    """
+    Store the json document gzip compressed, it's compressed and
+    decompressed while it's written and read so the compressed copy is
+    never held in memory.
+    """
+
+    name = "gzip"
+    magic = b"\x1f\x8b"
+    level = 6
+    errors = (
+        ValueError,
+        EOFError,
+        zlib.error,
+        getattr(gzip, "BadGzipFile", OSError),
+    )
+
+    def open(self, path: str, mode: str):
+        return gzip.open(path, mode + "b", compresslevel=self.level)
+
+    @classmethod
+    def detect(cls, path: str, header: bytes) -> bool:
+        return header.startswith(cls.magic)
+
+
+class ZstdBackend(JsonBackend):
+    """
+    Store the json document zstandard compressed, available if the
+    ``zstandard`` package is installed.
+    """
+
+    name = "zstd"
+    magic = b"\x28\xb5\x2f\xfd"
+    level = 3
+    available = zstandard is not None
+    errors = (ValueError, EOFError, getattr(zstandard, "ZstdError", OSError))
+
+    def open(self, path: str, mode: str):
+        if not self.available:
+            raise CorruptedStorage(
+                "Install the zstandard package to use the storage: " + path
+            )
+
+        cctx = zstandard.ZstdCompressor(level=self.level)
+        return zstandard.open(path, mode + "b", cctx=cctx)
+
+    @classmethod
+    def detect(cls, path: str, header: bytes) -> bool:
+        return header.startswith(cls.magic)
+
+
+class JournalBackend(JsonBackend):
+    """
+    Store a json snapshot and append the modified rows to a journal file on
+    every persist, so writes scale with the size of the changes instead of
+    the size of the registry.
+
+    The journal is folded into the snapshot when it grows past the
+    compaction thresholds and replayed on top of the snapshot on load.
+    """
+
+    name = "journal"
+    incremental = True
+    compact_size = 1024 * 1024
+    compact_ratio = 0.5
+    chunk = 4096
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.journal = self.journal_path(path)
+
+    def load(self, source: Optional[str] = None) -> Dict:
+        data = super().load(source)
+        with suppress(FileNotFoundError):
+            with open(self.journal, "r") as fp:
+                for line in fp:
+                    try:
+                        replay(data, json.loads(line))
+                    except JSONDecodeError:
+                        break
+        return data
+
+    def persist(self, data: Dict, dirty: Dict):
+        if self.rewrite or not os.path.exists(self.path):
+            return self.compact(data)
+
+        self.truncate()
+        with suppress(FileNotFoundError):
+            with open(self.journal, "a") as fp:
+                for record in records(data, dirty):
+                    fp.write(json.dumps(record))
+                    fp.write("\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+
+        if self.should_compact():
+            self.compact(data)
+
+    def truncate(self):
+        """
+        Cut a partially written last record off the journal, otherwise the
+        next record is appended to it and both are lost on load.
+        """
+        with suppress(FileNotFoundError):
+            with open(self.journal, "r+b") as fp:
+                end = position = fp.seek(0, os.SEEK_END)
+                while position > 0:
+                    start = max(0, position - self.chunk)
+                    fp.seek(start)
+                    data = fp.read(position - start)
+                    if position == end and data.endswith(b"\n"):
+                        return
+
+                    index = data.rfind(b"\n")
+                    if index >= 0:
+                        fp.truncate(start + index + 1)
+                        return
+                    position = start
+                fp.truncate(0)
+
+    def should_compact(self) -> bool:
+        try:
+            size = os.path.getsize(self.journal)
+            snapshot = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return False
+        return size > max(self.compact_size, snapshot * self.compact_ratio)
+
+    def compact(self, data: Dict):
+        """Fold the journal into a new snapshot."""
+        super().persist(data, dict())
+        with suppress(FileNotFoundError):
+            open(self.journal, "w").close()
+
+    @classmethod
+    def install(cls, source: str, path: str):
+        super().install(source, path)
+        with suppress(FileNotFoundError):
+            os.remove(cls.journal_path(source))
+        open(cls.journal_path(path), "w").close()
+
+    @staticmethod
+    def journal_path(path: str) -> str:
+        return "{}.journal".format(path)
+
+    @classmethod
+    def detect(cls, path: str, header: bytes) -> bool:
+        return os.path.exists(cls.journal_path(path))
+
+
+class SqliteBackend(Backend):
+    """
+    Store every registry namespace in its own sqlite table and the top level
+    values in the ``registry`` table.
+
+    Namespaces are loaded lazily and only the rows that changed are written
+    back on persist. The connection is shared by the threads of the process,
+    e.g. the checkpoint thread and the manager workers, and is only used
+    while holding the backend lock.
+    """
+
+    name = "sqlite"
+    incremental = True
+    magic = b"SQLite format 3\x00"
+    root = "registry"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.RLock()
+
+    def connect(self) -> sqlite3.Connection:
+        with self.lock:
+            if self.connection is None:
+                self.connection = sqlite3.connect(
+                    self.path, check_same_thread=False
+                )
+                self.create_table(self.root)
+            return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def load(self, source: Optional[str] = None) -> Dict:
+        data: Dict = dict()
+        for name in self.tables():
+            if name == self.root:
+                data.update(self.fetch_all(name))
+            else:
+                data[name] = Namespace(self, name)
+        return data
+
+    def tables(self):
+        with self.lock:
+            cursor = self.connect().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )
+            return [name for name, in cursor]
+
+    def fetch(self, namespace: str, key):
+        with self.lock:
+            row = (
+                self.connect()
+                .execute(
+                    "SELECT value FROM {} WHERE key = ?".format(
+                        quote(namespace)
+                    ),
+                    (str(key),),
+                )
+                .fetchone()
+            )
+        return NOTHING if row is None else json.loads(row[0])
+
+    def fetch_all(self, namespace: str):
+        with self.lock:
+            rows = (
+                self.connect()
+                .execute("SELECT key, value FROM {}".format(quote(namespace)))
+                .fetchall()
+            )
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def create_table(self, name: str):
+        with self.lock:
+            self.connect().execute(
+                "CREATE TABLE IF NOT EXISTS {} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL)".format(
+                    quote(name)
+                )
+            )
+
+    def drop_table(self, name: str):
+        with self.lock:
+            self.connect().execute(
+                "DROP TABLE IF EXISTS {}".format(quote(name))
+            )
+
+    def upsert(self, namespace: str, rows):
+        with self.lock:
+            self.connect().executemany(
+                "INSERT OR REPLACE INTO {} (key, value) VALUES (?, ?)".format(
+                    quote(namespace)
+                ),
+                [(str(key), json.dumps(value)) for key, value in rows],
+            )
+
+    def delete(self, namespace: str, keys):
+        with self.lock:
+            self.connect().executemany(
+                "DELETE FROM {} WHERE key = ?".format(quote(namespace)),
+                [(str(key),) for key in keys],
+            )
+
+    def persist(self, data: Dict, dirty: Dict):
+        """
+        Write the dirty entries, a set of row keys per top level key or None
+        if the whole entry was replaced.
+
+        :param dict data: The registry data
+        :param dict dirty: The dirty entries
+        """
+        with self.lock, self.connect():
+            for key, keys in dirty.items():
+                name = str(key)
+                value = dict.get(data, key, NOTHING)
+                if value is NOTHING or not isinstance(value, dict):
+                    self.drop_table(name)
+                    self.delete(self.root, [name])
+                    if value is not NOTHING:
+                        self.upsert(self.root, [(name, value)])
+                    continue
+
+                self.delete(self.root, [name])
+                self.create_table(name)
+                if keys is None:
+                    self.connect().execute(
+                        "DELETE FROM {}".format(quote(name))
+                    )
+                    self.upsert(name, value.items())
+                else:
+                    self.upsert(
+                        name, [(k, value[k]) for k in keys if k in value]
+                    )
+                    self.delete(name, [k for k in keys if k not in value])
+
+    @classmethod
+    def detect(cls, path: str, header: bytes) -> bool:
+        return header.startswith(cls.magic)
+
+
+backends = [
+    SqliteBackend,
+    JournalBackend,
+    GzipBackend,
+    ZstdBackend,
+    JsonBackend,
+]
+
+
+class FileLock:
+    """
+    Advisory lock of a storage file, shared for reading and exclusive for
+    writing, where supported.
+
+    The lock file also keeps the storage generation, the number of times the
+    storage file has been written, so writers can tell if another process
+    has modified it since they loaded it.
+    """
+
+    def __init__(self, path: str, exclusive: bool = False):
+        self.path = "{}.lock".format(path)
+        self.exclusive = exclusive
+        self.fp = None
+
+    def __enter__(self):
+        with suppress(FileNotFoundError):
+            self.fp = open(self.path, "a+")
+            if fcntl is not None:
+                flag = fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH
+                fcntl.flock(self.fp.fileno(), flag)
+        return self
+
+    def __exit__(self, *args):
+        if self.fp is not None:
+            if fcntl is not None:
+                fcntl.flock(self.fp.fileno(), fcntl.LOCK_UN)
+            self.fp.close()
+            self.fp = None
+
+    def generation(self) -> int:
+        if self.fp is None:
+            return 0
+
+        self.fp.seek(0)
+        try:
+            return int(self.fp.read() or 0)
+        except ValueError:
+            return 0
+
+    def advance(self) -> int:
+        """Increase and return the storage generation."""
+        generation = self.generation() + 1
+        if self.fp is not None:
+            self.fp.seek(0)
+            self.fp.truncate()
+            self.fp.write(str(generation))
+            self.fp.flush()
+        return generation
+
+
+class Change(NamedTuple):
+    """
+    A registry row mutation, the key is None if the whole top level entry
+    was replaced and the fingerprints are None for missing rows.
+    """
+
+    sequence: int
+    namespace: str
+    key: Optional[str]
+    old: Optional[str]
+    new: Optional[str]
+
+
+class ChangeLog:
+    """
+    The persisted registry change feed, one json line per change in the
+    ``storage.db.changes`` file, ordered by sequence number.
+
+    Once the file grows past ``limit`` bytes the changes every consumer has
+    processed are dropped, the first line of a compacted feed is the
+    ``[sequence]`` it starts after.
+    """
+
+    tail = 4096
+    limit = 1 << 20
+
+    def __init__(self, path: str):
+        self.path = "{}.changes".format(path)
+
+    def start(self) -> int:
+        """Return the sequence number the logged changes start after."""
+        with suppress(FileNotFoundError, ValueError, TypeError, IndexError):
+            with open(self.path, "r") as fp:
+                record = json.loads(fp.readline())
+                if len(record) == 1:
+                    return int(record[0])
+        return 0
+
+    def should_compact(self) -> bool:
+        try:
+            return os.path.getsize(self.path) > self.limit
+        except OSError:
+            return False
+
+    def compact(self, below: int):
+        """
+        Rewrite the feed without the changes up to the given sequence
+        number.
+
+        :param int below: The lowest sequence number the consumers processed
+        """
+        below = max(below, self.start())
+        tmp = "{}.tmp".format(self.path)
+        with suppress(FileNotFoundError):
+            with open(tmp, "w") as fp:
+                fp.write(json.dumps([below]))
+                fp.write("\n")
+                for change in self.read(below):
+                    fp.write(json.dumps(list(change)))
+                    fp.write("\n")
+            fsync_file(tmp)
+            os.replace(tmp, self.path)
+
+    def last(self) -> int:
+        """Return the sequence number of the last logged change."""
+        try:
+            with open(self.path, "rb") as fp:
+                fp.seek(0, os.SEEK_END)
+                fp.seek(max(0, fp.tell() - self.tail))
+                lines = fp.read().splitlines()
+        except FileNotFoundError:
+            return 0
+
+        for line in reversed(lines):
+            with suppress(ValueError, TypeError, IndexError):
+                return int(json.loads(line.decode())[0])
+        return 0
+
+    def read(self, since: int = 0) -> Iterator[Change]:
+        """
+        Generate the logged changes after the given sequence number, a
+        partially written last line ends the feed.
+
+        :param int since: The last sequence number the consumer processed
+        """
+        with suppress(FileNotFoundError):
+            with open(self.path, "r") as fp:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                        if len(record) == 1:
+                            continue
+                        change = Change(*record)
+                    except (ValueError, TypeError):
+                        break
+                    if change.sequence > since:
+                        yield change
+
+    def append(self, changes: List[Change]) -> int:
+        """
+        Append the changes, renumbered after the last logged one if another
+        process has logged changes in the meantime.
+
+        :param list changes: The pending changes in sequence order
+        :return: The sequence number of the last appended change
+        """
+        last = self.last()
+        if not changes:
+            return last
+
+        offset = max(0, last + 1 - changes[0].sequence)
+        with suppress(FileNotFoundError):
+            with open(self.path, "a") as fp:
+                for change in changes:
+                    record = change._replace(sequence=change.sequence + offset)
+                    fp.write(json.dumps(list(record)))
+                    fp.write("\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+        return changes[-1].sequence + offset
+
+
+def quote(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def detect_backend(path: str):
+    """
+    Return the storage backend that can read the given file, new or
+    unrecognized files default to the json backend.
+
+    :param str path: The storage file path
+    """
+    header = b""
+    with suppress(FileNotFoundError):
+        with open(path, "rb") as fp:
+            header = fp.read(16)
+
+    return next(b for b in backends if b.detect(path, header))(path)
+
+
+def storage_files(path: str) -> List[str]:
+    """
+    Return the existing files of the storage, the storage file, its
+    journal, change log, lock file and snapshots.
+
+    :param str path: The storage file path
+    """
+    paths = [
+        path,
+        JournalBackend.journal_path(path),
+        ChangeLog(path).path,
+        FileLock(path).path,
+    ]
+    snapshots = JsonBackend(path).snapshots()
+    return [p for p in paths if os.path.exists(p)] + snapshots
+
+
+def fsync_file(path: str):
+    """Sync the contents of the given file to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path: str):
+    """Sync the directory entries of the given file path, where supported."""
+    with suppress(OSError):
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+canonical = json.JSONEncoder(
+    sort_keys=True, separators=(",", ":"), default=repr
+)
+
+
+def fingerprint(value) -> Optional[str]:
+    """Return a short checksum of the json representation of the value."""
+    if value is NOTHING:
+        return None
+
+    data = canonical.encode(value).encode()
+    return "{:08x}".format(zlib.crc32(data))
+
+
+def records(data: Dict, dirty: Dict):
+    """
+    Generate the journal records of the dirty entries, ``["s", *keys,
+    value]`` for the modified and ``["r", *keys]`` for the removed rows.
+
+    :param dict data: The registry data
+    :param dict dirty: The dirty entries
+    """
+    for key, keys in dirty.items():
+        value = dict.get(data, key, NOTHING)
+        if value is NOTHING:
+            yield ["r", key]
+        elif keys is None or not isinstance(value, dict):
+            yield ["s", key, value]
+        else:
+            for k in keys:
+                if k in value:
+                    yield ["s", key, k, value[k]]
+                else:
+                    yield ["r", key, k]
+
+
+def lookup(data: Dict, keys, default=NOTHING):
+    """Return the value of the keys path in the given data or the default."""
+    for key in keys:
+        if not isinstance(data, dict) or key not in data:
+            return default
+        data = data[key]
+    return data
+
+
+def merge_value(base, ours, theirs):
+    """
+    Three-way merge of the value this process wrote and the one another
+    process stored, both changed from the given base value.
+
+    Dicts are merged key by key, otherwise the stored value is kept unless
+    this process changed it. If both changed it this process's value wins,
+    unless it's null. Missing values are ``NOTHING``.
+    """
+    if ours == base or theirs == ours:
+        return theirs
+    if theirs == base:
+        return ours
+
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = dict()
+        for key in itertools.chain(ours, (k for k in theirs if k not in ours)):
+            value = merge_value(
+                base.get(key, NOTHING),
+                ours.get(key, NOTHING),
+                theirs.get(key, NOTHING),
+            )
+            if value is not NOTHING:
+                merged[key] = value
+        return merged
+
+    return theirs if ours is None else ours
+
+
+def resolve(data: Dict, dirty: Dict, bases: Dict, increments: Dict, stored):
+    """
+    Generate the journal records that merge the dirty entries of the given
+    data into the stored registry.
+
+    Rows are merged with :func:`merge_value` against their values when last
+    persisted, rows without a base, eg namespaces replaced as a whole, are
+    written as they are. Counters are written as their stored value plus
+    the increments made since the last persist.
+
+    :param dict data: The registry data
+    :param dict dirty: The dirty entries
+    :param dict bases: The row values when last persisted
+    :param dict increments: The counter increments since then
+    :param dict stored: The registry data another process stored
+    """
+    counters = []
+    for keys, amount in increments.items():
+        value = lookup(stored, keys, 0)
+        if not isinstance(value, int) or isinstance(value, bool):
+            value = 0
+        counters.append(["s", *keys, value + amount])
+
+    for record in records(data, dirty):
+        op, *keys = record
+        ours = keys.pop() if op == "s" else NOTHING
+        base = bases.get(tuple(keys), NOTHING)
+        if base is NOTHING:
+            yield record
+            continue
+
+        base = NOTHING if base is MISSING else base
+        value = merge_value(base, ours, lookup(stored, keys))
+        if value is NOTHING:
+            yield ["r", *keys]
+        else:
+            yield ["s", *keys, value]
+
+    yield from counters
+
+
+def parent(data: Dict, keys, create: bool = False) -> Dict:
+    """
+    Return the dict that holds the last key of the keys path, the dicts
+    below the top level entries are copied on the way instead of modified
+    in place, so the merge bases keep the previous rows.
+
+    :param dict data: The registry data
+    :param keys: The keys path
+    :param bool create: Add the missing dicts of the path
+    """
+    for depth, key in enumerate(keys[:-1]):
+        node = data.setdefault(key, {}) if create else data[key]
+        if depth and isinstance(node, dict):
+            node = data[key] = dict(node)
+        data = node
+    return data
+
+
+def replay(data: Dict, record: list):
+    """
+    Apply a journal record on the given registry data.
+
+    :param dict data: The registry data
+    :param list record: The journal record
+    """
+    op, *keys = record
+    if op == "s":
+        *keys, value = keys
+        for key in keys[:-1]:
+            data = data.setdefault(key, {})
+        data[keys[-1]] = value
+    else:
+        with suppress(KeyError):
+            for key in keys[:-1]:
+                data = data[key]
+            del data[keys[-1]]
+
+
+class Increment(NamedTuple):
+    """An undo log entry of a counter increment kept until the persist."""
+
+    amount: int
+
+
+class Gate:
+    """
+    Registry wide read/write lock, writers share it as a context manager and
+    persist holds it exclusively. The shared side is reentrant and the
+    exclusive owner may also share it, eg the merge hooks write while the
+    registry is persisted.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.shared: Dict[int, int] = dict()
+        self.owner: Optional[int] = None
+
+    def __enter__(self):
+        ident = threading.get_ident()
+        with self.condition:
+            while self.owner is not None and self.owner != ident:
+                self.condition.wait()
+            self.shared[ident] = self.shared.get(ident, 0) + 1
+
+    def __exit__(self, *args):
+        ident = threading.get_ident()
+        with self.condition:
+            count = self.shared.pop(ident) - 1
+            if count:
+                self.shared[ident] = count
+
+    def acquire(self) -> bool:
+        """
+        Try to hold the gate exclusively without waiting, the current thread
+        may already share it.
+        """
+        ident = threading.get_ident()
+        with self.condition:
+            if self.owner is not None or set(self.shared) - {ident}:
+                return False
+            self.owner = ident
+            return True
+
+    def release(self):
+        with self.condition:
+            self.owner = None
+            self.condition.notify_all()
 
 
 class Registry(dict, metaclass=Singleton):
+    quiet = ("cursors", "replication")
+    mergers: List[Callable] = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.backend = None
+        self.revision: Optional[int] = None
+        self.local = threading.local()
+        self.locks: Dict = dict()
+        self.guard = threading.RLock()
+        self.gate = Gate()
+        self.dirty: Dict = dict()
+        self.bases: Dict = dict()
+        self.increments: Dict = dict()
+        self.generations: Dict = dict()
+        self.mutations = 0
+        self.indexes: Dict = dict()
+        self.sequence = 0
+        self.changes: List[Change] = []
+        self.subscribers: List[Callable] = []
+
+    @property
+    def undo(self) -> Optional[List]:
+        """The undo log of the open transaction of the current thread."""
+        return getattr(self.local, "undo", None)
+
+    @undo.setter
+    def undo(self, value: Optional[List]):
+        self.local.undo = value
+
+    @property
+    def deferred(self) -> Optional[str]:
+        """The storage path the open transaction persists on commit."""
+        return getattr(self.local, "deferred", None)
+
+    @deferred.setter
+    def deferred(self, value: Optional[str]):
+        self.local.deferred = value
+
     @classmethod
     def exists(cls, *keys):
         try:
@@ -41,42 +1063,637 @@ class Registry(dict, metaclass=Singleton):
     def set(cls, *args):
         data = cls()
         *keys, value = args
+        with cls.lock(keys[0]), data.gate:
+            if data.undo is not None:
+                cls.record(keys)
+            if data.increments:
+                cls.discard(keys)
 
-        for key in keys[:-1]:
-            data = data.setdefault(key, {})
-        data[keys[-1]] = value
+            old = cls.prepare(keys)
+            data = parent(data, keys, create=True)
+            data[keys[-1]] = value
+            cls.changed(keys, old)
+            cls.touch(*keys)
 
     @classmethod
     def remove(cls, *args):
         data = cls()
+        with cls.lock(args[0]), data.gate:
+            if data.undo is not None:
+                cls.record(args)
+            if data.increments:
+                cls.discard(args)
+
+            old = cls.prepare(args)
+            data = parent(data, args)
+            del data[args[-1]]
+            cls.changed(args, old)
+            cls.touch(*args)
+
+    @classmethod
+    def incr(cls, *args):
+        """
+        Atomically add the amount to the number of the keys path, missing
+        values count as zero.
+
+        The increments are also kept until the next persist, if another
+        process has updated the counter in the meantime they are added to
+        its stored value.
+
+        :return: The new value
+        """
+        *keys, amount = args
+        registry = cls()
+        path = tuple(keys)
+        with cls.lock(keys[0]), registry.gate:
+            value = cls.get(*keys, default=0) + amount
+            delta = registry.increments.pop(path, 0)
+            cls.set(*keys, value)
+            registry.increments[path] = delta + amount
+            if registry.undo is not None:
+                registry.undo.append((path, Increment(amount)))
+        return value
+
+    @classmethod
+    def discard(cls, keys):
+        """Forget the increments of the counters the keys path replaces."""
+        registry = cls()
+        size = len(keys)
+        for path in list(registry.increments):
+            if path[:size] == tuple(keys[: len(path)]):
+                delta = registry.increments.pop(path, 0)
+                if registry.undo is not None:
+                    registry.undo.append((path, Increment(-delta)))
+
+    @classmethod
+    def lock(cls, key) -> threading.RLock:
+        """
+        Return the reentrant lock of the given top level key, that guards
+        the registry writes of the namespace.
+
+        :param str key: The top level key, eg the namespace
+        """
+        registry = cls()
+        lock = registry.locks.get(key)
+        if lock is None:
+            with registry.guard:
+                lock = registry.locks.setdefault(key, threading.RLock())
+        return lock
+
+    @classmethod
+    @contextmanager
+    def locked(cls, cancel: Optional[threading.Event] = None):
+        """
+        Hold the locks of all the namespaces and the registry gate
+        exclusively, writers may hold more than one lock in any order so
+        they are acquired all or none. Writers of namespaces whose lock is
+        created later and open transactions wait on the gate.
+
+        :param cancel: Stop waiting for the locks once this event is set
+        :raise InterruptedError: If the wait was cancelled
+        """
+        registry = cls()
+        while True:
+            with registry.guard:
+                locks = list(registry.locks.values())
+
+            acquired = []
+            for lock in locks:
+                if not lock.acquire(blocking=False):
+                    break
+                acquired.append(lock)
+            else:
+                if registry.gate.acquire():
+                    try:
+                        yield
+                    finally:
+                        registry.gate.release()
+                        for lock in acquired:
+                            lock.release()
+                    return
+
+            for lock in acquired:
+                lock.release()
+            if cancel is not None and cancel.is_set():
+                raise InterruptedError(
+                    "Waiting for the registry was cancelled"
+                )
+            time.sleep(0.001)
+
+    @classmethod
+    def touch(cls, *keys):
+        """Mark the row of the given keys path as modified."""
+        registry = cls()
+        with registry.guard:
+            dirty = registry.dirty
+            if len(keys) == 1:
+                dirty[keys[0]] = None
+            elif dirty.get(keys[0], set()) is not None:
+                dirty.setdefault(keys[0], set()).add(keys[1])
+
+            registry.mutations += 1
+            registry.generations[keys[0]] = (
+                registry.generations.get(keys[0], 0) + 1
+            )
+
+    @classmethod
+    def generation(cls, key=None) -> int:
+        """
+        Return the number of mutations of the given top level key or of the
+        whole registry, since it was loaded.
+
+        :param str key: The top level key, eg the namespace
+        :rtype: int
+        """
+        registry = cls()
+        if key is None:
+            return registry.mutations
+        return registry.generations.get(key, 0)
+
+    @classmethod
+    def fingerprint(cls, keys) -> Optional[str]:
+        """Return the fingerprint of the row of the given keys path."""
+        if keys[0] in cls.quiet:
+            return None
+        return fingerprint(lookup(cls(), keys[:2]))
+
+    @classmethod
+    def prepare(cls, keys) -> Optional[str]:
+        """
+        Keep the row of the given keys path as the merge base, if it's the
+        first modification since the registry was last persisted, and
+        return its fingerprint if there are subscribers.
+
+        Rows are kept by reference, nested writes copy them instead, and
+        top level entries as shallow copies. Entries replaced as a whole
+        after some of their rows were modified and lazily loaded namespaces
+        get no base.
+        """
+        registry = cls()
+        path = tuple(keys[:2])
+        if path not in registry.bases:
+            value = lookup(registry, path, MISSING)
+            if len(path) == 1 and (
+                isinstance(value, Namespace)
+                or isinstance(registry.dirty.get(path[0]), set)
+            ):
+                value = NOTHING
+            elif len(path) == 1 and isinstance(value, dict):
+                value = dict(value)
+            registry.bases[path] = value
 
-        for key in args[:-1]:
-            data = data[key]
-        del data[args[-1]]
+        if not registry.subscribers:
+            return None
+        return cls.fingerprint(keys)
+
+    @classmethod
+    def changed(cls, keys, old: Optional[str]):
+        """
+        Log the change of the row of the given keys path, if any and there
+        are subscribers, otherwise the modified rows are logged when they
+        are persisted, see :meth:`feed`.
+        """
+        if cls().subscribers:
+            new = cls.fingerprint(keys)
+            if old != new:
+                cls.log(keys[0], keys[1] if len(keys) > 1 else None, old, new)
+
+    @classmethod
+    def feed(cls, dirty: Dict):
+        """
+        Log the changes of the given modified rows that were not logged
+        while they were made, against their merge bases.
+
+        :param dict dirty: The dirty entries
+        """
+        registry = cls()
+        with registry.guard:
+            logged = {(c.namespace, c.key) for c in registry.changes}
+            for namespace, keys in dirty.items():
+                if namespace in cls.quiet:
+                    continue
+
+                for key in [None] if keys is None else sorted(keys):
+                    path = (namespace,) if key is None else (namespace, key)
+                    if (namespace, key) in logged:
+                        continue
+
+                    base = registry.bases.get(path, NOTHING)
+                    old = None if base is MISSING else fingerprint(base)
+                    new = fingerprint(lookup(registry, path))
+                    if old != new:
+                        registry.sequence += 1
+                        registry.changes.append(
+                            Change(registry.sequence, namespace, key, old, new)
+                        )
+
+    @classmethod
+    def log(cls, namespace, key, old: Optional[str], new: Optional[str]):
+        """Assign the next sequence number and notify the subscribers."""
+        registry = cls()
+        with registry.guard:
+            registry.sequence += 1
+            change = Change(registry.sequence, namespace, key, old, new)
+            registry.changes.append(change)
+
+        for subscriber in list(registry.subscribers):
+            subscriber(change)
+
+    @classmethod
+    def subscribe(cls, subscriber: Callable) -> Callable:
+        """
+        Call the given function with every change, right after it's made
+        and while the namespace is still locked.
+
+        Sequence numbers are final once the changes are persisted, they are
+        shifted if another process has logged changes in the meantime.
+        """
+        cls().subscribers.append(subscriber)
+        return subscriber
+
+    @classmethod
+    def unsubscribe(cls, subscriber: Callable):
+        with suppress(ValueError):
+            cls().subscribers.remove(subscriber)
+
+    @classmethod
+    def on_merge(cls, func: Callable) -> Callable:
+        """
+        Call the given function after the registry is merged with the
+        changes of another process, eg to rebuild the indexes derived from
+        the merged rows. It runs while the registry is locked and its
+        changes are written with the merge.
+        """
+        cls.mergers.append(func)
+        return func
+
+    @classmethod
+    def cursor(cls, consumer: str) -> int:
+        """Return the last sequence number the given consumer processed."""
+        return cls.get("cursors", consumer, default=0)
+
+    @classmethod
+    def acknowledge(cls, consumer: str, sequence: int):
+        """
+        Store the last sequence number the given consumer processed, it's
+        persisted together with the changes the consumer made.
+
+        The logged changes every consumer has processed are eventually
+        dropped, consumers without a cursor only get the later changes.
+        """
+        cls.set("cursors", consumer, sequence)
+
+    @classmethod
+    def compact(cls, path: str):
+        """Drop the logged changes every consumer has processed."""
+        with FileLock(path, exclusive=True):
+            ChangeLog(path).compact(cls.consumed())
+
+    @classmethod
+    def consumed(cls) -> int:
+        """Return the lowest sequence number the consumers processed."""
+        cursors = cls.get("cursors", default={})
+        return min(cursors.values(), default=cls().sequence)
 
     @classmethod
     def clear(cls):
-        dict.clear(cls())
+        registry = cls()
+        with registry.gate:
+            for key in list(registry):
+                if registry.undo is not None:
+                    cls.record([key])
+                if registry.increments:
+                    cls.discard([key])
+                old = cls.prepare([key])
+                dict.__delitem__(registry, key)
+                cls.changed([key], old)
+                cls.touch(key)
 
     @classmethod
-    def persist(cls, path):
-        with suppress(FileNotFoundError):
-            with open(path, "w") as fp:
-                json.dump(cls(), fp)
+    @contextmanager
+    def transaction(cls):
+        """
+        Undo the registry changes made inside the block if it raises an
+        error, nested transactions act as savepoints.
+
+        The storage file is not written until the outermost transaction
+        commits, :meth:`persist` calls are deferred and applied as one
+        backend write on commit.
+
+        Every thread has its own undo log and the registry isn't persisted
+        from other threads while a transaction is open.
+        """
+        registry = cls()
+        outer = registry.undo is None
+        if outer:
+            with registry.gate:
+                registry.undo = []
+                registry.deferred = None
+                try:
+                    yield registry
+                except BaseException:
+                    cls.rollback()
+                    raise
+                finally:
+                    deferred = registry.deferred
+                    registry.undo = None
+                    registry.deferred = None
+
+            if deferred is not None:
+                cls.persist(deferred)
+            return
+
+        savepoint = len(registry.undo)
+        try:
+            yield registry
+        except BaseException:
+            cls.rollback(savepoint)
+            raise
 
     @classmethod
-    def from_file(cls, path: str):
-        data: Dict = dict()
-        with suppress(FileNotFoundError, JSONDecodeError):
-            with open(path, "r") as cfg:
-                data = json.load(cfg)
-        return cls(data)
+    def record(cls, keys):
+        """Log the current value of the keys path before it's modified."""
+        registry = cls()
+        node = registry
+        for i, key in enumerate(keys):
+            if not isinstance(node, dict) or key not in node:
+                registry.undo.append((tuple(keys[: i + 1]), NOTHING))
+                return
+            node = node[key]
+        registry.undo.append((tuple(keys), node))
 
     @classmethod
-    def cache(
-        cls, key: str, func: Callable, ttl: timedelta, refresh: bool = False
-    ):
+    def rollback(cls, savepoint: int = 0):
+        """Restore the logged values down to the given savepoint."""
         registry = cls()
-        if refresh or key not in registry or registry[key][1] < time.time():
-            registry[key] = (func(), time.time() + ttl.total_seconds())
-        return registry[key][0]
+        while len(registry.undo) > savepoint:
+            keys, value = registry.undo.pop()
+            if isinstance(value, Increment):
+                delta = registry.increments.get(keys, 0) - value.amount
+                registry.increments[keys] = delta
+                if not delta:
+                    del registry.increments[keys]
+                continue
+
+            old = cls.prepare(keys)
+            node = parent(registry, keys)
+            if value is NOTHING:
+                with suppress(KeyError):
+                    del node[keys[-1]]
+            else:
+                node[keys[-1]] = value
+            cls.changed(keys, old)
+            cls.touch(*keys)
+
+    @classmethod
+    def persist(cls, path, cancel: Optional[threading.Event] = None):
+        """
+        Write the modified entries to the storage file and append their
+        changes to the change log, compacted below the consumer cursors once
+        it grows too large. Nothing is written if the registry hasn't changed
+        since it was loaded or last persisted.
+
+        The storage file is locked while writing and if another process has
+        written it in the meantime the modified rows are merged with its
+        current contents field by field and the counter increments are
+        added to the stored counters, see :func:`resolve`.
+
+        :param str path: The storage file path
+        :param cancel: Give up waiting for the registry once this event is
+            set, see :meth:`locked`
+        """
+        registry = cls()
+        if registry.undo is not None:
+            registry.deferred = path
+            return
+
+        backend = registry.backend
+        if backend is None or backend.path != path:
+            backend = JsonBackend(path)
+        elif not registry.dirty:
+            return
+
+        with cls.locked(cancel), FileLock(path, exclusive=True) as lock:
+            stale = lock.generation() != registry.revision
+            if stale and backend is registry.backend and not backend.rewrite:
+                data = backend.merge(
+                    registry,
+                    registry.dirty,
+                    registry.bases,
+                    registry.increments,
+                )
+                if data is not registry:
+                    dict.clear(registry)
+                    dict.update(registry, data)
+                    registry.indexes = dict()
+                for func in cls.mergers:
+                    func()
+
+            with registry.guard:
+                dirty = {
+                    key: None if keys is None else set(keys)
+                    for key, keys in registry.dirty.items()
+                }
+                cls.feed(dirty)
+                changes = list(registry.changes)
+
+            backend.persist(registry, dirty)
+            registry.revision = lock.advance()
+            cls.written(dirty)
+            log = ChangeLog(path)
+            with registry.guard:
+                registry.sequence = log.append(changes)
+                del registry.changes[: len(changes)]
+            if log.should_compact():
+                log.compact(cls.consumed())
+
+    @classmethod
+    def written(cls, dirty: Dict):
+        """
+        Clear the dirty marks, merge bases and counter increments of the
+        given persisted entries, rows modified in the meantime stay dirty.
+        """
+        registry = cls()
+
+        def persisted(path) -> bool:
+            keys = dirty.get(path[0], set())
+            return keys is None or len(path) > 1 and path[1] in keys
+
+        with registry.guard:
+            for key, keys in dirty.items():
+                current = registry.dirty.get(key, set())
+                if keys is None or current is None:
+                    if keys is None:
+                        registry.dirty.pop(key, None)
+                    continue
+                current -= keys
+                if not current:
+                    registry.dirty.pop(key, None)
+
+            for attr in ("bases", "increments"):
+                entries = getattr(registry, attr)
+                for path in [path for path in entries if persisted(path)]:
+                    del entries[path]
+
+    @classmethod
+    def from_file(cls, path: str, source: Optional[str] = None):
+        """
+        Load the registry from the given storage file or one of its
+        snapshots, the snapshot format decides the backend unless it's the
+        base document of the current one, eg the journal snapshots.
+
+        :param str path: The storage file path
+        :param str source: The snapshot path to load instead
+        :raise CorruptedStorage: If the storage file can not be read
+        """
+        if cls not in cls._obj:
+            with FileLock(path) as lock:
+                backend = detect_backend(path)
+                if source is not None:
+                    reader = type(detect_backend(source))
+                    if not isinstance(backend, reader):
+                        backend = reader(path)
+                registry = cls(backend.load(source))
+                registry.backend = backend
+                registry.revision = lock.generation()
+                registry.sequence = ChangeLog(path).last()
+        return cls()
+
+    @classmethod
+    def convert(cls, path: str, backend: str, codec: Optional[str] = None):
+        """
+        Rewrite the storage file with another backend and switch the
+        registry to it.
+
+        :param str path: The storage file path
+        :param str backend: The target backend name
+        :param str codec: The serializer name, defaults to the current one
+        """
+        registry = cls()
+        current = registry.backend.codec if registry.backend else None
+        target_codec = codecs[codec] if codec else current or codecs["json"]
+        for key, value in list(dict.items(registry)):
+            if isinstance(value, Namespace):
+                dict.__setitem__(registry, key, dict(value.items()))
+
+        if registry.backend is not None:
+            registry.backend.close()
+
+        target = next(b for b in backends if b.name == backend)
+        tmp = "{}.tmp".format(path)
+        with suppress(FileNotFoundError):
+            os.remove(tmp)
+
+        with cls.locked(), FileLock(path, exclusive=True) as lock:
+            writer = target(tmp)
+            writer.codec = target_codec
+            writer.persist(registry, {key: None for key in registry})
+            writer.close()
+            target.install(tmp, path)
+            registry.revision = lock.advance()
+
+        registry.backend = target(path)
+        registry.backend.codec = target_codec
+        cls.written({key: None for key in set(registry) | set(registry.dirty)})
+
+
+class Checkpointer:
+    """
+    Persist the registry from a background thread every few seconds or
+    mutations, so long running commands don't lose their progress if they
+    crash or get killed.
+
+    A SIGTERM or SIGINT stops the checkpoints and unwinds the interrupted
+    command, so its open transactions are rolled back, its sessions commit
+    and its storage locks are released before the final persist.
+
+    Only the modified entries are written, on the journal and sqlite
+    backends each checkpoint costs as much as the changes since the last
+    one.
+    """
+
+    poll = 1.0
+    signals = (signal.SIGTERM, signal.SIGINT)
+
+    def __init__(self, path: str, interval: float = 60, mutations=1000):
+        """
+        :param str path: The storage file path
+        :param float interval: The maximum seconds between checkpoints
+        :param int mutations: The maximum mutations between checkpoints
+        """
+        self.path = path
+        self.interval = interval
+        self.mutations = mutations
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        self.handlers: Dict = dict()
+        self.error: Optional[Exception] = None
+
+    def start(self) -> "Checkpointer":
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="checkpointer", daemon=True
+        )
+        self.thread.start()
+        if threading.current_thread() is threading.main_thread():
+            for signum in self.signals:
+                self.handlers[signum] = signal.signal(signum, self.interrupt)
+        return self
+
+    def stop(self):
+        """
+        Stop the thread and restore the previous signal handlers, a pending
+        checkpoint gives up waiting for the registry locks.
+        """
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+        self.handlers = dict()
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        last = time.monotonic()
+        mutations = Registry.generation()
+        while not self.stopped.wait(min(self.poll, self.interval)):
+            due = time.monotonic() - last >= self.interval
+            if due or Registry.generation() - mutations >= self.mutations:
+                self.checkpoint(self.stopped)
+                last = time.monotonic()
+                mutations = Registry.generation()
+
+    def checkpoint(self, cancel: Optional[threading.Event] = None):
+        """
+        Persist the registry, errors are kept for the command to report
+        once the checkpoints are stopped.
+
+        :param cancel: Give up once this event is set, see
+            :meth:`Registry.locked`
+        """
+        try:
+            Registry.persist(self.path, cancel)
+        except InterruptedError:
+            pass
+        except Exception as e:
+            self.error = e
+
+    def interrupt(self, signum, frame):
+        """
+        Stop the checkpoints and hand the signal to the previous handler,
+        the default one is replaced by a ``SystemExit`` with the shell exit
+        status of the signal.
+
+        The handler runs on the main thread in the middle of whatever it was
+        doing, eg holding the storage file lock, so it never touches the
+        storage itself, the final persist happens once the command unwinds.
+        """
+        handler = self.handlers.get(signum, signal.SIG_DFL)
+        if handler == signal.SIG_IGN:
+            return
+
+        self.stopped.set()
+        if callable(handler):
+            return handler(signum, frame)
+        raise SystemExit(128 + signum)
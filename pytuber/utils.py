@@ -1,11 +1,14 @@
 import contextlib
+import os
 from datetime import datetime
 from typing import Optional
 
 import click
 from yaspin import yaspin
 
-from pytuber.storage import Registry
+from pytuber.exceptions import CorruptedStorage
+from pytuber.migrations import migrate
+from pytuber.storage import JsonBackend, Registry
 
 
 def magenta(text):
@@ -36,14 +39,37 @@ def date(timestamp: Optional[int] = None):
     return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
 
 
+def storage_path():
+    return os.path.join(click.get_app_dir("pytuber", False), "storage.db")
+
+
+def cache_path():
+    return os.path.join(click.get_app_dir("pytuber", False), "cache")
+
+
 def init_registry(path: str, version: str):
-    Registry.from_file(path)
+    try:
+        Registry.from_file(path)
+    except CorruptedStorage as e:
+        recover_registry(path, e)
 
     current_version = Registry.get("version", default="0")
-    if current_version == "0":
-        if Registry.exists("configuration", "youtube", "data"):
-            Registry.set(
-                "configuration", "youtube", "data", "quota_limit", 1000000
-            )
+    migrate(path, current_version)
+
+    if current_version != version:
+        Registry.set("version", version)
+
+
+def recover_registry(path: str, error: CorruptedStorage):
+    """
+    Load the newest valid snapshot of a corrupted storage file, whatever
+    backend wrote it.
+    """
+    click.secho(error.format_message(), fg="red")
+    for snapshot in JsonBackend(path).snapshots():
+        with contextlib.suppress(CorruptedStorage):
+            Registry.from_file(path, snapshot)
+            click.secho("Recovered storage from snapshot: {}".format(snapshot))
+            return
 
-    Registry.set("version", version)
+    raise error
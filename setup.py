@@ -34,6 +34,9 @@ if __name__ == "__main__":
                 "Pygments",
                 "check-manifest",
             ],
+            "zstd": ["zstandard"],
+            "orjson": ["orjson"],
+            "msgpack": ["msgpack"],
             "docs": [
                 "sphinx",
                 "sphinx-rtd-theme",
@@ -1,5 +1,8 @@
+from unittest import mock
+
 from pytuber import cli
-from pytuber.core.models import PlaylistManager, TrackManager
+from pytuber.core.models import Membership, PlaylistManager, TrackManager
+from pytuber.storage import Checkpointer
 from tests.utils import CommandTestCase, PlaylistFixture, TrackFixture
 
 
@@ -26,3 +29,28 @@ class CommandCleanTests(CommandTestCase):
 
         self.assertEqual(track.id, TrackManager.find()[0].id)
         self.assertEqual(playlist.id, PlaylistManager.find()[0].id)
+
+    def test_auto_gc(self):
+        track = TrackManager.set(TrackFixture.one().asdict())
+        self.assertEqual([track.id], Membership.orphans())
+
+        result = self.runner.invoke(cli, ["list"])
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual([track.id], TrackManager.keys())
+
+        result = self.runner.invoke(cli, ["--auto-gc", "list"])
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual([], TrackManager.keys())
+        self.assertEqual([], Membership.orphans())
+
+    def test_reports_checkpoint_error(self):
+        def stop(checkpointer, stop=Checkpointer.stop):
+            stop(checkpointer)
+            checkpointer.error = OSError("disk full")
+
+        with mock.patch.object(Checkpointer, "stop", autospec=True) as patch:
+            patch.side_effect = stop
+            result = self.runner.invoke(cli, ["list"])
+
+        self.assertEqual(0, result.exit_code)
+        self.assertIn("Storage checkpoint failed: disk full", result.output)
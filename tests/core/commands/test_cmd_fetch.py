@@ -54,7 +54,7 @@ class CommandFetchTests(CommandTestCase):
             ]
         )
 
-    @mock.patch.object(TrackManager, "set")
+    @mock.patch.object(TrackManager, "set_many")
     @mock.patch.object(PlaylistManager, "exists")
     @mock.patch.object(PlaylistManager, "set")
     @mock.patch.object(YouService, "get_playlist_items")
@@ -72,7 +72,13 @@ class CommandFetchTests(CommandTestCase):
         v_one, v_two = PlaylistItemFixture.get(2)
         get_playlists.return_value = [p_one, p_two]
         get_playlist_items.return_value = [v_one, v_two]
-        set_tracks.side_effect = TrackFixture.get(2)
+        batches = []
+
+        def set_many(items):
+            batches.append(list(items))
+            return ["id_a", "id_b"]
+
+        set_tracks.side_effect = set_many
 
         result = self.runner.invoke(
             cli, ["fetch", "youtube", "--playlists"], catch_exceptions=False
@@ -87,21 +93,16 @@ class CommandFetchTests(CommandTestCase):
         set_playlist.assert_has_calls(
             [mock.call(p_one.asdict()), mock.call(p_two.asdict())]
         )
-        set_tracks.assert_has_calls(
-            [
-                mock.call(
-                    {
-                        "artist": "artist_a",
-                        "name": "name_a",
-                        "youtube_id": "video_id_a",
-                    }
-                ),
-                mock.call(
-                    {
-                        "artist": "artist_b",
-                        "name": "name_b",
-                        "youtube_id": "video_id_b",
-                    }
-                ),
-            ]
-        )
+        expected = [
+            {
+                "artist": "artist_a",
+                "name": "name_a",
+                "youtube_id": "video_id_a",
+            },
+            {
+                "artist": "artist_b",
+                "name": "name_b",
+                "youtube_id": "video_id_b",
+            },
+        ]
+        self.assertEqual([expected], batches)
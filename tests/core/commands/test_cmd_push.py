@@ -59,7 +59,7 @@ class CommandPushTests(CommandTestCase):
     @mock.patch.object(YouService, "remove_playlist_item")
     @mock.patch.object(YouService, "create_playlist_item")
     @mock.patch.object(YouService, "get_playlist_items")
-    @mock.patch.object(TrackManager, "find")
+    @mock.patch.object(TrackManager, "iter_find")
     @mock.patch.object(PlaylistManager, "update")
     @mock.patch.object(PlaylistManager, "find")
     def test_with_tracks(
@@ -84,7 +84,10 @@ class CommandPushTests(CommandTestCase):
         )
 
         find_playlists.return_value = [p_one, p_two]
-        find_tracks.side_effect = [tracks[:3], tracks[3:]]
+        find_tracks.side_effect = [
+            [(t.youtube_id,) for t in tracks[:3]],
+            [(t.youtube_id,) for t in tracks[3:]],
+        ]
 
         get_playlist_items.side_effect = [
             [items[0], items[2]],
@@ -119,4 +122,18 @@ class CommandPushTests(CommandTestCase):
             ]
         )
         remove_playlist_item.assert_called_once_with(items[2])
+        find_tracks.assert_has_calls(
+            [
+                mock.call(
+                    fields=("youtube_id",),
+                    youtube_id__isnull=False,
+                    id__in=p_one.tracks,
+                ),
+                mock.call(
+                    fields=("youtube_id",),
+                    youtube_id__isnull=False,
+                    id__in=p_two.tracks,
+                ),
+            ]
+        )
         update_playlist.assert_called_once_with(p_one, dict(uploaded=101))
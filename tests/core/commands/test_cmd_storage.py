@@ -0,0 +1,99 @@
+from unittest import mock
+
+from pytuber import cli
+from pytuber.core.integrity import Problem
+from pytuber.core.vacuum import Usage
+from pytuber.storage import Registry
+from tests.utils import CommandTestCase
+
+
+class CommandStorageTests(CommandTestCase):
+    @mock.patch("pytuber.core.commands.cmd_storage.storage_path")
+    @mock.patch.object(Registry, "convert")
+    def test_convert(self, convert, storage_path):
+        storage_path.return_value = "storage.db"
+        result = self.runner.invoke(cli, ["storage", "convert", "sqlite"])
+
+        self.assertEqual(0, result.exit_code)
+        self.assertOutput(["Storage converted to sqlite!"], result.output)
+        convert.assert_called_once_with("storage.db", "sqlite", None)
+
+        result = self.runner.invoke(
+            cli, ["storage", "convert", "gzip", "--codec", "json"]
+        )
+        self.assertEqual(0, result.exit_code)
+        convert.assert_called_with("storage.db", "gzip", "json")
+
+    @mock.patch("pytuber.core.commands.cmd_storage.storage_path")
+    @mock.patch("pytuber.core.commands.cmd_storage.export_delta")
+    def test_export_delta(self, export_delta, storage_path):
+        storage_path.return_value = "storage.db"
+        export_delta.return_value = 12
+        result = self.runner.invoke(
+            cli, ["storage", "export-delta", "--since", "5"]
+        )
+
+        self.assertEqual(0, result.exit_code)
+        self.assertOutput(["Exported changes up to: 12"], result.output)
+        export_delta.assert_called_once_with("storage.db", 5, mock.ANY)
+
+    @mock.patch("pytuber.core.commands.cmd_storage.apply_delta")
+    def test_apply_delta(self, apply_delta):
+        apply_delta.return_value = (10, 2, 12)
+        result = self.runner.invoke(cli, ["storage", "apply-delta"], input="")
+
+        self.assertEqual(0, result.exit_code)
+        self.assertOutput(
+            ["Applied changes up to: 12, updated: 10, removed: 2"],
+            result.output,
+        )
+
+    @mock.patch("pytuber.core.commands.cmd_storage.check_storage")
+    def test_check(self, check_storage):
+        check_storage.return_value = []
+        result = self.runner.invoke(cli, ["storage", "check"])
+
+        self.assertEqual(0, result.exit_code)
+        self.assertOutput(["No problems found!"], result.output)
+        check_storage.assert_called_once_with(False)
+
+        check_storage.return_value = [
+            Problem("playlist", "p", "Missing tracks: a")
+        ]
+        result = self.runner.invoke(cli, ["storage", "check"])
+        expected = (
+            "Namespace    Key    Problem",
+            "-----------  -----  -----------------",
+            "playlist     p      Missing tracks: a",
+            "Found 1 problem(s), use --repair to fix them!",
+        )
+        self.assertOutput(expected, result.output)
+
+        result = self.runner.invoke(cli, ["storage", "check", "--repair"])
+        self.assertEqual(
+            "Repaired 1 problem(s)!", result.output.split("\n")[-2]
+        )
+        check_storage.assert_called_with(True)
+
+    @mock.patch("pytuber.core.commands.cmd_storage.storage_size")
+    @mock.patch("pytuber.core.commands.cmd_storage.storage_path")
+    @mock.patch("pytuber.core.commands.cmd_storage.vacuum_storage")
+    def test_vacuum(self, vacuum_storage, storage_path, storage_size):
+        storage_path.return_value = "storage.db"
+        storage_size.side_effect = [3 * 1024 * 1024, 1024 * 1024]
+        vacuum_storage.return_value = [
+            (Usage("track", 10, 2048), Usage("track", 5, 1024)),
+            (Usage("version", 1, 3), Usage("version", 1, 3)),
+        ]
+        result = self.runner.invoke(cli, ["storage", "vacuum"])
+
+        expected = (
+            "Namespace      Records    After    Size    After",
+            "-----------  ---------  -------  ------  -------",
+            "track               10        5   2.0KB    1.0KB",
+            "version              1        1      3B       3B",
+            "Storage size: 3.0MB -> 1.0MB",
+        )
+        self.assertEqual(0, result.exit_code)
+        self.assertOutput(expected, result.output)
+        vacuum_storage.assert_called_once_with("storage.db")
@@ -0,0 +1,101 @@
+import os
+import tempfile
+
+from pytuber.cache import Cache
+from pytuber.core.integrity import Problem, check
+from pytuber.core.models import Membership, Track
+from pytuber.storage import Registry
+from tests.utils import TestCase
+
+
+class IntegrityTests(TestCase):
+    def setUp(self):
+        super(IntegrityTests, self).setUp()
+        self.a = Track(artist="a", name="a").asdict()
+        self.b = Track(artist="b", name="b").asdict()
+        Registry.set("track", {self.a["id"]: self.a, self.b["id"]: self.b})
+        Registry.set(
+            "playlist",
+            dict(p=dict(id="p", tracks=[self.a["id"], self.b["id"]])),
+        )
+
+    def test_check_valid(self):
+        Registry.set("youtube_quota", {"20190101": 100})
+        Membership.ensure()
+
+        self.assertEqual([], check())
+        self.assertEqual([], check(repair=True))
+
+    def test_check_references(self):
+        moved = dict(self.b, id="foo")
+        Registry.set("track", "foo", moved)
+        Registry.remove("track", self.b["id"])
+        Registry.set("track", "bar", dict(id="bar"))
+        Registry.set("playlist", "p", "tracks", [self.a["id"], "foo", "baz"])
+        Membership.rebuild()
+        Registry.set("playlist", "q", "invalid")
+
+        expected = [
+            Problem("track", "foo", "Id doesn't match: " + self.b["id"]),
+            Problem("track", "bar", "Invalid track record"),
+            Problem("playlist", "p", "Missing tracks: baz"),
+            Problem("playlist", "q", "Invalid playlist record"),
+        ]
+        self.assertEqual(expected, check())
+        self.assertEqual("foo", Registry.get("track", "foo", "id"))
+
+        self.assertEqual(expected, check(repair=True))
+        self.assertEqual(
+            [self.a["id"], self.b["id"]], list(Registry.get("track"))
+        )
+        self.assertEqual(self.b, Registry.get("track", self.b["id"]))
+        self.assertEqual(
+            dict(p=dict(id="p", tracks=[self.a["id"], self.b["id"]])),
+            Registry.get("playlist"),
+        )
+        self.assertEqual(["p"], Membership.playlists(self.b["id"]))
+        self.assertEqual([], check())
+
+    def test_check_membership(self):
+        Membership.ensure()
+        Registry.set("orphan", self.a["id"], 1)
+
+        expected = [Problem("membership", "-", "Index is out of date")]
+        self.assertEqual(expected, check())
+        self.assertEqual(expected, check(repair=True))
+        self.assertEqual([], Membership.orphans())
+        self.assertEqual([], check())
+
+    def test_check_quota(self):
+        Registry.set("youtube_quota", {"1": 5, "2": "foo", "3": None})
+        expected = [
+            Problem("youtube_quota", "2", "Invalid quota usage"),
+            Problem("youtube_quota", "3", "Invalid quota usage"),
+        ]
+        self.assertEqual(expected, check(repair=True))
+        self.assertEqual({"1": 5}, Registry.get("youtube_quota"))
+
+        Registry.set("youtube_quota", 10)
+        expected = [Problem("youtube_quota", "-", "Invalid quota record")]
+        self.assertEqual(expected, check(repair=True))
+        self.assertEqual({}, Registry.get("youtube_quota"))
+
+    def test_check_cache(self):
+        Cache.configure(tempfile.mkdtemp())
+        Cache.set("foo", [1, 2], 2 ** 32)
+        Cache.set("bar", [3], 2 ** 32)
+        os.replace(Cache.filename("bar"), Cache.filename("thud"))
+        with open(Cache.filename("baz"), "w") as fp:
+            fp.write("[1, ")
+
+        names = sorted(
+            os.path.basename(Cache.filename(key)) for key in ("thud", "baz")
+        )
+        actual = check()
+        self.assertEqual(names, sorted(p.key for p in actual))
+        self.assertEqual({"cache"}, {p.namespace for p in actual})
+
+        check(repair=True)
+        self.assertEqual(
+            [Cache.filename("foo")], [path for path, _ in Cache.files()]
+        )
@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+from pytuber.core.models import Playlist, Provider
+from pytuber.core.query import Condition, matcher, parse
+
+
+class ConditionTests(TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            Condition(field="provider", op="eq", value="last.fm"),
+            Condition.parse(Playlist, "provider", Provider.lastfm),
+        )
+        self.assertEqual(
+            Condition(field="id", op="in", value=dict(a=None, b=None)),
+            Condition.parse(Playlist, "id__in", ["a", "b"]),
+        )
+        self.assertEqual(
+            Condition(field="synced", op="gte", value=10),
+            Condition.parse(Playlist, "synced__gte", 10),
+        )
+        self.assertEqual(
+            Condition(field="youtube_id", op="isnull", value=False),
+            Condition.parse(Playlist, "youtube_id__isnull", False),
+        )
+        self.assertEqual("call", Condition.parse(Playlist, "id", len).op)
+
+    def test_parse_fails_fast(self):
+        cases = [
+            (("foo", 1), "Unknown Playlist field: foo"),
+            (("id__like", "a"), "Unknown operator: id__like"),
+            (("id", 1), "Expected str for: id, got int"),
+            (("synced", "1"), "Expected int for: synced, got str"),
+            (("synced__gt", "1"), "Expected a number for: synced__gt"),
+            (("id__in", "abc"), "Expected a collection for: id__in"),
+            (("id__isnull", 0), "Expected a boolean for: id__isnull"),
+            (("id__ne", len), "Callable condition with operator: id__ne"),
+        ]
+        for args, message in cases:
+            with self.assertRaises(TypeError) as cm:
+                Condition.parse(Playlist, *args)
+            self.assertEqual(message, str(cm.exception))
+
+    def test_matcher(self):
+        records = [
+            dict(id="a", synced=None, youtube_id=None, tracks=["x"]),
+            dict(id="b", synced=10, youtube_id="y", tracks=[]),
+            dict(id="c", synced=20, youtube_id="z", tracks=["x", "y"]),
+        ]
+
+        def find(**kwargs):
+            match = matcher(parse(Playlist, kwargs))
+            return [r["id"] for r in records if match(r)]
+
+        self.assertEqual(["a", "b", "c"], find())
+        self.assertEqual(["b"], find(id="b"))
+        self.assertEqual(["a"], find(youtube_id=None))
+        self.assertEqual(["b", "c"], find(youtube_id__ne=None))
+        self.assertEqual(["a", "c"], find(id__ne="b"))
+        self.assertEqual(["b", "c"], find(youtube_id__isnull=False))
+        self.assertEqual(["a", "c"], find(id__in=("a", "c", "d")))
+        self.assertEqual([], find(tracks__in=[("x",)]))
+        self.assertEqual(["c"], find(synced__gt=10))
+        self.assertEqual(["b", "c"], find(synced__gte=10))
+        self.assertEqual(["b"], find(synced__lt=20, youtube_id="y"))
+        self.assertEqual(["b"], find(synced__lte=10.5))
+        self.assertEqual(["a", "c"], find(tracks=lambda x: "x" in x))
@@ -0,0 +1,148 @@
+import io
+import json
+import os
+import tempfile
+
+from pytuber.core.models import Membership, PlaylistManager, TrackManager
+from pytuber.core.replication import apply_delta, export_delta
+from pytuber.exceptions import InvalidDelta
+from pytuber.storage import ChangeLog, Registry
+from tests.utils import PlaylistFixture, TestCase, TrackFixture
+
+
+class ReplicationTests(TestCase):
+    def setUp(self):
+        super(ReplicationTests, self).setUp()
+        Registry._obj = {}
+        self.path = os.path.join(tempfile.mkdtemp(), "storage.db")
+
+    def export(self, since=0):
+        fp = io.StringIO()
+        sequence = export_delta(self.path, since, fp)
+        return (
+            sequence,
+            [json.loads(line) for line in fp.getvalue().splitlines()],
+        )
+
+    def test_export_delta(self):
+        tracks = TrackFixture.get(3)
+        TrackManager.set_many(t.asdict() for t in tracks)
+        playlist = PlaylistFixture.one(tracks=["id_a", "id_b"])
+        PlaylistManager.set(playlist.asdict())
+        Registry.persist(self.path)
+        since = Registry().sequence
+
+        TrackManager.update(tracks[0], dict(youtube_id="y"))
+        TrackManager.update(tracks[0], dict(youtube_id="z"))
+        TrackManager.remove("id_c")
+        Registry.set("version", "1")
+        Registry.persist(self.path)
+
+        sequence, lines = self.export(since)
+        self.assertEqual(Registry().sequence, sequence)
+        self.assertEqual(
+            [
+                dict(format="pytuber-delta", since=since, sequence=sequence),
+                ["track", "id_a", TrackManager.get("id_a").asdict()],
+                ["track", "id_c", None],
+            ],
+            lines,
+        )
+
+        sequence, lines = self.export()
+        self.assertEqual(
+            ["id_a", "id_b", "id_c", "id_a"], [line[1] for line in lines[1:]]
+        )
+        self.assertEqual(["playlist", "id_a"], lines[-1][:2])
+
+        header = dict(
+            format="pytuber-delta", since=sequence, sequence=sequence
+        )
+        self.assertEqual((sequence, [header]), self.export(sequence))
+        self.assertEqual(sequence, Registry.cursor("export-delta"))
+
+    def test_export_delta_after_compaction(self):
+        tracks = TrackFixture.get(2)
+        TrackManager.set_many(t.asdict() for t in tracks)
+        Registry.persist(self.path)
+        ChangeLog(self.path).compact(Registry().sequence)
+
+        TrackManager.update(tracks[0], dict(youtube_id="y"))
+        Registry.persist(self.path)
+
+        sequence, lines = self.export(since=1)
+        self.assertEqual(Registry().sequence, sequence)
+        self.assertEqual(["id_a", "id_b"], [line[1] for line in lines[1:]])
+
+        since = ChangeLog(self.path).start()
+        sequence, lines = self.export(since)
+        self.assertEqual(["id_a"], [line[1] for line in lines[1:]])
+
+    def test_apply_delta(self):
+        local = PlaylistFixture.one(youtube_id="yt", tracks=["id_c"])
+        TrackManager.set(TrackFixture.one(num=2).asdict())
+        PlaylistManager.set(local.asdict())
+        TrackManager.set(TrackFixture.one(num=3).asdict())
+
+        remote = PlaylistFixture.one(title="new", tracks=["id_a", "id_b"])
+        delta = [
+            dict(format="pytuber-delta", since=0, sequence=7),
+            ["track", "id_a", TrackFixture.one().asdict()],
+            ["track", "id_b", TrackFixture.one(num=1).asdict()],
+            ["track", "id_c", None],
+            ["track", "id_d", None],
+            ["track", "id_e", None],
+            ["playlist", "id_a", remote.asdict()],
+        ]
+        fp = io.StringIO("\n".join(json.dumps(line) for line in delta))
+
+        self.assertEqual((3, 2, 7), apply_delta(fp))
+
+        actual = PlaylistManager.get("id_a")
+        self.assertEqual("new", actual.title)
+        self.assertEqual("yt", actual.youtube_id)
+        self.assertEqual(["id_a", "id_b"], actual.tracks)
+        self.assertEqual(["id_a", "id_b"], TrackManager.keys())
+        self.assertEqual(["id_a"], Membership.playlists("id_a"))
+        self.assertEqual([], Membership.orphans())
+        self.assertEqual(7, Registry.get("replication", "applied"))
+
+    def test_apply_delta_rolls_back_invalid_records(self):
+        delta = [
+            dict(format="pytuber-delta", since=0, sequence=2),
+            ["track", "id_a", TrackFixture.one().asdict()],
+            ["configuration", "youtube", None],
+        ]
+        fp = io.StringIO("\n".join(json.dumps(line) for line in delta))
+
+        with self.assertRaises(InvalidDelta) as cm:
+            apply_delta(fp)
+
+        self.assertEqual(
+            "Unknown delta namespace: configuration", cm.exception.message
+        )
+        self.assertEqual([], TrackManager.keys())
+
+        with self.assertRaises(InvalidDelta):
+            apply_delta(io.StringIO("foo"))
+
+    def test_apply_delta_invalid_rows(self):
+        playlist = dict(PlaylistFixture.one().asdict(), foo="bar")
+        track = TrackFixture.one().asdict()
+        partial = {k: v for k, v in track.items() if k != "name"}
+        for record in (
+            ["track", "t", 5],
+            ["playlist", playlist["id"], playlist],
+            ["track", None, None],
+            ["track", track["id"], partial],
+            ["track", "other", track],
+        ):
+            delta = [dict(format="pytuber-delta", since=0, sequence=2), record]
+            fp = io.StringIO("\n".join(json.dumps(line) for line in delta))
+
+            with self.assertRaises(InvalidDelta) as cm:
+                apply_delta(fp)
+
+            self.assertEqual(
+                "Invalid delta record at line 2", cm.exception.message
+            )
@@ -1,3 +1,7 @@
+import os
+import shutil
+import tempfile
+import threading
 from datetime import datetime, timedelta
 from unittest import mock
 
@@ -7,6 +11,7 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from pytuber.core.models import ConfigManager
 from pytuber.core.services import YouService
 from pytuber.exceptions import NotFound
+from pytuber.storage import Registry
 from tests.utils import (
     PlaylistFixture,
     PlaylistItemFixture,
@@ -205,6 +210,44 @@ class YouServiceTests(TestCase):
         get_user_info.assert_called_once_with("foo", scopes=YouService.scopes)
         build.assert_called_once_with("youtube", "v3", credentials="creds")
 
+    @mock.patch.object(YouService, "quota_date")
+    def test_update_quota(self, quota_date):
+        quota_date.return_value = "2019-01-01"
+        YouService.update_quota(5)
+        YouService.update_quota(10)
+        self.assertEqual({"2019-01-01": 15}, Registry.get("youtube_quota"))
+
+        quota_date.return_value = "2019-01-02"
+        workers = [
+            threading.Thread(
+                target=lambda: [YouService.update_quota(1) for _ in range(500)]
+            )
+            for _ in range(4)
+        ]
+        [worker.start() for worker in workers]
+        [worker.join() for worker in workers]
+        self.assertEqual({"2019-01-02": 2000}, Registry.get("youtube_quota"))
+
+    @mock.patch.object(YouService, "quota_date")
+    def test_update_quota_from_concurrent_processes(self, quota_date):
+        quota_date.return_value = "2019-01-01"
+        path = os.path.join(tempfile.mkdtemp(), "storage.db")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.addCleanup(setattr, Registry, "_obj", {})
+
+        processes = []
+        for _ in range(2):
+            Registry._obj = {}
+            Registry.from_file(path)
+            processes.append(Registry._obj)
+
+        for process in processes:
+            Registry._obj = process
+            YouService.update_quota(100)
+            Registry.persist(path)
+
+        self.assertEqual({"2019-01-01": 200}, Registry.get("youtube_quota"))
+
     def test_quota_date(self):
         expected = (datetime.utcnow() - timedelta(hours=8)).strftime("%Y%m%d")
         self.assertEqual(expected, YouService.quota_date())
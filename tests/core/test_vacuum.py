@@ -0,0 +1,89 @@
+import os
+import tempfile
+import time
+from unittest import mock
+
+from pytuber.cache import Cache
+from pytuber.core.models import Membership, Track
+from pytuber.core.services import YouService
+from pytuber.core.vacuum import Usage, usage, vacuum
+from pytuber.storage import ChangeLog, JsonBackend, Registry
+from tests.utils import TestCase
+
+
+class VacuumTests(TestCase):
+    def setUp(self):
+        super(VacuumTests, self).setUp()
+        Registry._obj = {}
+        self.path = os.path.join(tempfile.mkdtemp(), "storage.db")
+        Cache.configure(tempfile.mkdtemp())
+
+    def test_usage(self):
+        Registry.set("track", dict(a=dict(id="a"), b=dict(id="b")))
+        Registry.set("version", "1")
+        Cache.set("foo", [1, 2], time.time() + 60)
+
+        self.assertEqual(
+            dict(
+                track=Usage("track", 2, 36),
+                version=Usage("version", 1, 3),
+                cache=Usage("cache", 1, 15),
+            ),
+            usage(),
+        )
+
+    @mock.patch.object(YouService, "quota_date", return_value="20190102")
+    def test_vacuum(self, *args):
+        a = Track(artist="a", name="a").asdict()
+        b = Track(artist="b", name="b").asdict()
+        Registry.set("track", {a["id"]: a, b["id"]: b})
+        Registry.persist(self.path)
+        Registry.set(
+            "playlist",
+            dict(p=dict(id="p", tracks=[a["id"]]), q=dict(id="q", tracks=[])),
+        )
+        Registry.set("youtube_quota", {"20190101": 10, "20190102": 5})
+        Registry.set("history", dict(limit=10, user=None, foo="bar"))
+        Cache.set("foo", [1], time.time() + 60)
+        Cache.set("bar", [2], time.time() + 60)
+        os.utime(Cache.filename("bar"), (0, time.time() - 60))
+        Membership.ensure()
+        Registry.persist(self.path)
+
+        report = {old.namespace: (old, new) for old, new in vacuum(self.path)}
+
+        self.assertEqual([a["id"]], list(Registry.get("track")))
+        self.assertEqual(["p"], list(Registry.get("playlist")))
+        self.assertEqual({"20190102": 5}, Registry.get("youtube_quota"))
+        self.assertEqual(dict(limit=10), Registry.get("history"))
+        self.assertEqual(
+            [Cache.filename("foo")], [path for path, _ in Cache.files()]
+        )
+        self.assertEqual(dict(Registry()), JsonBackend(self.path).load())
+        self.assertEqual({}, Registry().dirty)
+        snapshots = JsonBackend(self.path).snapshots()
+        self.assertEqual([self.path + ".1"], snapshots)
+        self.assertEqual(
+            [a["id"], b["id"]],
+            list(JsonBackend(self.path).load(snapshots[0])["track"]),
+        )
+        self.assertEqual(Registry().sequence, ChangeLog(self.path).start())
+        self.assertEqual([], list(ChangeLog(self.path).read()))
+
+        counts = {
+            key: (old.count, new.count) for key, (old, new) in report.items()
+        }
+        self.assertEqual(
+            dict(
+                cache=(2, 1),
+                history=(3, 1),
+                membership=(1, 1),
+                orphan=(1, 0),
+                playlist=(2, 1),
+                track=(2, 1),
+                youtube_quota=(2, 1),
+            ),
+            counts,
+        )
+        old, new = report["track"]
+        self.assertGreater(old.size, new.size)
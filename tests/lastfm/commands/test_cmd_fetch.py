@@ -22,12 +22,12 @@ class CommandFetchTests(CommandTestCase):
         abort.assert_called_once_with()
         self.assertEqual(1, secho.call_count)
 
-    @mock.patch.object(TrackManager, "set")
+    @mock.patch.object(TrackManager, "set_many")
     @mock.patch.object(LastService, "get_tags")
     @mock.patch.object(LastService, "get_tracks")
     @mock.patch.object(PlaylistManager, "update")
     @mock.patch.object(PlaylistManager, "find")
-    def test_with_tracks(self, find, update, get_tracks, get_tags, set):
+    def test_with_tracks(self, find, update, get_tracks, get_tags, set_many):
 
         tracks = TrackFixture.get(6)
         playlists = PlaylistFixture.get(2)
@@ -36,7 +36,13 @@ class CommandFetchTests(CommandTestCase):
             for track in tracks
         ]
 
-        set.side_effect = tracks
+        batches = []
+
+        def set_tracks(items):
+            batches.append(list(items))
+            return ["id_" + data["name"][-1] for data in batches[-1]] * 2
+
+        set_many.side_effect = set_tracks
         find.return_value = playlists
         get_tracks.side_effect = [
             [last_tracks[0], last_tracks[1], last_tracks[2]],
@@ -51,15 +57,20 @@ class CommandFetchTests(CommandTestCase):
         get_tracks.assert_has_calls(
             [mock.call(a=0, type="type_a"), mock.call(b=1, type="type_b")]
         )
-        set.assert_has_calls(
+        self.assertEqual(
             [
-                mock.call({"artist": "artist_a", "name": "name_a"}),
-                mock.call({"artist": "artist_b", "name": "name_b"}),
-                mock.call({"artist": "artist_c", "name": "name_c"}),
-                mock.call({"artist": "artist_d", "name": "name_d"}),
-                mock.call({"artist": "artist_e", "name": "name_e"}),
-                mock.call({"artist": "artist_f", "name": "name_f"}),
-            ]
+                [
+                    {"artist": "artist_a", "name": "name_a"},
+                    {"artist": "artist_b", "name": "name_b"},
+                    {"artist": "artist_c", "name": "name_c"},
+                ],
+                [
+                    {"artist": "artist_d", "name": "name_d"},
+                    {"artist": "artist_e", "name": "name_e"},
+                    {"artist": "artist_f", "name": "name_f"},
+                ],
+            ],
+            batches,
         )
 
         update.assert_has_calls(
@@ -97,7 +108,4 @@ class CommandFetchTests(CommandTestCase):
 
         kwargs = find.call_args_list[0][1]
         self.assertEqual(Provider.lastfm, kwargs["provider"])
-
-        self.assertTrue(kwargs["id"](1))
-        self.assertTrue(kwargs["id"](2))
-        self.assertFalse(kwargs["id"](3))
+        self.assertEqual((1, 2), kwargs["id__in"])
@@ -5,11 +5,11 @@ from unittest import mock
 from pydrag import Artist, Tag, Track, User, constants
 from pydrag.models.common import ListModel
 
+from pytuber.cache import Cache
 from pytuber.core.models import ConfigManager, Provider
 from pytuber.exceptions import NotFound
 from pytuber.lastfm.models import PlaylistType
 from pytuber.lastfm.services import LastService
-from pytuber.storage import Registry
 from tests.utils import TestCase
 
 
@@ -145,7 +145,7 @@ class LastServiceTests(TestCase):
         get_top_tracks.assert_called_once_with(limit=10)
 
     @mock.patch.object(LastService, "assert_config")
-    @mock.patch("pytuber.storage.time.time")
+    @mock.patch("pytuber.cache.time.time")
     @mock.patch.object(Tag, "get_top_tags")
     def test_get_tags(self, get_top_tags, time, assert_config):
         time.return_value = 1
@@ -169,14 +169,14 @@ class LastServiceTests(TestCase):
             ]
         )
 
-        tags, ttl = Registry.get("last.fm_tag_list")
+        tags, ttl = Cache.memory["last.fm_tag_list"]
         self.assertEqual(1000, len(tags))
         self.assertEqual({"name": 0}, tags[0])
         self.assertEqual(timedelta(days=30, seconds=1).total_seconds(), ttl)
         assert_config.assert_called_once()
 
     @mock.patch.object(LastService, "assert_config")
-    @mock.patch("pytuber.storage.time.time")
+    @mock.patch("pytuber.cache.time.time")
     @mock.patch.object(Artist, "find")
     def test_get_artist(self, find, time, assert_config):
         time.return_value = 1
@@ -188,14 +188,14 @@ class LastServiceTests(TestCase):
 
         find.assert_called_once_with("quueee")
 
-        artist, ttl = Registry.get("last.fm_artist_quueee")
+        artist, ttl = Cache.memory["last.fm_artist_quueee"]
         self.assertEqual({"name": "Queen"}, artist)
 
         self.assertEqual(timedelta(days=30, seconds=1).total_seconds(), ttl)
         assert_config.assert_called_once()
 
     @mock.patch.object(LastService, "assert_config")
-    @mock.patch("pytuber.storage.time.time")
+    @mock.patch("pytuber.cache.time.time")
     @mock.patch.object(User, "find")
     def test_get_user(self, find, time, assert_config):
         time.return_value = 1
@@ -206,7 +206,7 @@ class LastServiceTests(TestCase):
 
         find.assert_called_once_with("rj")
 
-        user, ttl = Registry.get("last.fm_user_rj")
+        user, ttl = Cache.memory["last.fm_user_rj"]
         self.assertEqual(self.get_user().to_dict(), user)
 
         self.assertEqual(timedelta(hours=24, seconds=1).total_seconds(), ttl)
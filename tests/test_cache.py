@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import TestCase, mock
+
+from pytuber.cache import Cache
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmp, "cache")
+        Cache.configure(self.directory)
+
+    def tearDown(self):
+        Cache.configure(None)
+        shutil.rmtree(self.tmp)
+
+    @mock.patch("pytuber.cache.time.time")
+    def test_fetch(self, time):
+        def callme(ttl, value, refresh=False):
+            return Cache.fetch(
+                key="foo",
+                ttl=timedelta(seconds=ttl),
+                func=lambda: value,
+                refresh=refresh,
+            )
+
+        time.return_value = 10
+        self.assertEqual("first", callme(10, "first"))
+        self.assertEqual(("first", 20.0), Cache.memory["foo"])
+
+        time.return_value = 20.1
+        self.assertEqual("second", callme(1, "second"))
+        self.assertEqual(("second", 21.1), Cache.memory["foo"])
+
+        time.return_value = 20.5
+        self.assertEqual("second", callme(1, "third"))
+
+        time.return_value = 20.8
+        self.assertEqual("third", callme(100, "third", refresh=True))
+        self.assertEqual(("third", 120.8), Cache.memory["foo"])
+
+    @mock.patch("pytuber.cache.time.time", return_value=100)
+    def test_disk_tier(self, *args):
+        Cache.set("foo", {"a": 1}, 200)
+        self.assertEqual(1, len(os.listdir(self.directory)))
+
+        Cache.configure(self.directory)
+        self.assertEqual(dict(), Cache.memory)
+        self.assertEqual({"a": 1}, Cache.get("foo"))
+        self.assertEqual(({"a": 1}, 200), Cache.memory["foo"])
+        self.assertIsNone(Cache.get("bar"))
+
+        Cache.remove("foo")
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertIsNone(Cache.get("foo"))
+
+    def test_get_expired(self):
+        Cache.set("foo", 1, 50)
+        Cache.configure(self.directory)
+        self.assertEqual("-", Cache.get("foo", "-"))
+
+    @mock.patch("pytuber.cache.time.time", return_value=100)
+    def test_evict(self, *args):
+        Cache.set("new", "a", 200)
+        Cache.set("old", "a", 200)
+        os.utime(Cache.filename("old"), (60, 200))
+        os.utime(Cache.filename("new"), (70, 200))
+        with open(Cache.filename("expired"), "w") as fp:
+            fp.write('["expired", "a"]')
+        os.utime(Cache.filename("expired"), (60, 99))
+
+        self.assertEqual(1, Cache.evict())
+        self.assertEqual(2, len(Cache.files()))
+
+        with mock.patch.object(Cache, "max_entries", 1):
+            self.assertEqual(1, Cache.evict())
+        self.assertEqual(
+            [Cache.filename("new")], [f for f, _ in Cache.files()]
+        )
+
+        Cache.set("old", "a", 200)
+        os.utime(Cache.filename("old"), (60, 200))
+        with mock.patch.object(Cache, "max_bytes", 15):
+            self.assertEqual(1, Cache.evict())
+        self.assertEqual(
+            [Cache.filename("new")], [f for f, _ in Cache.files()]
+        )
+
+    @mock.patch("pytuber.cache.time.time", return_value=100)
+    def test_persist(self, *args):
+        Cache.set("expired", "a", 200)
+        os.utime(Cache.filename("expired"), (60, 99))
+        Cache.set("foo", "a", 200)
+        self.assertEqual(2, len(Cache.files()))
+
+        self.assertEqual(1, Cache.persist())
+        self.assertEqual(0, Cache.persist())
+        self.assertEqual(
+            [Cache.filename("foo")], [f for f, _ in Cache.files()]
+        )
+
+        self.addCleanup(setattr, Cache, "max_entries", Cache.max_entries)
+        Cache.configure(self.directory, max_entries=0)
+        self.assertEqual(0, Cache.persist())
+        Cache.set("bar", "a", 200)
+        self.assertEqual(2, Cache.persist())
+        self.assertEqual([], Cache.files())
+
+    def test_clear(self):
+        Cache.set("foo", 1, 2 ** 40)
+        Cache.clear()
+        self.assertEqual(dict(), Cache.memory)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_memory_only(self):
+        Cache.configure(None)
+        Cache.set("foo", 1, 2 ** 40)
+        self.assertEqual(1, Cache.get("foo"))
+        self.assertEqual([], Cache.files())
@@ -0,0 +1,70 @@
+import io
+import unittest
+from unittest import TestCase, mock
+
+from pytuber.codecs import (
+    JsonCodec,
+    MsgpackCodec,
+    OrjsonCodec,
+    codecs,
+    get_codec,
+    read_header,
+    write_header,
+)
+from pytuber.storage import Registry
+
+data = dict(
+    version="20.1",
+    track=dict(a=dict(id="a", artist="b", name="c", youtube_id=None)),
+    youtube_quota={"20190101": 100},
+)
+
+
+class CodecTests(TestCase):
+    def assert_roundtrip(self, codec):
+        fp = io.BytesIO()
+        write_header(fp, codec)
+        codec.dump(data, fp)
+        fp.seek(0)
+
+        reader = io.BufferedReader(fp)
+        self.assertIs(codec, read_header(reader))
+        self.assertEqual(data, codec.load(reader))
+        return fp.getvalue()
+
+    def test_json(self):
+        content = self.assert_roundtrip(codecs["json"])
+        self.assertTrue(content.startswith(b'{"version": "20.1"'))
+
+    @unittest.skipIf(not OrjsonCodec.available, "orjson is not installed")
+    def test_orjson(self):
+        content = self.assert_roundtrip(codecs["orjson"])
+        self.assertTrue(content.startswith(b'#codec:orjson\n{"version"'))
+
+        Registry._obj = {}
+        self.addCleanup(setattr, Registry, "_obj", {})
+        fp = io.BytesIO()
+        codecs["orjson"].dump(Registry(data), fp)
+        self.assertEqual(data, JsonCodec().load(io.BytesIO(fp.getvalue())))
+
+    @unittest.skipIf(not MsgpackCodec.available, "msgpack is not installed")
+    def test_msgpack(self):  # pragma: no cover
+        content = self.assert_roundtrip(codecs["msgpack"])
+        self.assertTrue(content.startswith(b"#codec:msgpack\n"))
+
+    def test_get_codec(self):
+        self.assertIs(codecs["json"], get_codec("json"))
+
+        with mock.patch.object(OrjsonCodec, "available", False):
+            self.assertIs(codecs["json"], get_codec("orjson"))
+
+        with mock.patch.object(MsgpackCodec, "available", False):
+            with self.assertRaises(LookupError) as cm:
+                get_codec("msgpack")
+            self.assertEqual(
+                "Install the msgpack package to read the storage",
+                str(cm.exception.args[0]),
+            )
+
+        with self.assertRaises(LookupError):
+            read_header(io.BufferedReader(io.BytesIO(b"#codec:foo\n{}")))
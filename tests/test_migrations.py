@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from pytuber import migrations
+from pytuber.cache import Cache
+from pytuber.migrations import Migration, migrate, migration, pending
+from pytuber.storage import JournalBackend, JsonBackend, Registry
+
+
+class MigrationsTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        Registry._obj = {}
+        Registry.from_file(self.path)
+
+    def tearDown(self):
+        Registry._obj = {}
+        Cache.configure(None)
+        shutil.rmtree(self.tmp)
+
+    def test_migration(self):
+        def foo():
+            pass
+
+        with mock.patch.object(migrations, "steps", []):
+            self.assertIs(foo, migration("1.2")(foo))
+            self.assertEqual(
+                [Migration(name="foo", version="1.2", func=foo)],
+                migrations.steps,
+            )
+
+    def test_pending(self):
+        steps = [
+            Migration(name="a", version="0", func=None),
+            Migration(name="b", version="1.10", func=None),
+            Migration(name="c", version="2", func=None),
+        ]
+        with mock.patch.object(migrations, "steps", steps):
+            self.assertEqual(steps, pending("0"))
+            self.assertEqual(steps[1:], pending("1.9"))
+            self.assertEqual(steps[1:], pending("1.10"))
+            self.assertEqual(steps[2:], pending("1.11"))
+
+            Registry.set("migrations", "b", 1)
+            self.assertEqual([steps[0], steps[2]], pending("0"))
+
+    @mock.patch("pytuber.migrations.time.time", return_value=10)
+    def test_migrate(self, *args):
+        calls = []
+
+        def fail(resume):
+            Registry.set("x", 1)
+            raise ValueError
+
+        steps = [
+            Migration(name="a", version="1", func=calls.append),
+            Migration(name="b", version="1", func=fail),
+        ]
+        with mock.patch.object(migrations, "steps", steps):
+            with self.assertRaises(ValueError):
+                migrate(self.path, "1")
+
+            self.assertEqual(
+                dict(migrations=dict(a=10)), JsonBackend(self.path).load()
+            )
+
+            steps[1] = Migration(name="b", version="1", func=lambda r: None)
+            self.assertEqual(["b"], migrate(self.path, "1"))
+            self.assertEqual([], migrate(self.path, "1"))
+            self.assertEqual([None], calls)
+            self.assertEqual(
+                dict(x=1, migrations=dict(a=10, b=10)),
+                JsonBackend(self.path).load(),
+            )
+
+    @mock.patch.object(migrations, "batch_size", 2)
+    @mock.patch("pytuber.migrations.time.time", return_value=10)
+    def test_migrate_in_batches(self, *args):
+        resumed = []
+
+        def rows(resume):
+            resumed.append(resume)
+            keys = "abcde"
+            for key in keys[keys.index(resume) + 1 :] if resume else keys:
+                if key == "d" and len(resumed) == 1:
+                    raise ValueError
+                Registry.set("rows", key, 1)
+                yield key
+
+        Registry.convert(self.path, "journal")
+        steps = [Migration(name="a", version="1", func=rows)]
+        with mock.patch.object(migrations, "steps", steps):
+            with self.assertRaises(ValueError):
+                migrate(self.path, "1")
+
+            self.assertEqual(
+                dict(rows=dict(a=1, b=1), migrating=dict(a="b")),
+                JournalBackend(self.path).load(),
+            )
+            Registry._obj = {}
+            Registry.from_file(self.path)
+
+            self.assertEqual(["a"], migrate(self.path, "1"))
+            self.assertEqual([None, "b"], resumed)
+            self.assertEqual(
+                dict(rows=dict.fromkeys("abcde", 1), migrations=dict(a=10)),
+                JournalBackend(self.path).load(),
+            )
+
+    @mock.patch.object(migrations, "batch_size", 2)
+    @mock.patch("pytuber.migrations.time.time", return_value=10)
+    def test_migrate_keeps_pre_migration_snapshot(self, *args):
+        for version in "123":
+            Registry.set("version", version)
+            Registry.persist(self.path)
+
+        def rows(resume):
+            for key in "abcde":
+                Registry.set("rows", key, 1)
+                yield key
+
+        steps = [
+            Migration(name="a", version="3", func=rows),
+            Migration(name="b", version="3", func=lambda r: None),
+        ]
+        backend = Registry().backend
+        with mock.patch.object(migrations, "steps", steps):
+            with mock.patch.object(
+                JsonBackend,
+                "rotate",
+                autospec=True,
+                side_effect=JsonBackend.rotate,
+            ) as rotate, mock.patch.object(
+                Registry, "persist", wraps=Registry.persist
+            ) as persist:
+                self.assertEqual(["a", "b"], migrate(self.path, "3"))
+
+        self.assertEqual(2, persist.call_count)
+        self.assertEqual(1, rotate.call_count)
+        self.assertFalse(backend.pinned)
+        self.assertEqual(
+            ["3", "2", "1"],
+            [backend.load(path)["version"] for path in backend.snapshots()],
+        )
+
+    def test_youtube_quota_limit(self):
+        migrations.youtube_quota_limit()
+        self.assertEqual(dict(), Registry())
+
+        Registry.set("configuration", "youtube", "data", dict(foo="bar"))
+        migrations.youtube_quota_limit()
+        self.assertEqual(
+            dict(foo="bar", quota_limit=1000000),
+            Registry.get("configuration", "youtube", "data"),
+        )
+
+    def test_move_cache_entries(self):
+        Registry.set("last.fm_tag_list", ["tags", 200])
+        Registry.set("last.fm_broken", "foo")
+        Registry.set("cache", "last.fm_user_rj", ["user", 300, 10, 6])
+        Registry.set("cache", "broken", 1)
+        Registry.set("version", "20.1")
+
+        self.assertEqual(
+            [
+                "last.fm_tag_list",
+                "last.fm_broken",
+                "last.fm_user_rj",
+                "broken",
+            ],
+            list(migrations.move_cache_entries()),
+        )
+        self.assertEqual([], list(migrations.move_cache_entries()))
+
+        self.assertEqual(dict(version="20.1"), Registry())
+        self.assertEqual(
+            {
+                "last.fm_tag_list": ("tags", 200),
+                "last.fm_user_rj": ("user", 300),
+            },
+            Cache.memory,
+        )
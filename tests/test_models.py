@@ -1,6 +1,12 @@
 import base64
 import json
+import os
+import shutil
+import signal
+import tempfile
+import threading
 from datetime import datetime
+from unittest import mock
 
 import attr
 
@@ -8,17 +14,21 @@ from pytuber.core.models import (
     Config,
     ConfigManager,
     Document,
+    Index,
     Manager,
+    Membership,
     Playlist,
+    PlaylistItem,
     PlaylistManager,
     PlaylistType,
     Provider,
+    Session,
     StrEnum,
     Track,
     TrackManager,
 )
 from pytuber.exceptions import NotFound
-from pytuber.storage import Registry
+from pytuber.storage import Checkpointer, JsonBackend, Registry
 from tests.utils import PlaylistFixture, TestCase, TrackFixture
 
 
@@ -60,6 +70,26 @@ class TrackTests(TestCase):
         track = TrackFixture.one(id=None)
         self.assertEqual("6784d47", track.id)
 
+    def test_slotted(self):
+        self.assertFalse(hasattr(TrackFixture.one(), "__dict__"))
+
+
+class DocumentTests(TestCase):
+    def test_frozen(self):
+        item = PlaylistItem(id="a", name="b", artist="c", video_id="d")
+        with self.assertRaises(attr.exceptions.FrozenInstanceError):
+            item.video_id = "e"
+
+    def test_asdict(self):
+        playlist = PlaylistFixture.one(tracks=["a"])
+        config = Config(provider="foo", data="bar")
+        for obj in (playlist, config, TrackFixture.one()):
+            self.assertEqual(attr.asdict(obj), obj.asdict())
+
+        data = playlist.asdict()
+        self.assertIsNot(playlist.tracks, data["tracks"])
+        self.assertIsNot(playlist.arguments, data["arguments"])
+
 
 class ProviderTests(TestCase):
     def test_youtube(self):
@@ -84,6 +114,10 @@ class FooManager(Manager):
     model = Foo
 
 
+class IndexedFooManager(FooManager):
+    indexes = ("value", "keeper")
+
+
 class ManagerTests(TestCase):
     data = dict(id="a", value=1, keeper="keep")
 
@@ -111,6 +145,59 @@ class ManagerTests(TestCase):
         thug = FooManager.set(dict(id="a", value=1, keeper="peek"))
         self.assertEqual("peek", thug.keeper)
 
+    def test_set_many(self):
+        FooManager.set(dict(id="a", value=1, keeper="keep"))
+        IndexedFooManager.index()
+
+        with mock.patch.object(
+            Index, "add", autospec=True, side_effect=Index.add
+        ) as add:
+            keys = IndexedFooManager.set_many(
+                [
+                    dict(id="b", value=2, keeper="x"),
+                    dict(id="a", value=3),
+                    dict(id="b", value=4),
+                ]
+            )
+
+        self.assertEqual(["b", "a", "b"], keys)
+        self.assertEqual(2, add.call_count)
+        self.assertEqual(
+            dict(
+                a=dict(id="a", value=3, keeper="keep"),
+                b=dict(id="b", value=4, keeper="x"),
+            ),
+            Registry.get("foo"),
+        )
+        self.assertEqual(
+            ["b"], [foo.id for foo in IndexedFooManager.find(value=4)]
+        )
+
+    def test_concurrent_writes(self):
+        def work():
+            for i in range(100):
+                IndexedFooManager.set_many([dict(id=str(i), value=i)])
+                IndexedFooManager.find(value=i)
+
+        IndexedFooManager.index()
+        workers = [threading.Thread(target=work) for _ in range(4)]
+        [worker.start() for worker in workers]
+        [worker.join() for worker in workers]
+
+        self.assertEqual(100, IndexedFooManager.count())
+        self.assertEqual(100, len(IndexedFooManager.index().rows))
+
+    def test_update_many(self):
+        a, b = [FooManager.set(dict(id=id, value=1)) for id in "ab"]
+        new_a, new_b = FooManager.update_many(
+            [(a, dict(value=2)), (b, dict(keeper="x"))]
+        )
+
+        self.assertEqual(Foo(id="a", value=2), new_a)
+        self.assertEqual(Foo(id="b", value=1, keeper="x"), new_b)
+        self.assertEqual(new_a.asdict(), Registry.get("foo", "a"))
+        self.assertEqual(new_b.asdict(), Registry.get("foo", "b"))
+
     def test_update(self):
         foo = FooManager.set(self.data)
         new_foo = FooManager.update(foo, dict(value=2))
@@ -145,6 +232,105 @@ class ManagerTests(TestCase):
         self.assertEqual([e], FooManager.find(value=None))
         self.assertEqual([a, d], FooManager.find(value=lambda x: x == 1))
 
+    def test_iter_find(self):
+        a = FooManager.set(dict(id="a", value=1))
+        FooManager.set(dict(id="b", value=2, keeper="x"))
+
+        result = FooManager.iter_find(value=1)
+        self.assertNotIsInstance(result, list)
+        self.assertEqual([a], list(result))
+
+        with mock.patch.object(Foo, "__init__") as init:
+            self.assertEqual(
+                [("a", None), ("b", "x")],
+                list(FooManager.iter_find(fields=("id", "keeper"))),
+            )
+            self.assertEqual(
+                [("b",)], list(FooManager.iter_find(fields=("id",), value=2))
+            )
+            self.assertEqual(0, init.call_count)
+
+        with self.assertRaises(TypeError) as cm:
+            FooManager.iter_find(fields=("foo",))
+        self.assertEqual("Unknown Foo field: foo", str(cm.exception))
+
+    def test_count(self):
+        self.assertEqual(0, FooManager.count())
+
+        FooManager.set(dict(id="a", value=1))
+        FooManager.set(dict(id="b", value=2))
+        FooManager.set(dict(id="c", value=2))
+
+        self.assertEqual(3, FooManager.count())
+        self.assertEqual(2, FooManager.count(id__in=["a", "b", "x"]))
+        self.assertEqual(2, FooManager.count(value=2))
+        self.assertEqual(1, FooManager.count(id__in=["a", "b"], value=2))
+        self.assertEqual(2, IndexedFooManager.count(value=2))
+
+    def test_first(self):
+        self.assertIsNone(FooManager.first())
+
+        a = FooManager.set(dict(id="a", value=1))
+        FooManager.set(dict(id="b", value=2))
+
+        self.assertEqual(a, FooManager.first())
+        self.assertEqual(("b",), FooManager.first(fields=("id",), value=2))
+        self.assertIsNone(FooManager.first(value=3))
+
+    def test_find_by_key(self):
+        a = FooManager.set(dict(id="a", value=1))
+        b = FooManager.set(dict(id="b", value=2))
+
+        self.assertEqual([b, a], FooManager.find(id__in=["b", "x", "a"]))
+        self.assertEqual([a], FooManager.find(id__in=["b", "a"], value=1))
+        self.assertEqual([], FooManager.find(id="x"))
+
+        with self.assertRaises(TypeError):
+            FooManager.find(value="1")
+
+    def test_find_with_isnull(self):
+        a = FooManager.set(dict(id="a", value=1))
+        b = FooManager.set(dict(id="b", value=None))
+
+        self.assertEqual([b], FooManager.find(value__isnull=True))
+        self.assertEqual([a], FooManager.find(value__isnull=False))
+
+    def test_find_with_index(self):
+        a = IndexedFooManager.set(dict(id="a", value=1))
+        b = IndexedFooManager.set(dict(id="b", value=2, keeper="x"))
+        c = IndexedFooManager.set(dict(id="c", value=2))
+        d = IndexedFooManager.set(dict(id="d", value=None, keeper="x"))
+
+        with mock.patch.object(
+            Index, "add", autospec=True, side_effect=Index.add
+        ) as add:
+            self.assertEqual([b, c], IndexedFooManager.find(value=2))
+            self.assertEqual(4, add.call_count)
+
+            self.assertEqual([d], IndexedFooManager.find(value=None))
+            self.assertEqual(
+                [a, b, c], IndexedFooManager.find(value__isnull=False)
+            )
+            self.assertEqual([b], IndexedFooManager.find(value=2, keeper="x"))
+            self.assertEqual(
+                [c], IndexedFooManager.find(value=2, id=lambda x: x != "b")
+            )
+            self.assertEqual([], IndexedFooManager.find(value=3))
+            self.assertEqual(4, add.call_count)
+
+            c = IndexedFooManager.update(c, dict(value=3))
+            IndexedFooManager.remove("b")
+            self.assertEqual([c], IndexedFooManager.find(value=3))
+            self.assertEqual([], IndexedFooManager.find(value=2))
+            self.assertEqual(5, add.call_count)
+
+            Registry.set("foo", "a", "value", 3)
+            self.assertEqual(
+                ["a", "c"],
+                [x.id for x in IndexedFooManager.find(value__isnull=False)],
+            )
+            self.assertEqual(8, add.call_count)
+
     def test_exists(self):
         a = Foo(id="a", value=1)
         self.assertFalse(FooManager.exists(a))
@@ -153,6 +339,130 @@ class ManagerTests(TestCase):
         self.assertTrue(FooManager.exists(a))
 
 
+class IndexTests(TestCase):
+    def test_add_and_discard(self):
+        index = Index(["a", "b"])
+        index.add("x", dict(a=1, b=None))
+        index.add("y", dict(a=1, b=2))
+        index.add("z", dict(a=None))
+
+        self.assertEqual(["x", "y"], list(index.lookup("a", 1)))
+        self.assertEqual(["z"], list(index.lookup("a", None)))
+        self.assertEqual(["y"], list(index.lookup_null("b", False)))
+        self.assertEqual(["x", "z"], list(index.lookup_null("b", True)))
+
+        index.add("x", dict(a=2, b=None))
+        index.discard("y")
+        index.discard("missing")
+        self.assertEqual(["x"], list(index.lookup("a", 2)))
+        self.assertEqual([], list(index.lookup("a", 1)))
+        self.assertEqual([], list(index.lookup_null("b", False)))
+        self.assertEqual({2, None}, set(index.values["a"]))
+
+    def test_lookup_converts_values(self):
+        index = Index(["provider"])
+        index.add("x", dict(provider="last.fm"))
+        self.assertEqual(
+            ["x"], list(index.lookup("provider", Provider.lastfm))
+        )
+
+
+class SessionTests(TestCase):
+    def test_identity_map(self):
+        FooManager.set(dict(id="a", value=1))
+        self.assertIsNot(FooManager.get("a"), FooManager.get("a"))
+
+        with Session.begin():
+            a = FooManager.get("a")
+            self.assertIs(a, FooManager.get("a"))
+            self.assertIs(a, FooManager.find()[0])
+            self.assertIs(a, IndexedFooManager.first(value=1))
+
+        self.assertIsNone(Session.active())
+        self.assertIsNot(a, FooManager.get("a"))
+
+    def test_write_back(self):
+        a = FooManager.set(dict(id="a", value=1))
+        with Session.begin() as session:
+            with mock.patch.object(FooManager, "write_many") as write_many:
+                with Session.begin() as nested:
+                    self.assertIs(session, nested)
+                    new = FooManager.update(a, dict(value=2))
+                    self.assertIs(a, new)
+                    FooManager.update(a, dict(keeper="x"))
+                    self.assertEqual(0, write_many.call_count)
+
+            self.assertEqual(1, Registry.get("foo", "a", "value"))
+            self.assertEqual([a], FooManager.find(value=2))
+            self.assertEqual(dict(), session.modified)
+
+            FooManager.update(a, dict(value=3))
+
+        self.assertEqual(
+            dict(id="a", value=3, keeper="x"), Registry.get("foo", "a")
+        )
+
+    def test_commit_on_error(self):
+        a = FooManager.set(dict(id="a", value=1))
+        with self.assertRaises(ValueError):
+            with Session.begin():
+                FooManager.update(a, dict(value=2))
+                raise ValueError
+
+        self.assertEqual(2, Registry.get("foo", "a", "value"))
+        self.assertIsNone(Session.active())
+
+    def test_update_frozen_and_invalid(self):
+        config = ConfigManager.set(dict(provider="foo", data=dict(a=1)))
+        with Session.begin():
+            new = ConfigManager.update(config, dict(data=dict(a=2)))
+            self.assertIsNot(config, new)
+            self.assertIs(new, ConfigManager.get("foo"))
+
+            with self.assertRaises(TypeError) as cm:
+                ConfigManager.update(new, dict(foo=1))
+            self.assertEqual("Unknown Config field: foo", str(cm.exception))
+
+        self.assertEqual(dict(a=2), ConfigManager.get("foo").data)
+
+    def test_direct_writes(self):
+        a = FooManager.set(dict(id="a", value=1))
+        with Session.begin() as session:
+            FooManager.update(a, dict(value=2))
+            b = FooManager.set(dict(id="a", value=3))
+            self.assertIsNot(a, b)
+            self.assertEqual(dict(), session.modified)
+            self.assertEqual(3, FooManager.get("a").value)
+
+            FooManager.remove("a")
+            self.assertEqual(dict(), session.identity)
+
+    def test_limit(self):
+        a, b, c = [FooManager.set(dict(id=k, value=0)) for k in "abc"]
+        with Session.begin(limit=2) as session:
+            FooManager.update(a, dict(value=1))
+            FooManager.update(a, dict(value=2))
+            self.assertEqual(0, Registry.get("foo", "a", "value"))
+
+            FooManager.update(b, dict(value=1))
+            self.assertEqual(dict(), session.modified)
+            self.assertEqual(2, Registry.get("foo", "a", "value"))
+            self.assertEqual(1, Registry.get("foo", "b", "value"))
+
+            FooManager.update(c, dict(value=1))
+            self.assertEqual(0, Registry.get("foo", "c", "value"))
+
+    def test_committed_on_interrupt(self):
+        checkpointer = Checkpointer(mock.Mock())
+        a = FooManager.set(dict(id="a", value=1))
+        with self.assertRaises(SystemExit):
+            with Session.begin():
+                FooManager.update(a, dict(value=2))
+                checkpointer.interrupt(signal.SIGTERM, None)
+
+        self.assertEqual(2, Registry.get("foo", "a", "value"))
+
+
 class ConfigManagerTests(TestCase):
     def test_class(self):
         self.assertTrue(issubclass(ConfigManager, Manager))
@@ -167,6 +477,9 @@ class PlaylistManagerTests(TestCase):
         self.assertEqual(Playlist, PlaylistManager.model)
         self.assertEqual("id", PlaylistManager.key)
         self.assertEqual("playlist", PlaylistManager.namespace)
+        self.assertEqual(
+            ("youtube_id", "provider", "type"), PlaylistManager.indexes
+        )
 
     def test_update_sets_synced_if_tracks_are_updated(self):
         playlist = PlaylistManager.set(
@@ -180,12 +493,149 @@ class PlaylistManagerTests(TestCase):
         )
 
 
+class MembershipTests(TestCase):
+    def test_maintained_by_playlist_manager(self):
+        a, b = PlaylistFixture.get(2, tracks=[["x", "y"], ["y", "z"]])
+        a = PlaylistManager.set(a.asdict())
+        self.assertEqual(["id_a"], Membership.playlists("x"))
+        b = PlaylistManager.set(b.asdict())
+
+        expected = dict(x=["id_a"], y=["id_a", "id_b"], z=["id_b"])
+        self.assertEqual(expected, Registry.get("membership"))
+
+        PlaylistManager.update(a, dict(tracks=["y", "w"]))
+        expected = dict(y=["id_a", "id_b"], z=["id_b"], w=["id_a"])
+        self.assertEqual(expected, Registry.get("membership"))
+
+        PlaylistManager.remove(b.id)
+        self.assertEqual(
+            dict(y=["id_a"], w=["id_a"]), Registry.get("membership")
+        )
+        self.assertEqual([], Membership.playlists("z"))
+
+    def test_rebuild_on_first_use(self):
+        Registry.set("playlist", "a", dict(id="a", tracks=["x", "y"]))
+        Registry.set("playlist", "b", dict(id="b", tracks=["x"]))
+        Registry.set("playlist", "c", dict(id="c"))
+        Registry.set("track", "x", dict(id="x"))
+        Registry.set("track", "o", dict(id="o"))
+        self.assertFalse(Registry.exists("membership"))
+
+        self.assertEqual(["a", "b"], Membership.playlists("x"))
+        self.assertEqual(
+            dict(x=["a", "b"], y=["a"]), Registry.get("membership")
+        )
+        self.assertEqual(["o"], Membership.orphans())
+
+    def test_orphans(self):
+        x, y, z = [TrackManager.set(t.asdict()) for t in TrackFixture.get(3)]
+        self.assertEqual([x.id, y.id, z.id], Membership.orphans())
+
+        a = PlaylistManager.set(
+            PlaylistFixture.one(tracks=[x.id, y.id]).asdict()
+        )
+        b = PlaylistManager.set(
+            PlaylistFixture.one(num=1, tracks=[y.id]).asdict()
+        )
+        self.assertEqual([z.id], Membership.orphans())
+        self.assertEqual(2, Membership.count(y.id))
+
+        PlaylistManager.update(a, dict(tracks=[x.id]))
+        self.assertEqual([z.id], Membership.orphans())
+        PlaylistManager.remove(b.id)
+        self.assertEqual([z.id, y.id], Membership.orphans())
+        self.assertEqual(0, Membership.count(y.id))
+
+        self.assertEqual(2, TrackManager.remove_orphans())
+        self.assertEqual([x.id], TrackManager.keys())
+        self.assertEqual([], Membership.orphans())
+
+    def test_remove_orphans_checks_playlists(self):
+        x, y = [TrackManager.set(t.asdict()) for t in TrackFixture.get(2)]
+        PlaylistManager.set(PlaylistFixture.one(tracks=[x.id]).asdict())
+        Registry.set(Membership.orphan_namespace, x.id, 1)
+
+        self.assertEqual(1, TrackManager.remove_orphans())
+        self.assertEqual([x.id], TrackManager.keys())
+        self.assertEqual(["id_a"], Membership.playlists(x.id))
+        self.assertEqual([], Membership.orphans())
+
+        with mock.patch.object(Membership, "playlists") as playlists:
+            self.assertEqual(0, TrackManager.remove_orphans())
+        self.assertEqual(0, playlists.call_count)
+
+    def test_rebuilt_on_concurrent_writes(self):
+        path = os.path.join(tempfile.mkdtemp(), "storage.db")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.addCleanup(setattr, Registry, "_obj", {})
+
+        track = TrackManager.set(TrackFixture.one().asdict())
+        self.assertEqual([track.id], Membership.orphans())
+        Registry.persist(path)
+
+        processes = []
+        for _ in range(2):
+            Registry._obj = {}
+            Registry.from_file(path)
+            processes.append(Registry._obj)
+
+        playlists = PlaylistFixture.get(2, tracks=[[track.id], [track.id]])
+        for process, playlist in zip(processes, playlists):
+            Registry._obj = process
+            PlaylistManager.set(playlist.asdict())
+            Registry.persist(path)
+
+        self.assertEqual(["id_a", "id_b"], Membership.playlists(track.id))
+        PlaylistManager.remove("id_b")
+        self.assertEqual([], Membership.orphans())
+        self.assertEqual(0, TrackManager.remove_orphans())
+        self.assertEqual([track.id], TrackManager.keys())
+
+    def test_maintained_by_bulk_writes(self):
+        ids = TrackManager.set_many(t.asdict() for t in TrackFixture.get(3))
+        self.assertEqual(ids, Membership.orphans())
+
+        a, b = PlaylistFixture.get(2, tracks=[ids[:2], ids[1:]])
+        a, b = PlaylistManager.update_many([(a, dict()), (b, dict())])
+        self.assertEqual([], Membership.orphans())
+        self.assertEqual(["id_a", "id_b"], Membership.playlists(ids[1]))
+
+
 class TrackManagerTests(TestCase):
     def test_class(self):
         self.assertTrue(issubclass(TrackManager, Manager))
         self.assertEqual(Track, TrackManager.model)
         self.assertEqual("id", TrackManager.key)
         self.assertEqual("track", TrackManager.namespace)
+        self.assertEqual(("youtube_id",), TrackManager.indexes)
+
+    def test_set_many_keeps_concurrent_youtube_id(self):
+        path = os.path.join(tempfile.mkdtemp(), "storage.db")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.addCleanup(setattr, Registry, "_obj", {})
+
+        track = TrackFixture.one()
+        TrackManager.set(track.asdict())
+        Registry.persist(path)
+
+        processes = []
+        for _ in range(2):
+            Registry._obj = {}
+            Registry.from_file(path)
+            processes.append(Registry._obj)
+
+        Registry._obj = processes[0]
+        TrackManager.update(track, dict(youtube_id="y"))
+        Registry.persist(path)
+
+        Registry._obj = processes[1]
+        TrackManager.set_many([track.asdict()])
+        Registry.persist(path)
+
+        self.assertEqual("y", TrackManager.get(track.id).youtube_id)
+        self.assertEqual(
+            "y", JsonBackend(path).load()["track"][track.id]["youtube_id"]
+        )
 
     def test_find_youtube_id(self):
         Registry.set("track", "a", "youtube_id", 1)
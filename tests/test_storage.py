@@ -1,11 +1,33 @@
+import gzip
 import json
 import os
 import shutil
+import signal
 import tempfile
-from datetime import timedelta
+import threading
+import unittest
+from contextlib import suppress
 from unittest import TestCase, mock
 
-from pytuber.storage import Registry
+from pytuber.codecs import OrjsonCodec, codecs
+from pytuber.exceptions import CorruptedStorage
+from pytuber.storage import (
+    Change,
+    ChangeLog,
+    Checkpointer,
+    FileLock,
+    GzipBackend,
+    JournalBackend,
+    JsonBackend,
+    Namespace,
+    Registry,
+    SqliteBackend,
+    ZstdBackend,
+    detect_backend,
+    fcntl,
+    fingerprint,
+    storage_files,
+)
 
 
 class RegistryTests(TestCase):
@@ -79,28 +101,1078 @@ class RegistryTests(TestCase):
         finally:
             shutil.rmtree(tmp)
 
-    @mock.patch("pytuber.storage.time.time")
-    def test_cache(self, time):
-        time.side_effect = [10, 20.1, 20.1, 20.5, 20.8]
+    def test_generation(self):
+        self.assertEqual(0, Registry.generation())
 
-        def callme(ttl, value, refresh=False):
-            return Registry.cache(
-                key="foo",
-                ttl=timedelta(seconds=ttl),
-                func=lambda: value,
-                refresh=refresh,
+        Registry.set("a", "b", 1)
+        Registry.set("a", "c", 2)
+        Registry.set("d", 3)
+        Registry.remove("a", "b")
+
+        self.assertEqual(4, Registry.generation())
+        self.assertEqual(3, Registry.generation("a"))
+        self.assertEqual(1, Registry.generation("d"))
+        self.assertEqual(0, Registry.generation("e"))
+        self.assertEqual(dict(a={"b", "c"}, d=None), Registry().dirty)
+
+    def test_bases_keep_previous_rows(self):
+        row = dict(c=dict(d=1))
+        Registry.set("a", "b", row)
+        Registry().bases = dict()
+
+        Registry.set("a", "b", "c", "d", 2)
+        Registry.remove("a", "b", "c", "d")
+
+        self.assertIs(row, Registry().bases[("a", "b")])
+        self.assertEqual(dict(c=dict(d=1)), row)
+        self.assertEqual(dict(c=dict()), Registry.get("a", "b"))
+
+    def test_persist_skips_clean_registry(self):
+        try:
+            tmp = tempfile.mkdtemp()
+            file_path = os.path.join(tmp, "foo.json")
+            Registry.from_file(file_path)
+
+            with mock.patch.object(JsonBackend, "persist") as persist:
+                Registry.persist(file_path)
+                self.assertEqual(0, persist.call_count)
+
+                Registry.set("a", 1)
+                Registry.persist(file_path)
+                Registry.persist(file_path)
+                persist.assert_called_once_with(Registry(), dict(a=None))
+        finally:
+            shutil.rmtree(tmp)
+
+
+class ThreadSafetyTests(TestCase):
+    def tearDown(self):
+        Registry._obj = {}
+
+    def run_workers(self, target, count=4):
+        workers = [threading.Thread(target=target) for _ in range(count)]
+        [worker.start() for worker in workers]
+        [worker.join() for worker in workers]
+
+    def test_incr(self):
+        self.assertEqual(2, Registry.incr("a", "b", 2))
+        self.assertEqual(5, Registry.incr("a", "b", 3))
+
+        self.run_workers(
+            lambda: [Registry.incr("a", "b", 1) for _ in range(500)]
+        )
+        self.assertEqual(2005, Registry.get("a", "b"))
+        self.assertEqual(dict(a={"b"}), Registry().dirty)
+
+    def test_lock(self):
+        self.assertIs(Registry.lock("a"), Registry.lock("a"))
+        self.assertIsNot(Registry.lock("a"), Registry.lock("b"))
+
+    def test_locked_waits_for_writers(self):
+        events = []
+        lock = Registry.lock("a")
+        Registry.lock("b")
+
+        def persist():
+            with Registry.locked():
+                events.append("locked")
+
+        with lock:
+            worker = threading.Thread(target=persist)
+            worker.start()
+            worker.join(0.05)
+            self.assertTrue(worker.is_alive())
+            events.append("released")
+
+        worker.join()
+        self.assertEqual(["released", "locked"], events)
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+
+    def test_locked_blocks_new_namespaces(self):
+        Registry.lock("a")
+        worker = threading.Thread(target=Registry.set, args=("b", 1))
+        with Registry.locked():
+            worker.start()
+            worker.join(0.05)
+            self.assertTrue(worker.is_alive())
+            self.assertNotIn("b", Registry())
+
+        worker.join()
+        self.assertEqual(dict(b=None), Registry().dirty)
+
+    def test_locked_waits_for_transactions(self):
+        started, done = threading.Event(), threading.Event()
+
+        def command():
+            with Registry.transaction():
+                Registry.set("a", 1)
+                started.set()
+                done.wait()
+
+        worker = threading.Thread(target=command)
+        worker.start()
+        started.wait()
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(InterruptedError):
+            with Registry.locked(cancel):
+                pass
+
+        done.set()
+        worker.join()
+        with Registry.locked():
+            self.assertEqual(dict(a=1), Registry())
+
+    def test_rollback_keeps_other_threads_writes(self):
+        started, done = threading.Event(), threading.Event()
+        Registry.incr("q", "a", 1)
+
+        def command():
+            with suppress(ValueError), Registry.transaction():
+                Registry.set("a", 1)
+                Registry.incr("q", "a", 5)
+                started.set()
+                done.wait()
+                raise ValueError
+
+        worker = threading.Thread(target=command)
+        worker.start()
+        started.wait()
+        Registry.set("b", 2)
+        Registry.incr("q", "b", 3)
+        self.assertIsNone(Registry().undo)
+        done.set()
+        worker.join()
+
+        self.assertEqual(dict(b=2, q=dict(a=1, b=3)), Registry())
+        self.assertEqual({("q", "a"): 1, ("q", "b"): 3}, Registry().increments)
+
+    def test_written(self):
+        Registry.set("a", "b", 1)
+        Registry.set("a", "c", 2)
+        Registry.incr("d", "e", 3)
+        written = dict(a={"b"}, d=None)
+        Registry.set("a", "f", 4)
+        Registry.written(written)
+
+        self.assertEqual(dict(a={"c", "f"}), Registry().dirty)
+        self.assertEqual({("a", "c"), ("a", "f")}, set(Registry().bases))
+        self.assertEqual(dict(), Registry().increments)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        Registry._obj = {}
+        Registry.from_file(self.path)
+
+    def tearDown(self):
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    def test_log(self):
+        changes = []
+        Registry.subscribe(changes.append)
+
+        Registry.set("track", "a", dict(id="a"))
+        Registry.set("track", "a", "youtube_id", "y")
+        Registry.set("track", "a", "youtube_id", "y")
+        Registry.set("version", "1")
+        Registry.acknowledge("exporter", 2)
+        Registry.remove("track", "a")
+
+        a = fingerprint(dict(id="a"))
+        b = fingerprint(dict(id="a", youtube_id="y"))
+        expected = [
+            Change(1, "track", "a", None, a),
+            Change(2, "track", "a", a, b),
+            Change(3, "version", None, None, fingerprint("1")),
+            Change(4, "track", "a", b, None),
+        ]
+        self.assertEqual(expected, changes)
+        self.assertEqual(expected, Registry().changes)
+        self.assertEqual(4, Registry().sequence)
+        self.assertEqual(2, Registry.cursor("exporter"))
+        self.assertEqual(0, Registry.cursor("replication"))
+
+        Registry.unsubscribe(changes.append)
+        Registry.set("version", "2")
+        self.assertEqual(4, len(changes))
+
+    def test_log_rollback(self):
+        Registry.subscribe(list().append)
+        Registry.set("a", 1)
+        with self.assertRaises(ValueError):
+            with Registry.transaction():
+                Registry.set("a", 2)
+                raise ValueError
+
+        one, two = fingerprint(1), fingerprint(2)
+        self.assertEqual(
+            [
+                Change(1, "a", None, None, one),
+                Change(2, "a", None, one, two),
+                Change(3, "a", None, two, one),
+            ],
+            Registry().changes,
+        )
+
+    def test_log_on_persist(self):
+        Registry.set("track", "a", dict(id="a"))
+        Registry.set("track", "b", dict(id="b"))
+        Registry.set("version", "1")
+        Registry.persist(self.path)
+
+        Registry.set("track", "a", "youtube_id", "y")
+        Registry.set("track", "b", dict(id="b"))
+        Registry.set("track", "c", dict(id="c"))
+        Registry.remove("track", "c")
+        with self.assertRaises(ValueError):
+            with Registry.transaction():
+                Registry.set("version", "2")
+                raise ValueError
+        Registry.acknowledge("exporter", 3)
+        self.assertEqual([], Registry().changes)
+        Registry.persist(self.path)
+
+        a = fingerprint(dict(id="a"))
+        b = fingerprint(dict(id="a", youtube_id="y"))
+        self.assertEqual(
+            [
+                Change(1, "track", "a", None, a),
+                Change(2, "track", "b", None, fingerprint(dict(id="b"))),
+                Change(3, "version", None, None, fingerprint("1")),
+                Change(4, "track", "a", a, b),
+            ],
+            list(ChangeLog(self.path).read()),
+        )
+        self.assertEqual(4, Registry().sequence)
+
+    def test_persist(self):
+        Registry.set("a", 1)
+        Registry.set("b", 2)
+        Registry.persist(self.path)
+
+        self.assertEqual([], Registry().changes)
+        self.assertEqual(2, ChangeLog(self.path).last())
+        self.assertEqual(
+            ["b"], [c.namespace for c in ChangeLog(self.path).read(since=1)]
+        )
+
+        Registry._obj = {}
+        Registry.from_file(self.path)
+        self.assertEqual(2, Registry().sequence)
+        Registry.set("c", 3)
+        Registry.persist(self.path)
+        self.assertEqual(3, ChangeLog(self.path).last())
+
+    def test_persist_renumbers_concurrent_changes(self):
+        ChangeLog(self.path).append(
+            [Change(1, "x", None, None, "f"), Change(2, "x", None, "f", "g")]
+        )
+        Registry.set("a", 1)
+        Registry.persist(self.path)
+
+        self.assertEqual(
+            [(1, "x"), (2, "x"), (3, "a")],
+            [(c.sequence, c.namespace) for c in ChangeLog(self.path).read()],
+        )
+        self.assertEqual(3, Registry().sequence)
+
+    def test_read_partial_line(self):
+        log = ChangeLog(self.path)
+        log.append([Change(1, "a", None, None, "f")])
+        with open(log.path, "a") as fp:
+            fp.write('[2, "b", nu')
+
+        self.assertEqual([Change(1, "a", None, None, "f")], list(log.read()))
+        self.assertEqual(1, log.last())
+        self.assertEqual([], list(ChangeLog(self.tmp).read()))
+        self.assertEqual(0, ChangeLog(self.tmp).last())
+
+    def test_compact(self):
+        log = ChangeLog(self.path)
+        log.append([Change(i, "a", None, None, "f") for i in range(1, 4)])
+        self.assertEqual(0, log.start())
+
+        log.compact(2)
+        self.assertEqual(2, log.start())
+        self.assertEqual([3], [c.sequence for c in log.read()])
+        self.assertEqual(3, log.last())
+
+        log.compact(1)
+        self.assertEqual(2, log.start())
+        log.compact(3)
+        self.assertEqual(3, log.start())
+        self.assertEqual([], list(log.read()))
+        self.assertEqual(4, log.append([Change(1, "b", None, None, "f")]))
+        self.assertEqual([4], [c.sequence for c in log.read()])
+
+    def test_persist_compacts_below_cursors(self):
+        log = ChangeLog(self.path)
+        with mock.patch.object(ChangeLog, "limit", 0):
+            Registry.set("a", 1)
+            Registry.acknowledge("exporter", 1)
+            Registry.set("b", 2)
+            Registry.persist(self.path)
+            self.assertEqual(1, log.start())
+            self.assertEqual(["b"], [c.namespace for c in log.read()])
+
+            Registry.set("cursors", {})
+            Registry.persist(self.path)
+            self.assertEqual(2, log.start())
+            self.assertEqual([], list(log.read()))
+
+        self.assertEqual(2, log.last())
+
+
+class TransactionTests(TestCase):
+    def setUp(self):
+        Registry._obj = {}
+        Registry.set("a", dict(b=1, c=dict(d=2)))
+        Registry.set("e", 3)
+        self.initial = json.loads(json.dumps(Registry()))
+
+    def tearDown(self):
+        Registry._obj = {}
+
+    def test_commit(self):
+        with Registry.transaction():
+            Registry.set("a", "b", 2)
+            Registry.remove("e")
+
+        self.assertIsNone(Registry().undo)
+        self.assertEqual(dict(a=dict(b=2, c=dict(d=2))), Registry())
+
+    def test_rollback(self):
+        generation = Registry.generation("a")
+        with self.assertRaises(ValueError):
+            with Registry.transaction():
+                Registry.set("a", "b", 2)
+                Registry.set("a", "c", "d", 3)
+                Registry.set("a", "x", "y", 4)
+                Registry.set("f", "g", 5)
+                Registry.remove("e")
+                Registry.remove("a", "b")
+                Registry.set("e", 6)
+                raise ValueError
+
+        self.assertIsNone(Registry().undo)
+        self.assertEqual(self.initial, Registry())
+        self.assertLess(generation, Registry.generation("a"))
+
+    def test_rollback_clear(self):
+        with self.assertRaises(ValueError):
+            with Registry.transaction():
+                Registry.clear()
+                Registry.set("x", 1)
+                raise ValueError
+
+        self.assertEqual(self.initial, Registry())
+
+    def test_savepoints(self):
+        with Registry.transaction():
+            Registry.set("a", "b", 2)
+            with self.assertRaises(ValueError):
+                with Registry.transaction():
+                    Registry.set("a", "b", 3)
+                    Registry.set("e", 4)
+                    raise ValueError
+
+            self.assertEqual(2, Registry.get("a", "b"))
+            self.assertEqual(3, Registry.get("e"))
+
+            with Registry.transaction():
+                Registry.set("e", 5)
+
+        self.assertEqual(2, Registry.get("a", "b"))
+        self.assertEqual(5, Registry.get("e"))
+
+    def test_deferred_persist(self):
+        path = os.path.join(tempfile.mkdtemp(), "storage.db")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with mock.patch.object(JsonBackend, "persist") as persist:
+            with Registry.transaction():
+                Registry.set("e", 4)
+                Registry.persist(path)
+                Registry.set("e", 5)
+                Registry.persist(path)
+                self.assertEqual(0, persist.call_count)
+
+            persist.assert_called_once_with(Registry(), dict(a=None, e=None))
+
+            with self.assertRaises(ValueError):
+                with Registry.transaction():
+                    Registry.persist(path)
+                    raise ValueError
+            self.assertEqual(1, persist.call_count)
+
+
+class JsonBackendTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        self.backend = JsonBackend(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_unknown_codec(self):
+        with open(self.path, "wb") as fp:
+            fp.write(b"#codec:foo\n{}")
+
+        with self.assertRaises(CorruptedStorage) as cm:
+            self.backend.load()
+
+        self.assertEqual(
+            "Unknown codec: foo: " + self.path, cm.exception.message
+        )
+
+    @unittest.skipIf(not OrjsonCodec.available, "orjson is not installed")
+    def test_convert_codec(self):
+        Registry._obj = {}
+        self.addCleanup(setattr, Registry, "_obj", {})
+        self.backend.persist(dict(a=1), dict())
+        Registry.from_file(self.path)
+        Registry.convert(self.path, "gzip", "orjson")
+
+        Registry.set("b", 2)
+        Registry.persist(self.path)
+        with gzip.open(self.path) as fp:
+            self.assertEqual(b"#codec:orjson\n", fp.readline())
+
+        backend = detect_backend(self.path)
+        self.assertEqual(dict(a=1, b=2), backend.load())
+        self.assertIs(codecs["orjson"], backend.codec)
+
+        Registry.convert(self.path, "json")
+        backend = detect_backend(self.path)
+        backend.load()
+        self.assertIs(codecs["orjson"], backend.codec)
+        Registry.convert(self.path, "json", "json")
+        with open(self.path) as fp:
+            self.assertEqual(dict(a=1, b=2), json.load(fp))
+
+    def test_storage_files(self):
+        self.assertEqual([], storage_files(self.path))
+
+        self.backend.persist(dict(version=1), dict())
+        self.backend.persist(dict(version=2), dict())
+        ChangeLog(self.path).append([Change(1, "a", None, None, "f")])
+        with FileLock(self.path):
+            pass
+
+        self.assertEqual(
+            [
+                self.path,
+                self.path + ".changes",
+                self.path + ".lock",
+                self.path + ".1",
+            ],
+            storage_files(self.path),
+        )
+
+    def test_persist_rotates_snapshots(self):
+        for i in range(0, 5):
+            self.backend.persist(dict(version=i), dict())
+
+        self.assertEqual(dict(version=4), self.backend.load())
+        self.assertEqual(
+            [self.path + ".1", self.path + ".2", self.path + ".3"],
+            self.backend.snapshots(),
+        )
+        self.assertEqual(
+            [dict(version=3), dict(version=2), dict(version=1)],
+            [self.backend.load(path) for path in self.backend.snapshots()],
+        )
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_load_with_corrupted_file(self):
+        self.assertEqual(dict(), self.backend.load())
+
+        self.backend.persist(dict(version=1), dict())
+        self.backend.persist(dict(version=2), dict())
+        with open(self.path, "w") as fp:
+            fp.write('{"version": ')
+
+        with self.assertRaises(CorruptedStorage) as cm:
+            self.backend.load()
+        self.assertEqual(
+            "Storage file is corrupted: " + self.path, str(cm.exception)
+        )
+
+        os.remove(self.path)
+        with self.assertRaises(CorruptedStorage) as cm:
+            self.backend.load()
+        self.assertEqual(
+            "Storage file is missing: " + self.path, str(cm.exception)
+        )
+
+    def test_persist_after_recovery_skips_rotation(self):
+        self.backend.persist(dict(version=1), dict())
+        self.backend.persist(dict(version=2), dict())
+        with open(self.path, "w") as fp:
+            fp.write("garbage")
+
+        self.assertEqual(dict(version=1), self.backend.load(self.path + ".1"))
+        self.backend.persist(dict(version=3), dict())
+
+        self.assertEqual(dict(version=3), self.backend.load())
+        self.assertEqual(dict(version=1), self.backend.load(self.path + ".1"))
+
+
+class GzipBackendTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        self.backend = GzipBackend(self.path)
+        Registry._obj = {}
+
+    def tearDown(self):
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    def test_persist(self):
+        data = dict(track={str(i): dict(id=str(i)) for i in range(100)})
+        self.backend.persist(data, dict(track=None))
+
+        with gzip.open(self.path, "rt") as fp:
+            self.assertEqual(data, json.load(fp))
+        self.assertEqual(data, self.backend.load())
+        self.assertIs(GzipBackend, type(detect_backend(self.path)))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+        self.backend.persist(dict(version=1), dict(version=None))
+        self.assertEqual(data, self.backend.load(self.path + ".1"))
+
+    def test_load_corrupted(self):
+        self.backend.persist(dict(version=1), dict(version=None))
+        with open(self.path, "rb") as fp:
+            content = fp.read()
+
+        for corrupted in (content[:-4], content[:2] + b"foo"):
+            with open(self.path, "wb") as fp:
+                fp.write(corrupted)
+
+            with self.assertRaises(CorruptedStorage):
+                self.backend.load()
+
+    def test_convert(self):
+        JsonBackend(self.path).persist(dict(a=1), dict(a=None))
+        Registry.from_file(self.path)
+        Registry.convert(self.path, "gzip")
+        self.assertIsInstance(Registry().backend, GzipBackend)
+
+        Registry.set("b", 2)
+        Registry.persist(self.path)
+        self.assertEqual(dict(a=1, b=2), detect_backend(self.path).load())
+
+        Registry.convert(self.path, "json")
+        self.assertIs(JsonBackend, type(detect_backend(self.path)))
+
+    @unittest.skipIf(ZstdBackend.available, "zstandard is installed")
+    def test_zstd_unavailable(self):
+        with open(self.path, "wb") as fp:
+            fp.write(ZstdBackend.magic)
+
+        backend = detect_backend(self.path)
+        self.assertIs(ZstdBackend, type(backend))
+        with self.assertRaises(CorruptedStorage) as cm:
+            backend.load()
+
+        self.assertEqual(
+            "Install the zstandard package to use the storage: " + self.path,
+            cm.exception.message,
+        )
+
+    @unittest.skipIf(not ZstdBackend.available, "zstandard is not installed")
+    def test_zstd(self):  # pragma: no cover
+        backend = ZstdBackend(self.path)
+        backend.persist(dict(version=1), dict(version=None))
+        self.assertIs(ZstdBackend, type(detect_backend(self.path)))
+        self.assertEqual(dict(version=1), backend.load())
+
+
+class JournalBackendTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        self.backend = JournalBackend(self.path)
+        self.data = dict(version="1", track=dict(a=dict(id="a")))
+        self.backend.persist(self.data, dict())
+
+    def tearDown(self):
+        Registry.clear()
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    def read_journal(self):
+        with open(self.backend.journal) as fp:
+            return [json.loads(line) for line in fp]
+
+    def test_persist_appends_dirty_rows(self):
+        self.assertEqual(self.data, JsonBackend(self.path).load())
+        self.assertEqual(0, os.path.getsize(self.backend.journal))
+
+        self.data["track"]["b"] = dict(id="b")
+        del self.data["track"]["a"]
+        self.data["version"] = "2"
+        self.backend.persist(self.data, dict(track={"a", "b"}, version=None))
+
+        self.assertCountEqual(
+            [
+                ["r", "track", "a"],
+                ["s", "track", "b", dict(id="b")],
+                ["s", "version", "2"],
+            ],
+            self.read_journal(),
+        )
+        self.assertEqual(
+            dict(version="1", track=dict(a=dict(id="a"))),
+            JsonBackend(self.path).load(),
+        )
+        self.assertEqual(self.data, self.backend.load())
+
+    def test_load_ignores_truncated_records(self):
+        with open(self.backend.journal, "w") as fp:
+            fp.write('["s", "track", "b", {"id": "b"}]\n["r", "tra')
+
+        expected = dict(
+            version="1", track=dict(a=dict(id="a"), b=dict(id="b"))
+        )
+        self.assertEqual(expected, self.backend.load())
+
+    @mock.patch.object(JournalBackend, "chunk", new=8)
+    def test_persist_after_torn_record(self):
+        with open(self.backend.journal, "w") as fp:
+            fp.write('["s", "track", "b", {"id": "b"}]\n["r", "tra')
+
+        Registry.from_file(self.path)
+        Registry.set("track", "d", dict(id="d"))
+        Registry.persist(self.path)
+        Registry._obj = {}
+
+        expected = dict(
+            version="1",
+            track=dict(a=dict(id="a"), b=dict(id="b"), d=dict(id="d")),
+        )
+        self.assertEqual(expected, JournalBackend(self.path).load())
+
+        with open(self.backend.journal, "w") as fp:
+            fp.write('["r", "tra')
+        self.backend.truncate()
+        self.assertEqual(0, os.path.getsize(self.backend.journal))
+
+    @mock.patch.object(JournalBackend, "compact_ratio", new=0.1)
+    @mock.patch.object(JournalBackend, "compact_size", new=10)
+    def test_persist_compacts_journal(self):
+        self.data["version"] = "2"
+        self.backend.persist(self.data, dict(version=None))
+
+        self.assertEqual(0, os.path.getsize(self.backend.journal))
+        self.assertEqual(self.data, JsonBackend(self.path).load())
+
+    def test_detect(self):
+        self.assertIs(JournalBackend, type(detect_backend(self.path)))
+        os.remove(self.backend.journal)
+        self.assertIs(JsonBackend, type(detect_backend(self.path)))
+
+    def test_convert(self):
+        Registry.from_file(self.path)
+        Registry.convert(self.path, "journal")
+        self.assertIsInstance(Registry().backend, JournalBackend)
+        self.assertEqual(0, os.path.getsize(self.backend.journal))
+
+        Registry.set("track", "a", "youtube_id", "y")
+        Registry.persist(self.path)
+        self.assertEqual(
+            [["s", "track", "a", dict(id="a", youtube_id="y")]],
+            self.read_journal(),
+        )
+
+        Registry.convert(self.path, "json")
+        self.assertFalse(os.path.exists(self.backend.journal))
+
+
+class SqliteBackendTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        self.backend = SqliteBackend(self.path)
+        self.backend.persist(
+            dict(version="1", track=dict(a=dict(id="a"), b=dict(id="b"))),
+            dict(version=None, track=None),
+        )
+
+    def tearDown(self):
+        self.backend.close()
+        Registry.clear()
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    def test_load(self):
+        data = self.backend.load()
+
+        self.assertEqual("1", data["version"])
+        self.assertIsInstance(data["track"], Namespace)
+        self.assertEqual(0, dict.__len__(data["track"]))
+
+        self.assertEqual(dict(id="a"), data["track"]["a"])
+        self.assertEqual(1, dict.__len__(data["track"]))
+        self.assertNotIn("c", data["track"])
+
+        self.assertEqual(["a", "b"], sorted(data["track"].keys()))
+
+    def test_persist_writes_only_dirty_rows(self):
+        data = self.backend.load()
+        data["track"]["c"] = dict(id="c")
+        del data["track"]["a"]
+        data["track"]["b"]["youtube_id"] = "y"
+        data["version"] = "2"
+
+        with mock.patch.object(self.backend, "upsert") as upsert:
+            self.backend.persist(data, dict(track={"c"}))
+            upsert.assert_called_once_with("track", [("c", dict(id="c"))])
+
+        self.backend.persist(data, dict(track={"a", "c"}, version=None))
+        self.backend.close()
+
+        data = self.backend.load()
+        self.assertEqual("2", data["version"])
+        self.assertEqual(dict(id="b"), data["track"]["b"])
+        self.assertEqual(["b", "c"], sorted(data["track"].keys()))
+
+    def test_registry(self):
+        self.backend.close()
+        Registry.from_file(self.path)
+        self.assertIsInstance(Registry().backend, SqliteBackend)
+
+        Registry.set("track", "a", "youtube_id", "y")
+        Registry.remove("track", "b")
+        Registry.set("playlist", "p", dict(id="p"))
+        self.assertEqual(
+            dict(track={"a", "b"}, playlist={"p"}), Registry().dirty
+        )
+
+        Registry.persist(self.path)
+        self.assertEqual(dict(), Registry().dirty)
+        Registry().backend.close()
+        Registry._obj = {}
+
+        Registry.from_file(self.path)
+        self.assertEqual(
+            dict(id="a", youtube_id="y"), Registry.get("track", "a")
+        )
+        self.assertFalse(Registry.exists("track", "b"))
+        self.assertEqual(dict(p=dict(id="p")), Registry.get("playlist"))
+        Registry().backend.close()
+
+    def test_threads(self):
+        self.backend.close()
+        Registry.from_file(self.path)
+        results = []
+
+        def read():
+            results.append(Registry.get("track", "a"))
+
+        worker = threading.Thread(target=read)
+        worker.start()
+        worker.join()
+        self.assertEqual([dict(id="a")], results)
+
+        Registry.set("track", "b", "youtube_id", "y")
+        checkpointer = Checkpointer(self.path)
+        worker = threading.Thread(target=checkpointer.checkpoint)
+        worker.start()
+        worker.join()
+        self.assertIsNone(checkpointer.error)
+        Registry().backend.close()
+
+        data = self.backend.load()
+        self.assertEqual(dict(id="b", youtube_id="y"), data["track"]["b"])
+
+    def test_convert(self):
+        self.backend.close()
+        Registry.from_file(self.path)
+        Registry.convert(self.path, "json")
+        self.assertIsInstance(detect_backend(self.path), JsonBackend)
+
+        with open(self.path) as fp:
+            self.assertEqual(
+                dict(version="1", track=dict(a=dict(id="a"), b=dict(id="b"))),
+                json.load(fp),
             )
 
-        self.assertEqual("first", callme(10, "first"))
-        self.assertEqual(("first", 20.0), Registry.get("foo"))
+        Registry.convert(self.path, "sqlite")
+        self.assertIsInstance(Registry().backend, SqliteBackend)
+        self.assertIsInstance(detect_backend(self.path), SqliteBackend)
+        Registry().backend.close()
+
+
+class FileLockTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        Registry._obj = {}
+
+    def tearDown(self):
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    def test_generation(self):
+        with FileLock(self.path) as lock:
+            self.assertEqual(0, lock.generation())
+
+        with FileLock(self.path, exclusive=True) as lock:
+            self.assertEqual(1, lock.advance())
+            self.assertEqual(2, lock.advance())
+
+        with FileLock(self.path) as lock:
+            self.assertEqual(2, lock.generation())
+
+        with FileLock(os.path.join(self.tmp, "missing", "foo")) as lock:
+            self.assertEqual(0, lock.generation())
+            self.assertEqual(1, lock.advance())
+
+    @unittest.skipIf(fcntl is None, "fcntl is not available")
+    def test_persist_holds_exclusive_lock(self):
+        Registry.from_file(self.path)
+        Registry.set("a", 1)
+
+        def persist(*args):
+            with open(self.path + ".lock") as fp:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(fp.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+
+        with mock.patch.object(JsonBackend, "persist", side_effect=persist):
+            Registry.persist(self.path)
+
+    def concurrent_write(self, backend):
+        with FileLock(self.path, exclusive=True) as lock:
+            data = backend.load()
+            data["track"]["b"] = dict(id="b")
+            data["quota"] = 10
+            backend.persist(data, dict(track={"b"}, quota=None))
+            lock.advance()
+
+    def assert_merged(self, backend_class):
+        backend = backend_class(self.path)
+        backend.persist(dict(track=dict(a=dict(id="a"))), dict(track=None))
+        backend.close()
+
+        Registry.from_file(self.path)
+        self.assertEqual(0, Registry().revision)
+        self.concurrent_write(backend_class(self.path))
+
+        Registry.set("track", "a", "youtube_id", "y")
+        Registry.set("track", "c", dict(id="c"))
+        Registry.persist(self.path)
+        self.assertEqual(2, Registry().revision)
+
+        expected = dict(
+            track=dict(
+                a=dict(id="a", youtube_id="y"), b=dict(id="b"), c=dict(id="c")
+            ),
+            quota=10,
+        )
+        self.assertEqual(expected, Registry())
+        self.assertEqual(expected, backend_class(self.path).load())
+
+    def test_persist_merges_concurrent_writes(self):
+        self.assert_merged(JsonBackend)
+
+    def test_persist_merges_concurrent_journal_writes(self):
+        self.assert_merged(JournalBackend)
+
+    def test_persist_merges_concurrent_sqlite_writes(self):
+        self.assert_merged(SqliteBackend)
+        Registry().backend.close()
+
+    def load(self):
+        """Load the registry as a separate process would."""
+        Registry._obj = {}
+        Registry.from_file(self.path)
+        return Registry._obj
+
+    def test_persist_adds_concurrent_increments(self):
+        processes = [self.load(), self.load()]
+        for process in processes * 2:
+            Registry._obj = process
+            with Registry.lock("quota"):
+                if not Registry.exists("quota", "d"):
+                    Registry.set("quota", {"d": 0})
+                Registry.incr("quota", "d", 100)
+            Registry.persist(self.path)
+
+        self.assertEqual(400, Registry.get("quota", "d"))
+        self.assertEqual(dict(d=400), JsonBackend(self.path).load()["quota"])
+
+    def test_persist_merges_concurrent_row_fields(self):
+        first, second = self.load(), self.load()
+        Registry._obj = first
+        Registry.set("track", "a", dict(id="a", youtube_id="y", plays=1))
+        Registry.persist(self.path)
+
+        Registry._obj = second
+        Registry.set("track", "a", dict(id="a", youtube_id=None, plays=2))
+        Registry.persist(self.path)
+
+        expected = dict(id="a", youtube_id="y", plays=2)
+        self.assertEqual(expected, Registry.get("track", "a"))
+
+        Registry._obj = first
+        Registry.set("track", "a", "youtube_id", None)
+        Registry.persist(self.path)
+        self.assertEqual(
+            dict(id="a", youtube_id=None, plays=2), Registry.get("track", "a")
+        )
+
+    def test_persist_rolled_back_increments(self):
+        first, second = self.load(), self.load()
+        Registry._obj = first
+        Registry.incr("quota", "d", 5)
+        Registry.persist(self.path)
+
+        Registry._obj = second
+        Registry.incr("quota", "d", 1)
+        with self.assertRaises(ValueError):
+            with Registry.transaction():
+                Registry.incr("quota", "d", 10)
+                raise ValueError
+
+        Registry.persist(self.path)
+        self.assertEqual(6, Registry.get("quota", "d"))
+
+
+class CheckpointerTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        Registry._obj = {}
+        Registry.from_file(self.path)
+        self.checkpointer = Checkpointer(self.path, interval=60, mutations=3)
+        self.checkpointer.poll = 0.01
+
+    def tearDown(self):
+        self.checkpointer.stop()
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    def stored(self):
+        return JsonBackend(self.path).load()
+
+    def test_checkpoint_on_mutations(self):
+        self.checkpointer.start()
+        Registry.set("a", 1)
+        Registry.set("b", 2)
+        self.checkpointer.stopped.wait(0.1)
+        self.assertEqual(dict(), self.stored())
+
+        Registry.set("c", 3)
+        for _ in range(100):
+            if Registry().revision:
+                break
+            self.checkpointer.stopped.wait(0.01)
+
+        self.assertEqual(dict(a=1, b=2, c=3), self.stored())
+        self.assertEqual(dict(), Registry().dirty)
+
+    def test_checkpoint_on_interval(self):
+        self.checkpointer.interval = 0.02
+        Registry.set("a", 1)
+
+        with mock.patch.object(Registry, "persist") as persist:
+            self.checkpointer.start()
+            self.checkpointer.stopped.wait(0.1)
+            self.checkpointer.stop()
+
+        persist.assert_called_with(self.path, self.checkpointer.stopped)
+
+    def test_checkpoint_keeps_error(self):
+        error = OSError("disk full")
+        with mock.patch.object(Registry, "persist", side_effect=error):
+            self.checkpointer.checkpoint()
+
+        self.assertIs(error, self.checkpointer.error)
+
+    def test_stop_restores_signal_handlers(self):
+        previous = signal.getsignal(signal.SIGTERM)
+        self.checkpointer.start()
+        self.assertEqual(
+            self.checkpointer.interrupt, signal.getsignal(signal.SIGTERM)
+        )
+        self.assertEqual(
+            self.checkpointer.interrupt, signal.getsignal(signal.SIGINT)
+        )
+
+        self.checkpointer.stop()
+        self.assertEqual(previous, signal.getsignal(signal.SIGTERM))
+        self.assertIsNone(self.checkpointer.thread)
+
+    def test_interrupt(self):
+        Registry.set("a", 1)
+        self.checkpointer.start()
+
+        with self.assertRaises(KeyboardInterrupt):
+            os.kill(os.getpid(), signal.SIGINT)
+            self.checkpointer.stopped.wait(1)
+
+        self.assertTrue(self.checkpointer.stopped.is_set())
+        self.assertEqual(dict(), self.stored())
+
+    def test_interrupt_with_default_handler(self):
+        Registry.set("a", 1)
+        self.checkpointer.handlers[signal.SIGTERM] = signal.SIG_DFL
+
+        with self.assertRaises(SystemExit) as cm:
+            with Registry.transaction():
+                Registry.set("b", 2)
+                self.checkpointer.interrupt(signal.SIGTERM, None)
+
+        self.assertEqual(128 + signal.SIGTERM, cm.exception.code)
+        self.assertEqual(dict(), self.stored())
+        Registry.persist(self.path)
+        self.assertEqual(dict(a=1), self.stored())
+
+    def test_interrupt_ignored(self):
+        self.checkpointer.handlers[signal.SIGTERM] = signal.SIG_IGN
+        self.assertIsNone(self.checkpointer.interrupt(signal.SIGTERM, None))
+        self.assertFalse(self.checkpointer.stopped.is_set())
+
+    def test_interrupt_while_persisting(self):
+        self.checkpointer.handlers[signal.SIGTERM] = signal.SIG_DFL
+        Registry.set("a", 1)
+        errors = []
+
+        def interrupt(*args):
+            self.checkpointer.interrupt(signal.SIGTERM, None)
+
+        def command():
+            with mock.patch.object(JsonBackend, "persist", new=interrupt):
+                try:
+                    Registry.persist(self.path)
+                except SystemExit as e:
+                    errors.append(e)
+            Registry.persist(self.path)
 
-        self.assertEqual("second", callme(1, "second"))
-        self.assertEqual(("second", 21.1), Registry.get("foo"))
+        worker = threading.Thread(target=command, daemon=True)
+        worker.start()
+        worker.join(3)
 
-        self.assertEqual("second", callme(1, "third"))
-        self.assertEqual(("second", 21.1), Registry.get("foo"))
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(1, len(errors))
+        self.assertEqual(dict(a=1), self.stored())
 
-        self.assertEqual("third", callme(100, "third", refresh=True))
-        self.assertEqual(("third", 120.8), Registry.get("foo"))
+    def test_locked_cancel(self):
+        cancel = threading.Event()
+        cancel.set()
+        lock = Registry.lock("a")
+        worker = threading.Thread(target=lock.acquire)
+        worker.start()
+        worker.join()
 
-        self.assertEqual(5, time.call_count)
+        with self.assertRaises(InterruptedError):
+            with Registry.locked(cancel):
+                pass
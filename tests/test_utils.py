@@ -1,7 +1,12 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase, mock
 from unittest.mock import PropertyMock
 
-from pytuber.utils import date, spinner
+from pytuber.exceptions import CorruptedStorage
+from pytuber.storage import GzipBackend, JsonBackend, Registry
+from pytuber.utils import date, init_registry, spinner
 
 
 class UtilsTests(TestCase):
@@ -29,3 +34,77 @@ class UtilsTests(TestCase):
         yaspin.return_value.start.assert_called_once_with()
         yaspin.return_value.stop.assert_called_once_with()
         secho.assert_called_once_with("Fatal")
+
+
+class InitRegistryTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "storage.db")
+        Registry._obj = {}
+
+    def tearDown(self):
+        Registry._obj = {}
+        shutil.rmtree(self.tmp)
+
+    @mock.patch("click.secho")
+    def test_recovers_newest_valid_snapshot(self, secho):
+        backend = JsonBackend(self.path)
+        backend.persist(dict(version="1", track=dict(a=1)), dict())
+        backend.persist(dict(version="2", track=dict(a=2)), dict())
+        backend.persist(dict(version="3", track=dict(a=3)), dict())
+        for path in (self.path, self.path + ".1"):
+            with open(path, "w") as fp:
+                fp.write('{"track": {"a": ')
+
+        init_registry(self.path, "4")
+
+        self.assertEqual("4", Registry.get("version"))
+        self.assertEqual(dict(a=1), Registry.get("track"))
+        secho.assert_has_calls(
+            [
+                mock.call("Storage file is corrupted: " + self.path, fg="red"),
+                mock.call(
+                    "Recovered storage from snapshot: " + self.path + ".2"
+                ),
+            ]
+        )
+
+    @mock.patch("click.secho")
+    def test_recovers_snapshot_of_another_backend(self, secho):
+        backend = GzipBackend(self.path)
+        backend.persist(dict(version="1", track=dict(a=1)), dict())
+        backend.persist(dict(version="2", track=dict(a=2)), dict())
+        with open(self.path, "w") as fp:
+            fp.write('{"track": {"a": ')
+
+        init_registry(self.path, "4")
+        self.assertEqual(dict(a=1), Registry.get("track"))
+        self.assertIsInstance(Registry().backend, GzipBackend)
+
+        Registry.persist(self.path)
+        self.assertEqual(dict(a=1), backend.load()["track"])
+
+    @mock.patch("click.secho")
+    def test_raises_without_valid_snapshot(self, secho):
+        with open(self.path, "w") as fp:
+            fp.write("{")
+
+        with self.assertRaises(CorruptedStorage):
+            init_registry(self.path, "4")
+
+    def test_stamps_version_only_when_changed(self):
+        JsonBackend(self.path).persist(dict(version="4"), dict())
+
+        init_registry(self.path, "4")
+        self.assertEqual(dict(), Registry().dirty)
+
+        Registry._obj = {}
+        init_registry(self.path, "5")
+        self.assertEqual(dict(version=None), Registry().dirty)
+
+    @mock.patch("pytuber.utils.migrate")
+    def test_applies_migrations(self, migrate):
+        JsonBackend(self.path).persist(dict(version="4"), dict())
+
+        init_registry(self.path, "5")
+        migrate.assert_called_once_with(self.path, "4")
@@ -5,6 +5,7 @@ from unittest import mock
 
 from click.testing import CliRunner
 
+from pytuber.cache import Cache
 from pytuber.core.models import (
     ConfigManager,
     Playlist,
@@ -30,6 +31,7 @@ class TestCase(unittest.TestCase):
 
     def tearDown(self):
         Registry().clear()
+        Cache.configure(None)
         super(TestCase, self).tearDown()
 
 